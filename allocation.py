@@ -0,0 +1,179 @@
+import itertools
+import math
+
+import numpy as np
+
+# How the stones of a multi-stone order (pairs, parcels) are picked from the matches
+STRATEGIES = ('first', 'lowest_price', 'matched_carat', 'target_carat')
+
+# Candidate lists with at most this many combinations are searched exhaustively
+EXACT_MAX_SETS = 20_000
+
+# Steps of the search over the price/carat trade-off in target_carat()
+TARGET_SEARCH_STEPS = 32
+
+
+def _smallest(scores, count):
+    """Positions of the count smallest scores, in no particular order; O(n)."""
+    if count >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(scores, count - 1)[:count]
+
+
+def lowest_price(carats, prices, count):
+    """The count cheapest stones."""
+    chosen = _smallest(prices, count)
+    return chosen[np.argsort(prices[chosen], kind='stable')]
+
+
+def matched_carat(carats, prices, count):
+    """
+    The count stones whose carats lie closest together, cheapest first among equally tight sets.
+    After one sort by carat every candidate set is a window of consecutive stones.
+    """
+    order = np.lexsort((prices, carats))
+    sorted_carats = carats[order]
+    spreads = sorted_carats[count - 1:] - sorted_carats[:len(carats) - count + 1]
+    tightest = np.flatnonzero(spreads <= spreads.min() + 1e-9)
+
+    # Window price sums from one cumulative sum
+    totals = np.concatenate(([0.0], np.cumsum(prices[order])))
+    window_prices = totals[tightest + count] - totals[tightest]
+    start = tightest[np.argmin(window_prices)]
+    return order[start:start + count]
+
+
+def _exhaustive(carats, prices, count, low, high):
+    """Cheapest set in range by trying every combination; only for small candidate lists."""
+    sets = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(len(carats)), count)),
+                       dtype=np.int64).reshape(-1, count)
+    totals = carats[sets].sum(axis=1)
+    feasible = np.flatnonzero((totals >= low - 1e-9) & (totals <= high + 1e-9))
+    if len(feasible) == 0:
+        return None
+    return sets[feasible[np.argmin(prices[sets[feasible]].sum(axis=1))]]
+
+
+def _repair(carats, prices, chosen, low, high, rounds):
+    """
+    Exchange chosen stones for unchosen ones until the total carat is in [low, high]:
+    the cheapest single exchange that lands in range, else the one that gets closest.
+    Returns None if the range is not reached within rounds exchanges.
+    """
+    chosen = chosen.copy()
+    # One sort by carat; chosen stones are hidden from the search by an infinite price
+    order = np.argsort(carats, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    sorted_carats = carats[order]
+    open_prices = prices[order].copy()
+    open_prices[rank[chosen]] = np.inf
+
+    for _ in range(rounds):
+        total = carats[chosen].sum()
+        best, best_cost = None, np.inf
+        closest, closest_gap = None, np.inf
+        for slot, stone in enumerate(chosen):
+            # The replacement must change the total by between low - total and high - total
+            first = np.searchsorted(sorted_carats, carats[stone] + (low - total) - 1e-9, side='left')
+            last = np.searchsorted(sorted_carats, carats[stone] + (high - total) + 1e-9, side='right')
+            if first < last:
+                cheapest = first + np.argmin(open_prices[first:last])
+                cost = open_prices[cheapest] - prices[stone]
+                if cost < best_cost:
+                    best, best_cost = (slot, cheapest), cost
+            elif best is None:
+                # Nearest replacement below or above the range
+                for nearest in (first - 1, last):
+                    if 0 <= nearest < len(order) and np.isfinite(open_prices[nearest]):
+                        new_total = total - carats[stone] + sorted_carats[nearest]
+                        gap = max(low - new_total, new_total - high)
+                        if gap < closest_gap:
+                            closest, closest_gap = (slot, nearest), gap
+
+        exchange = best if best is not None else closest
+        if exchange is None:
+            return None
+        slot, replacement = exchange
+        open_prices[rank[chosen[slot]]] = prices[chosen[slot]]
+        open_prices[replacement] = np.inf
+        chosen[slot] = order[replacement]
+        if best is not None:
+            return chosen
+    return None
+
+
+def target_carat(carats, prices, count, target, tolerance=0.0):
+    """
+    count stones totalling target carats within tolerance, at as low a total price as the
+    heuristic finds, or None when no such set is found.
+
+    This is a cardinality-constrained knapsack, solved through its Lagrangian relaxation:
+    the count stones with the smallest price - weight * carat are picked, and the weight is
+    bisected until the total carat falls in range (O(n) per step). If the bisection jumps
+    over the range, the closest set on either side is repaired by exchanging stones.
+    Small candidate lists are solved exactly instead.
+    """
+    low, high = target - tolerance, target + tolerance
+    if carats[_smallest(carats, count)].sum() > high + 1e-9 or carats[_smallest(-carats, count)].sum() < low - 1e-9:
+        return None
+    if math.comb(len(carats), count) <= EXACT_MAX_SETS:
+        best = _exhaustive(carats, prices, count, low, high)
+        return None if best is None else best[np.argsort(carats[best], kind='stable')]
+
+    chosen = lowest_price(carats, prices, count)
+    total = carats[chosen].sum()
+    if low - 1e-9 <= total <= high + 1e-9:
+        return chosen
+
+    # Weighting carat against price: angle 0 is the cheapest set, pi/2 the heaviest
+    # (or lightest) one, with both terms brought to the same scale
+    direction = 1.0 if total < low else -1.0
+    scale = (np.ptp(prices) or 1.0) / (np.ptp(carats) or 1.0)
+    short, over = chosen, None
+    low_angle, high_angle = 0.0, np.pi / 2
+    best = None
+    for _ in range(TARGET_SEARCH_STEPS):
+        angle = (low_angle + high_angle) / 2
+        chosen = _smallest(np.cos(angle) * prices - direction * np.sin(angle) * scale * carats, count)
+        total = carats[chosen].sum()
+        if low - 1e-9 <= total <= high + 1e-9:
+            if best is None or prices[chosen].sum() < prices[best].sum():
+                best = chosen
+            # Lean back towards price while staying in range
+            high_angle = angle
+        elif (total < low) == (direction > 0):
+            short, low_angle = chosen, angle
+        else:
+            over, high_angle = chosen, angle
+
+    if best is None:
+        repairs = [_repair(carats, prices, candidate, low, high, count) for candidate in (short, over) if candidate is not None]
+        repairs = [repair for repair in repairs if repair is not None]
+        if not repairs:
+            return None
+        best = min(repairs, key=lambda repair: prices[repair].sum())
+    return best[np.argsort(carats[best], kind='stable')]
+
+
+def allocate(carats, prices, count, strategy='first', target=None, tolerance=0.0):
+    """
+    Pick count stones from the candidates described by carats and prices.
+    Returns their positions in the candidate arrays, or None when the strategy finds no set.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy {strategy!r}")
+    carats = np.asarray(carats, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if count <= 0 or count > len(carats):
+        return None
+
+    if strategy == 'first':
+        return np.arange(count)
+    if strategy == 'lowest_price':
+        return lowest_price(carats, prices, count)
+    if strategy == 'matched_carat':
+        return matched_carat(carats, prices, count)
+    if target is None:
+        raise ValueError("target_carat allocation needs a target total carat")
+    return target_carat(carats, prices, count, target, tolerance)
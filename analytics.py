@@ -1,25 +1,35 @@
-import pandas as pd
+import os
 import matplotlib.pyplot as plt
 from tkinter import Tk, Label, Button, StringVar, OptionMenu
+from analytics_cube import AnalyticsCube
+from order_service import OrderService
+from streaming import memory_limit_from_env
 
 # Load the diamonds data
 diamonds_file = 'diamonds.csv'
-diamonds_df = pd.read_csv(diamonds_file)
 
-# Perform analytics: Group by shape (cut) and carat
-analytics_df = diamonds_df.groupby(['cut', 'carat_weight']).size().reset_index(name='stone_count')
+# Perform analytics: the cube keeps counts per shape (cut) and carat up to date between runs,
+# streaming the catalog in chunks when DIAMONDS_MEMORY_LIMIT is set
+cube = AnalyticsCube(diamonds_file, memory_limit=memory_limit_from_env())
+if os.path.exists('orders.db'):
+    # Leave out stones sold since the last run
+    order_service = OrderService()
+    cube.update(order_service)
+    order_service.close()
+else:
+    cube.update()
 
 
 # Function to plot the graph for the selected shape
 def plot_shape_graph(shape):
-    # Filter data for the selected shape
-    shape_data = analytics_df[analytics_df['cut'] == shape]
+    # Look up the carat breakdown for the selected shape
+    shape_data = cube.breakdown('carat_bucket', cut=shape)
 
     # Plot the data
     plt.figure(figsize=(10, 6))
     plt.bar(
-        shape_data['carat_weight'],
-        shape_data['stone_count'],
+        shape_data['carat_bucket'],
+        shape_data['count'],
         color='skyblue',  # Customizable color
         alpha=0.7
     )
@@ -46,7 +56,7 @@ root = Tk()
 root.title("Select Diamond Shape")
 
 # Dropdown setup
-shapes = analytics_df['cut'].unique()
+shapes = cube.values('cut')
 shape_var = StringVar(root)
 shape_var.set(shapes[0])  # Default value
 
@@ -0,0 +1,406 @@
+import bisect
+import itertools
+import json
+import os
+
+import metrics
+import numpy as np
+import pandas as pd
+from catalog import current_prices_path, load_catalog
+from streaming import iter_chunks
+
+DIMENSIONS = ['cut', 'carat_bucket', 'clarity', 'color', 'lab']
+
+# Stones are bucketed to the hundredth of a carat, the resolution of carat_weight in the catalog
+CARAT_BUCKET_WIDTH = 0.01
+
+_SOURCE_COLUMNS = ['stock_id', 'cut', 'carat_weight', 'clarity', 'color', 'lab', 'total_sales_price']
+_MEASURES = ['count', 'total_carat', 'price_sum', 'min_price', 'max_price']
+
+# Lowest and highest prices kept per base cell, so most sales move its extremes without the catalog
+SKETCH_SIZE = 8
+
+
+def _stones(frame):
+    """Dimension key, carat and price of every stone in a slice of the catalog."""
+    return pd.DataFrame({
+        'cut': frame['cut'].astype(str),
+        'carat_bucket': (np.round(frame['carat_weight'].astype('float64') / CARAT_BUCKET_WIDTH) * CARAT_BUCKET_WIDTH).round(2),
+        'clarity': frame['clarity'].astype(str),
+        'color': frame['color'].astype(str),
+        'lab': frame['lab'].astype(str),
+        'carat': frame['carat_weight'].astype('float64'),
+        'price': frame['total_sales_price'].astype('float64'),
+    })
+
+
+def _aggregate(frame):
+    """Base cube cells (one per full dimension key) for a slice of the catalog."""
+    return _stones(frame).groupby(DIMENSIONS).agg(
+        count=('price', 'size'), total_carat=('carat', 'sum'), price_sum=('price', 'sum'),
+        min_price=('price', 'min'), max_price=('price', 'max')).reset_index()
+
+
+def _extremes(stones):
+    """[lowest, highest] SKETCH_SIZE prices (each sorted) of the stones in each base cell."""
+    ordered = stones.sort_values('price', kind='stable')
+    lowest = ordered.groupby(DIMENSIONS, sort=False).head(SKETCH_SIZE).groupby(DIMENSIONS, sort=False)['price'].agg(list)
+    highest = ordered.groupby(DIMENSIONS, sort=False).tail(SKETCH_SIZE).groupby(DIMENSIONS, sort=False)['price'].agg(list)
+    return {key: [[float(price) for price in prices], [float(price) for price in highest[key]]]
+            for key, prices in lowest.items()}
+
+
+def _merge_extremes(extremes, more):
+    """Fold the sketches of another slice of the catalog into extremes."""
+    for key, (lowest, highest) in more.items():
+        if key not in extremes:
+            extremes[key] = [lowest, highest]
+            continue
+        kept = extremes[key]
+        kept[0] = sorted(kept[0] + lowest)[:SKETCH_SIZE]
+        kept[1] = sorted(kept[1] + highest)[-SKETCH_SIZE:]
+
+
+def _combine(partials):
+    """Merge base cells aggregated from separate slices of the catalog."""
+    frame = pd.concat(partials, ignore_index=True)
+    return frame.groupby(DIMENSIONS).agg(
+        count=('count', 'sum'), total_carat=('total_carat', 'sum'), price_sum=('price_sum', 'sum'),
+        min_price=('min_price', 'min'), max_price=('max_price', 'max')).reset_index()
+
+
+class AnalyticsCube:
+    """
+    Aggregate cube over (cut, carat bucket, clarity, color, lab) holding stone count, total carat
+    and min/max/mean price for the stones still available.
+    Every one of the 32 roll-ups is kept, so any slice is a dictionary lookup. Sold or added stones
+    update the cells in place; the cube is rebuilt only when diamonds.csv itself changes.
+    Each base cell keeps only its SKETCH_SIZE lowest and highest prices, so the saved state grows
+    with the number of cells, not stones. Selling the cheapest or dearest stone moves the extremes
+    from that sketch; only a cell that loses every kept price on one side is re-read from the
+    catalog. The roll-ups containing a changed cell are then recomputed from their children,
+    finest first.
+    """
+
+    def __init__(self, diamonds_file='diamonds.csv', state_file='analytics_cube.json', memory_limit=None):
+        self.diamonds_file = diamonds_file
+        self.state_file = state_file
+        self.memory_limit = memory_limit
+        self.catalog_version = None
+        self.orders_cursor = 0
+        # Stones taken out with remove(); sold stones come from the order database instead
+        self.removed = set()
+        self.base = {}
+        self.extremes = {}
+        self._build_rollups()
+        self._load_state()
+
+    @staticmethod
+    def _mask(dimensions):
+        return tuple(dimension for dimension in DIMENSIONS if dimension in dimensions)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r') as state_file:
+            state = json.load(state_file)
+        self.orders_cursor = state['orders_cursor']
+        self.removed = set(state['removed'])
+        if 'extremes' not in state:
+            # Saved before cells kept a price sketch; rebuilt on the next update
+            return
+        self.catalog_version = state['catalog_version']
+        self.base = {tuple(cell[:len(DIMENSIONS)]): list(cell[len(DIMENSIONS):]) for cell in state['cells']}
+        self.extremes = {tuple(cell[:len(DIMENSIONS)]): cell[len(DIMENSIONS):] for cell in state['extremes']}
+        self._build_rollups()
+
+    def save_state(self):
+        state = {
+            'catalog_version': self.catalog_version,
+            'orders_cursor': self.orders_cursor,
+            'removed': sorted(self.removed),
+            'cells': [list(key) + values for key, values in self.base.items()],
+            'extremes': [list(key) + sketch for key, sketch in self.extremes.items()],
+        }
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_file)
+
+    @metrics.timed('analytics_update')
+    def update(self, order_service=None):
+        """
+        Rebuild if the catalog changed, then take out stones sold since the last update.
+        Without an order database a rebuild keeps sold stones; the next update with one takes them out.
+        The state is saved only when something changed.
+        """
+        stat = os.stat(self.diamonds_file)
+        version = [stat.st_size, stat.st_mtime_ns]
+        # Price adjustments leave the CSV alone but rewrite the engine's current prices
+        prices_path = current_prices_path(self.diamonds_file)
+        if os.path.exists(prices_path):
+            version.append(os.stat(prices_path).st_mtime_ns)
+        changed = version != self.catalog_version
+        if changed:
+            sold_ids = ()
+            self.orders_cursor = 0
+            if order_service is not None:
+                self.orders_cursor, sold_ids = order_service.sold_since(0)
+            self.rebuild(sold_ids)
+            self.catalog_version = version
+        if order_service is not None:
+            cursor = self.orders_cursor
+            self.orders_cursor, sold_ids = order_service.sold_since(cursor)
+            changed = changed or self.orders_cursor != cursor
+            sold_ids = [stock_id for stock_id in sold_ids if stock_id not in self.removed]
+            if sold_ids:
+                self._apply(self._catalog_rows(sold_ids), -1, order_service)
+        if changed:
+            self.save_state()
+
+    @metrics.timed('analytics_rebuild')
+    def rebuild(self, sold_ids=()):
+        """Recompute the cube from diamonds.csv, leaving out removed and sold stones."""
+        excluded = self.removed.union(sold_ids)
+        if self.memory_limit:
+            partials = []
+            self.extremes = {}
+            for chunk in iter_chunks(self.diamonds_file, self.memory_limit, usecols=_SOURCE_COLUMNS):
+                chunk = chunk[~chunk['stock_id'].isin(excluded)]
+                partials.append(_aggregate(chunk))
+                _merge_extremes(self.extremes, _extremes(_stones(chunk)))
+            cells = _combine(partials) if partials else _aggregate(pd.DataFrame(columns=_SOURCE_COLUMNS))
+        else:
+            catalog = load_catalog(self.diamonds_file)
+            catalog = catalog[~catalog['stock_id'].isin(excluded)]
+            cells = _aggregate(catalog)
+            self.extremes = _extremes(_stones(catalog))
+        self.base = {tuple(row[:len(DIMENSIONS)]): list(row[len(DIMENSIONS):])
+                     for row in cells[DIMENSIONS + _MEASURES].itertuples(index=False, name=None)}
+        self._build_rollups()
+
+    def _catalog_rows(self, stock_ids):
+        """Catalog rows of the given stones, read in chunks when there is a memory limit."""
+        return self._read_catalog(lambda frame: frame['stock_id'].isin(stock_ids))
+
+    def _read_catalog(self, keep):
+        """Catalog rows for which keep(frame) is True, read in chunks when there is a memory limit."""
+        if self.memory_limit:
+            chunks = [chunk[keep(chunk)] for chunk in iter_chunks(self.diamonds_file, self.memory_limit, usecols=_SOURCE_COLUMNS)]
+            return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=_SOURCE_COLUMNS)
+        catalog = load_catalog(self.diamonds_file)
+        return catalog[keep(catalog)]
+
+    def _refill(self, keys, excluded):
+        """Re-read the price sketch of base cells that lost every kept price on one side."""
+        cuts = {key[0] for key in keys}
+        rows = self._read_catalog(lambda frame: frame['cut'].astype(str).isin(cuts) & ~frame['stock_id'].isin(excluded))
+        found = _extremes(_stones(rows))
+        for key in keys:
+            if key in found:
+                self.extremes[key] = found[key]
+
+    def _build_rollups(self):
+        """Derive every roll-up from the base cells, plus the member lists used by breakdown()."""
+        self.cells = {(): {}}
+        self.members = {}
+        frame = pd.DataFrame([list(key) + values for key, values in self.base.items()], columns=DIMENSIONS + _MEASURES)
+        if len(frame):
+            self.cells[()][()] = [int(frame['count'].sum()), float(frame['total_carat'].sum()), float(frame['price_sum'].sum()),
+                                  float(frame['min_price'].min()), float(frame['max_price'].max())]
+        for size in range(1, len(DIMENSIONS) + 1):
+            for mask in itertools.combinations(DIMENSIONS, size):
+                rolled = frame.groupby(list(mask)).agg(
+                    count=('count', 'sum'), total_carat=('total_carat', 'sum'), price_sum=('price_sum', 'sum'),
+                    min_price=('min_price', 'min'), max_price=('max_price', 'max')).reset_index()
+                self.cells[mask] = {tuple(row[:size]): [int(row[size])] + [float(value) for value in row[size + 1:]]
+                                    for row in rolled[list(mask) + _MEASURES].itertuples(index=False, name=None)}
+                for key in self.cells[mask]:
+                    self._add_member(mask, key)
+
+    def _add_member(self, mask, key):
+        for position, dimension in enumerate(mask):
+            parent = key[:position] + key[position + 1:]
+            self.members.setdefault((mask, dimension), {}).setdefault(parent, set()).add(key[position])
+
+    def _discard_member(self, mask, key):
+        for position, dimension in enumerate(mask):
+            parent = key[:position] + key[position + 1:]
+            self.members.get((mask, dimension), {}).get(parent, set()).discard(key[position])
+
+    def add(self, rows):
+        """Add stones (catalog rows) to every cell they fall in."""
+        self._apply(rows, 1)
+        self.removed.difference_update(int(stock_id) for stock_id in rows['stock_id'])
+
+    def remove(self, rows):
+        """Take stones (catalog rows), for example sold ones, out of every cell they fall in."""
+        self._apply(rows, -1)
+        self.removed.update(int(stock_id) for stock_id in rows['stock_id'])
+
+    def _apply(self, rows, sign, order_service=None):
+        if len(rows) == 0:
+            return
+        # Batches are small (an order's stones), so they are folded row by row
+        batch = {}
+        for row in _stones(rows).itertuples(index=False, name=None):
+            key, carat, price = row[:len(DIMENSIONS)], row[-2], row[-1]
+            measures = batch.setdefault(key, [0, 0.0, 0.0, price, price])
+            count = self.base[key][0] if key in self.base else 0
+            if sign > 0:
+                _sketch_add(self.extremes.setdefault(key, [[], []]), price, count + measures[0])
+            else:
+                _sketch_remove(self.extremes.get(key, [[], []]), price)
+            measures[0] += 1
+            measures[1] += carat
+            measures[2] += price
+            measures[3] = min(measures[3], price)
+            measures[4] = max(measures[4], price)
+
+        if sign < 0:
+            emptied = [key for key, measures in batch.items()
+                       if key in self.base and self.base[key][0] <= measures[0]]
+            for key in emptied:
+                self.extremes.pop(key, None)
+            exhausted = [key for key in batch if key not in emptied and not all(self.extremes.get(key, [[], []]))]
+            if exhausted:
+                excluded = self.removed.union(int(stock_id) for stock_id in rows['stock_id'])
+                if order_service is not None:
+                    excluded.update(order_service.sold_since(0)[1])
+                self._refill(exhausted, excluded)
+
+        changed = []
+        for key, measures in batch.items():
+            if sign > 0:
+                _add_to_cell(self.base, key, measures)
+            else:
+                _subtract_from_cell(self.base, key, measures)
+                changed.append(key)
+            for mask in self.cells:
+                sub_key = tuple(key[DIMENSIONS.index(dimension)] for dimension in mask)
+                if sign > 0:
+                    if _add_to_cell(self.cells[mask], sub_key, measures):
+                        self._add_member(mask, sub_key)
+                    continue
+                _subtract_from_cell(self.cells[mask], sub_key, measures)
+                if sub_key not in self.cells[mask]:
+                    self._discard_member(mask, sub_key)
+        if changed:
+            self._update_extremes(changed)
+
+    def _update_extremes(self, keys):
+        """Reset min/max price of the given base cells from their prices, then of every roll-up holding them."""
+        for key in keys:
+            sketch = self.extremes.get(key)
+            if sketch and all(sketch) and key in self.base:
+                for cell in (self.base[key], self.cells[tuple(DIMENSIONS)][key]):
+                    cell[3], cell[4] = sketch[0][0], sketch[1][-1]
+        # A roll-up's extremes come from its children one dimension finer, already up to date
+        for size in range(len(DIMENSIONS) - 1, -1, -1):
+            for mask in itertools.combinations(DIMENSIONS, size):
+                cells = self.cells[mask]
+                for sub_key in {tuple(key[DIMENSIONS.index(dimension)] for dimension in mask) for key in keys}:
+                    cell = cells.get(sub_key)
+                    if cell is not None:
+                        cell[3], cell[4] = self._child_extremes(mask, sub_key)
+
+    def _child_extremes(self, mask, key):
+        # Split the cell along whichever missing dimension has the fewest values
+        best = None
+        for dimension in DIMENSIONS:
+            if dimension in mask:
+                continue
+            child_mask = self._mask(mask + (dimension,))
+            values = self.members.get((child_mask, dimension), {}).get(key, ())
+            if best is None or len(values) < len(best[2]):
+                best = (child_mask, dimension, values)
+        child_mask, dimension, values = best
+        position = child_mask.index(dimension)
+        children = [self.cells[child_mask][key[:position] + (value,) + key[position:]] for value in values]
+        return min(child[3] for child in children), max(child[4] for child in children)
+
+    @metrics.timed('analytics_query', kind='cell')
+    def cell(self, **filters):
+        """
+        Measures for one slice, e.g. cell(cut='Round', clarity='VS1'), as a dict with
+        count, total_carat, min_price, max_price and mean_price (None when the slice is empty).
+        """
+        mask = self._mask(filters)
+        values = self.cells[mask].get(tuple(filters[dimension] for dimension in mask))
+        if values is None:
+            return None
+        count, total_carat, price_sum, min_price, max_price = values
+        return {'count': count, 'total_carat': total_carat, 'min_price': min_price,
+                'max_price': max_price, 'mean_price': price_sum / count}
+
+    @metrics.timed('analytics_query', kind='breakdown')
+    def breakdown(self, by, **filters):
+        """
+        One row per value of the dimension by within the slice, e.g. breakdown('carat_bucket', cut='Round')
+        for the stone counts behind the analytics chart.
+        """
+        mask = self._mask(list(filters) + [by])
+        position = mask.index(by)
+        parent = tuple(filters[dimension] for dimension in mask if dimension != by)
+        rows = []
+        for value in sorted(self.members.get((mask, by), {}).get(parent, ())):
+            key = parent[:position] + (value,) + parent[position:]
+            count, total_carat, price_sum, min_price, max_price = self.cells[mask][key]
+            rows.append([value, count, total_carat, min_price, max_price, price_sum / count])
+        return pd.DataFrame(rows, columns=[by, 'count', 'total_carat', 'min_price', 'max_price', 'mean_price'])
+
+    def values(self, dimension):
+        """Every value of a dimension that still has stones, in sorted order."""
+        return sorted(key[0] for key in self.cells[(dimension,)])
+
+
+def _sketch_add(sketch, price, count):
+    """
+    Keep price in a cell's sketch if it is among the lowest or highest kept prices.
+    count is the number of stones already in the cell; a side with fewer kept prices than that
+    may be missing stones between its prices and the other side, so it only takes new extremes.
+    """
+    lowest, highest = sketch
+    if (lowest and price <= lowest[-1]) or len(lowest) == count < SKETCH_SIZE:
+        bisect.insort(lowest, price)
+        del lowest[SKETCH_SIZE:]
+    if (highest and price >= highest[0]) or len(highest) == count < SKETCH_SIZE:
+        bisect.insort(highest, price)
+        del highest[:-SKETCH_SIZE]
+
+
+def _sketch_remove(sketch, price):
+    """Drop one kept copy of price from each side of a cell's sketch that holds it."""
+    for prices in sketch:
+        position = bisect.bisect_left(prices, price)
+        if position < len(prices) and prices[position] == price:
+            del prices[position]
+
+
+def _add_to_cell(cells, key, measures):
+    """Fold measures into a cell; returns True when the cell is new."""
+    count, total_carat, price_sum, min_price, max_price = measures
+    cell = cells.get(key)
+    if cell is None:
+        cells[key] = [int(count), float(total_carat), float(price_sum), float(min_price), float(max_price)]
+        return True
+    cell[0] += int(count)
+    cell[1] += float(total_carat)
+    cell[2] += float(price_sum)
+    cell[3] = min(cell[3], float(min_price))
+    cell[4] = max(cell[4], float(max_price))
+    return False
+
+
+def _subtract_from_cell(cells, key, measures):
+    """Take count, carat and price sum out of a cell, dropping it when empty; extremes are reset separately."""
+    count, total_carat, price_sum = measures[:3]
+    cell = cells.get(key)
+    if cell is None:
+        return
+    cell[0] -= int(count)
+    if cell[0] <= 0:
+        del cells[key]
+        return
+    cell[1] -= float(total_carat)
+    cell[2] -= float(price_sum)
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import pandas as pd
+from synthetic_data import write_catalog, write_orders
+
+# A scenario is flagged when its median is this much slower than the baseline...
+REGRESSION_TOLERANCE = 0.25
+# ...and also slower by more than this many seconds, so timer noise on fast scenarios is ignored
+REGRESSION_FLOOR = 0.005
+
+
+class Workspace:
+    """A directory holding a synthetic catalog, its order history and everything the tools write."""
+
+    def __init__(self, directory, rows, orders=None, seed=0):
+        self.directory = os.path.abspath(directory)
+        self.rows = rows
+        self.orders = max(1, rows // 50) if orders is None else orders
+        self.seed = seed
+        self.catalog = os.path.join(self.directory, 'diamonds.csv')
+        self.order_details = os.path.join(self.directory, 'order_details.csv')
+
+    def prepare(self):
+        """Generate the files unless this workspace already holds them for the same settings."""
+        settings = {'rows': self.rows, 'orders': self.orders, 'seed': self.seed}
+        settings_path = os.path.join(self.directory, 'workspace.json')
+        if os.path.exists(settings_path):
+            with open(settings_path, 'r') as settings_file:
+                if json.load(settings_file) == settings:
+                    return
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        write_catalog(self.catalog, self.rows, self.seed)
+        write_orders(self.order_details, self.rows, self.orders, self.seed)
+        # The order database is seeded from sold_stones.csv when first created
+        with open(self.order_details, 'r') as orders, open(self.path('sold_stones.csv'), 'w') as sold:
+            sold.write('stock_id\n')
+            next(orders)
+            for line in orders:
+                sold.write(line.split(',', 1)[0] + '\n')
+        with open(settings_path, 'w') as settings_file:
+            json.dump(settings, settings_file)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def remove(self, name):
+        path = self.path(name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def _selections(workspace, count=16):
+    """GUI selections taken from real stones, so every one of them has matches."""
+    stones = pd.read_csv(workspace.catalog, nrows=1000).sample(count, replace=True, random_state=1)
+    return [(stone.cut, round(stone.carat_weight * 0.8, 2), round(stone.carat_weight * 1.25, 2), stone.clarity,
+             stone.cut_quality, stone.lab) for stone in stones.itertuples()]
+
+
+# Each scenario sets up untimed and returns (run, before): run is timed, before (or None)
+# runs untimed ahead of every repetition
+
+def load_cold(workspace):
+    """Parse the CSV and build the columnar snapshot."""
+    from catalog import load_catalog
+
+    return (lambda: load_catalog(workspace.catalog)), (lambda: workspace.remove('.catalog_cache'))
+
+
+def load_warm(workspace):
+    """Map an existing snapshot."""
+    from catalog import load_catalog
+
+    load_catalog(workspace.catalog)
+    return (lambda: load_catalog(workspace.catalog)), None
+
+
+def filter_diamonds(workspace):
+    """One GUI query with the result cache cleared, materialized as the result frame."""
+    from diamond_gui import DiamondRecommendationSystem
+
+    system = DiamondRecommendationSystem(workspace.catalog)
+    selections = iter(_selections(workspace) * 1000)
+    return (lambda: system.query(*next(selections))), system.engine.cache.clear
+
+
+def place_order(workspace):
+    """Select, allocate, reserve and sell a pair of stones through the order window's worker."""
+    from diamond_gui import DiamondRecommendationSystem
+    from order import DiamondOrderGUI
+    from order_ledger import OrderLedger
+    from order_service import OrderService
+
+    workspace.remove('orders.db')
+    workspace.remove('order_ledger')
+    workspace.remove('sold_stones.idx')
+    # process_order needs the catalog and the order database, not the Tk widgets
+    counter = DiamondOrderGUI.__new__(DiamondOrderGUI)
+    counter.order_system = DiamondRecommendationSystem(workspace.catalog)
+    counter._order_service = OrderService(workspace.path('orders.db'), sold_stones_file=workspace.path('sold_stones.csv'))
+    counter.order_ledger = OrderLedger(workspace.path('order_ledger'))
+    counter.order_index = None
+    counter.sold_stones = None
+    counter._sold_excluded = False
+    selections = iter(_selections(workspace) * 1000)
+    return (lambda: counter.process_order(*next(selections), 'Benchmark', 2, 'lowest_price')), None
+
+
+def restocking(workspace):
+    """Count stock and sales from scratch and build the report."""
+    from smart_restocking import RestockingEngine
+
+    def run():
+        engine = RestockingEngine(workspace.catalog, workspace.order_details, workspace.path('restocking_state.json'))
+        engine.update()
+        return engine.report()
+
+    return run, lambda: workspace.remove('restocking_state.json')
+
+
+def analytics_build(workspace):
+    """Build the analytics cube from the catalog."""
+    from analytics_cube import AnalyticsCube
+
+    def run():
+        AnalyticsCube(workspace.catalog, workspace.path('analytics_cube.json')).update()
+
+    return run, lambda: workspace.remove('analytics_cube.json')
+
+
+def analytics_query(workspace):
+    """The carat breakdown behind the analytics chart, from a built cube."""
+    from analytics_cube import AnalyticsCube
+
+    cube = AnalyticsCube(workspace.catalog, workspace.path('analytics_cube.json'))
+    cube.update()
+    return (lambda: cube.breakdown('carat_bucket', cut='Round')), None
+
+
+def price_adjustment(workspace):
+    """A segment price change recorded as a new price version."""
+    from price_engine import PriceEngine
+
+    workspace.remove('diamonds.prices')
+    engine = PriceEngine(workspace.catalog)
+    return (lambda: engine.adjust(1, 'Benchmark', cut='Round', carat_min=0.5, carat_max=2.0)), None
+
+
+SCENARIOS = {
+    'load_cold': load_cold,
+    'load_warm': load_warm,
+    'filter_diamonds': filter_diamonds,
+    'place_order': place_order,
+    'restocking': restocking,
+    'analytics_build': analytics_build,
+    'analytics_query': analytics_query,
+    'price_adjustment': price_adjustment,
+}
+
+
+def _in_directory(directory, function, *args):
+    # The order window writes its files to the working directory
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        return function(*args)
+    finally:
+        os.chdir(previous)
+
+
+def time_scenario(scenario, workspace, repeat=5):
+    """Return the sorted run times of a scenario in seconds."""
+    run, before = _in_directory(workspace.directory, SCENARIOS[scenario], workspace)
+    times = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        _in_directory(workspace.directory, run)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def run_suite(rows=(10_000,), scenarios=None, repeat=5, workdir='benchmark_data', seed=0):
+    """Time every scenario on synthetic catalogs of each size; returns a JSON-ready dict."""
+    scenarios = list(scenarios or SCENARIOS)
+    results = {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': {},
+    }
+    for size in rows:
+        workspace = Workspace(os.path.join(workdir, f'rows_{size}'), size, seed=seed)
+        workspace.prepare()
+        results['results'][str(size)] = {}
+        for scenario in scenarios:
+            times = time_scenario(scenario, workspace, repeat)
+            results['results'][str(size)][scenario] = {
+                'median': times[len(times) // 2], 'min': times[0], 'max': times[-1]
+            }
+            print(f"{size:>10} rows  {scenario:<18} {times[len(times) // 2] * 1000:10.1f} ms")
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE, floor=None):
+    """
+    Return the scenarios whose median is slower than the baseline by more than tolerance
+    (a fraction) and floor (seconds), as dicts with rows, scenario, baseline, median and ratio.
+    """
+    floor = REGRESSION_FLOOR if floor is None else floor
+    regressions = []
+    for size, scenarios in results['results'].items():
+        for scenario, timing in scenarios.items():
+            reference = baseline.get(size, {}).get(scenario)
+            if reference is None:
+                continue
+            median = timing['median']
+            if median > reference * (1 + tolerance) and median - reference > floor:
+                regressions.append({'rows': int(size), 'scenario': scenario, 'baseline': reference,
+                                    'median': median, 'ratio': median / reference})
+    return regressions
+
+
+def baseline_from(results, baseline=None):
+    """Merge the medians of a run into a baseline of {rows: {scenario: seconds}}."""
+    baseline = {size: dict(scenarios) for size, scenarios in (baseline or {}).items()}
+    for size, scenarios in results['results'].items():
+        baseline.setdefault(size, {}).update({scenario: timing['median'] for scenario, timing in scenarios.items()})
+    return baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the inventory tools on synthetic catalogs.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000], help="catalog sizes, e.g. 10000 1000000")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per scenario; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='benchmark_data', help="where the synthetic files are kept between runs")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--update-baseline', action='store_true', help="store this run's medians as the baseline")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.rows, args.scenarios, args.repeat, args.workdir, args.seed)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        results['regressions'] = compare(results, baseline, args.tolerance)
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline_from(results, baseline), baseline_file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    for regression in results.get('regressions', []):
+        print(f"REGRESSION {regression['rows']} rows {regression['scenario']}: "
+              f"{regression['median'] * 1000:.1f} ms vs {regression['baseline'] * 1000:.1f} ms "
+              f"({regression['ratio']:.2f}x)")
+    return 1 if results.get('regressions') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
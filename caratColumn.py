@@ -1,11 +1,12 @@
 import pandas as pd
+from catalog import load_catalog
 
 # Load the dataset
 FILE_PATH = "diamonds.csv"
 
 try:
     # Read the dataset
-    df = pd.read_csv(FILE_PATH)
+    df = load_catalog(FILE_PATH)
     print(f"Dataset loaded successfully with {len(df)} rows.")
     
     # Check for the 'carat weight' column
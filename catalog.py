@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+
+import metrics
+import numpy as np
+import pandas as pd
+from catalog_domains import snapshot_dir, update_domains_source, write_domains
+
+# Columns stored as categoricals in the snapshot
+CATEGORICAL_COLUMNS = ['cut', 'clarity', 'color', 'polish', 'lab', 'cut_quality']
+
+# Columns stored as int64 in the snapshot; carats stay float64 so sums and ranges keep their decimal values
+INT64_COLUMNS = ['stock_id']
+
+SNAPSHOT_VERSION = 2
+
+
+def _file_hash(file_path, block_size=1 << 20):
+    """Return the SHA-1 hex digest of a file, read in blocks."""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def price_history_dir(file_path):
+    """Return the directory holding the versioned prices of a CSV file (see price_engine.py)."""
+    return os.path.splitext(os.path.abspath(file_path))[0] + '.prices'
+
+
+def current_prices_path(file_path):
+    return os.path.join(price_history_dir(file_path), 'current.npy')
+
+
+def current_prices(file_path, stock_ids):
+    """
+    Return the price engine's current total_sales_price for each of the given stock IDs,
+    with NaN for stones it has no price for, or None when the file has no price history.
+    Prices are kept per stock ID, so they follow the stones when catalog rows move; IDs
+    repeated in stock_ids are ambiguous and get NaN as well.
+    """
+    path = current_prices_path(file_path)
+    if not os.path.exists(path):
+        return None
+    table = np.load(path, mmap_mode='r')
+    stock_ids = np.asarray(stock_ids, dtype=np.int64)
+    known = table['stock_id']
+    if len(known) == len(stock_ids) and np.array_equal(known, stock_ids):
+        return np.array(table['price'])
+    # The table is sorted by stock ID
+    slots = np.searchsorted(known, stock_ids)
+    found = slots < len(known)
+    found[found] = known[slots[found]] == stock_ids[found]
+    repeated = np.bincount(slots[found], minlength=len(known)) > 1
+    found[found] = ~repeated[slots[found]]
+    prices = np.full(len(stock_ids), np.nan)
+    prices[found] = table['price'][slots[found]]
+    return prices
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get('version') != SNAPSHOT_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(directory, meta):
+    # Write to a temporary file first so readers never see a partial meta.json
+    temp_path = os.path.join(directory, f'meta.json.{os.getpid()}.tmp')
+    with open(temp_path, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temp_path, os.path.join(directory, 'meta.json'))
+
+
+def _encode_column(series):
+    """Split a column into a storable array and its snapshot description."""
+    name = series.name
+    if name in INT64_COLUMNS and pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype=np.int64), {'kind': 'numeric'}
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(), {'kind': 'numeric'}
+
+    # Strings (and anything else) are dictionary encoded
+    categorical = pd.Categorical(series)
+    categories = [value.item() if hasattr(value, 'item') else value for value in categorical.categories]
+    kind = 'category' if name in CATEGORICAL_COLUMNS else 'string'
+    return categorical.codes, {'kind': kind, 'categories': categories}
+
+
+def _decode_column(array, column):
+    if column['kind'] == 'numeric':
+        return array
+    categorical = pd.Categorical.from_codes(array, column['categories'])
+    if column['kind'] == 'category':
+        return categorical
+    return np.asarray(categorical, dtype=object)
+
+
+def build_snapshot(file_path, cache_dir=None, source=None):
+    """Parse a CSV file and write its typed columnar snapshot."""
+    with metrics.timer('snapshot_build'):
+        return _build_snapshot(file_path, cache_dir, source)
+
+
+def _build_snapshot(file_path, cache_dir, source):
+    df = pd.read_csv(file_path, low_memory=False)
+    if source is None:
+        stat = os.stat(file_path)
+        source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': _file_hash(file_path)}
+
+    directory = snapshot_dir(file_path, cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    old_meta = _read_meta(directory)
+
+    # Column files carry the source hash so a rebuild never overwrites mapped pages
+    generation = source['sha1'][:12]
+    columns = []
+    for position, name in enumerate(df.columns):
+        array, column = _encode_column(df[name])
+        column['name'] = name
+        column['file'] = f'c{position}.{generation}.npy'
+        np.save(os.path.join(directory, column['file']), array, allow_pickle=False)
+        columns.append(column)
+        metrics.increment('bytes_written', array.nbytes, target='snapshot')
+
+    # Dropdown values for the GUIs, readable without loading the snapshot
+    write_domains(directory, df, source)
+
+    meta = {'version': SNAPSHOT_VERSION, 'source': source, 'rows': len(df), 'columns': columns}
+    _write_meta(directory, meta)
+
+    # Remove column files of the previous generation
+    if old_meta is not None:
+        current = {column['file'] for column in columns}
+        for column in old_meta['columns']:
+            if column['file'] not in current:
+                try:
+                    os.remove(os.path.join(directory, column['file']))
+                except OSError:
+                    pass
+    return meta
+
+
+def _fresh_meta(file_path, cache_dir=None):
+    """Return the snapshot metadata for a CSV file, rebuilding it when stale."""
+    stat = os.stat(file_path)
+    directory = snapshot_dir(file_path, cache_dir)
+    meta = _read_meta(directory)
+
+    if meta is not None:
+        source = meta['source']
+        if source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+            return meta
+        # The file was touched; reuse the snapshot if its content is unchanged
+        if source['size'] == stat.st_size:
+            sha1 = _file_hash(file_path)
+            if sha1 == source['sha1']:
+                meta['source']['mtime_ns'] = stat.st_mtime_ns
+                update_domains_source(directory, meta['source'])
+                _write_meta(directory, meta)
+                return meta
+
+    return build_snapshot(file_path, cache_dir)
+
+
+def load_catalog(file_path='diamonds.csv', mmap=True, cache_dir=None):
+    """
+    Load a CSV file through its columnar snapshot.
+    The snapshot is (re)built only when the CSV content changes. With mmap=True the
+    columns are memory-mapped copy-on-write, so processes share pages until they write.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    with metrics.timer('catalog_load'):
+        df = _load_catalog(file_path, mmap, cache_dir)
+    metrics.increment('rows_loaded', len(df), source='catalog')
+    return df
+
+
+def _load_catalog(file_path, mmap, cache_dir):
+    try:
+        meta = _fresh_meta(file_path, cache_dir)
+    except OSError:
+        # Snapshot directory not writable; fall back to parsing the CSV
+        return _with_current_prices(pd.read_csv(file_path, low_memory=False), file_path)
+
+    directory = snapshot_dir(file_path, cache_dir)
+    # Empty arrays cannot be memory-mapped
+    mmap_mode = 'c' if mmap and meta['rows'] > 0 else None
+    data = {}
+    for column in meta['columns']:
+        array = np.load(os.path.join(directory, column['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        data[column['name']] = _decode_column(array, column)
+    df = pd.DataFrame(data, columns=[column['name'] for column in meta['columns']], copy=False)
+    return _with_current_prices(df, file_path)
+
+
+def _with_current_prices(df, file_path):
+    # Prices changed through the price engine take precedence over the CSV column
+    if 'total_sales_price' in df.columns and pd.api.types.is_integer_dtype(df.get('stock_id')):
+        prices = current_prices(file_path, df['stock_id'])
+        if prices is not None:
+            # Stones the engine has not seen yet keep their CSV price
+            known = ~np.isnan(prices)
+            column = df['total_sales_price'].to_numpy(dtype=np.float64, copy=True)
+            column[known] = prices[known]
+            df['total_sales_price'] = column
+    return df
@@ -0,0 +1,70 @@
+import json
+import os
+
+# Kept free of pandas and NumPy so a GUI can fill its dropdowns before those are imported
+
+CACHE_DIR_NAME = '.catalog_cache'
+
+# Columns whose distinct values are offered in the GUI dropdowns
+DOMAIN_COLUMNS = ['cut', 'clarity', 'color', 'polish', 'lab', 'cut_quality', 'carat', 'carat_weight']
+
+
+def snapshot_dir(file_path, cache_dir=None):
+    """Return the directory holding the snapshot for a CSV file."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, name)
+
+
+def _plain(value):
+    # Floats go through their shortest text form so a float32 0.3 is listed as 0.3
+    if isinstance(value, float) or type(value).__name__.startswith('float'):
+        return float(str(value))
+    return value.item() if hasattr(value, 'item') else value
+
+
+def write_domains(directory, df, source):
+    """Write the column list and sorted distinct values of the dropdown columns next to a snapshot."""
+    domains = {
+        'source': {'size': source['size'], 'mtime_ns': source['mtime_ns']},
+        'rows': len(df),
+        'columns': list(df.columns),
+        'values': {column: [_plain(value) for value in sorted(df[column].dropna().unique())]
+                   for column in DOMAIN_COLUMNS if column in df.columns},
+    }
+    temp_path = os.path.join(directory, f'domains.json.{os.getpid()}.tmp')
+    with open(temp_path, 'w') as domains_file:
+        json.dump(domains, domains_file)
+    os.replace(temp_path, os.path.join(directory, 'domains.json'))
+
+
+def update_domains_source(directory, source):
+    """Record a new mtime for a CSV whose content is unchanged."""
+    path = os.path.join(directory, 'domains.json')
+    try:
+        with open(path, 'r') as domains_file:
+            domains = json.load(domains_file)
+    except (OSError, ValueError):
+        return
+    domains['source'] = {'size': source['size'], 'mtime_ns': source['mtime_ns']}
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as domains_file:
+        json.dump(domains, domains_file)
+    os.replace(temp_path, path)
+
+
+def load_domains(file_path, cache_dir=None):
+    """
+    Return the dropdown domains saved with the CSV's snapshot, or None when there is no
+    snapshot yet or the CSV changed since it was taken. Only a stat() and a small JSON read.
+    """
+    try:
+        stat = os.stat(file_path)
+        with open(os.path.join(snapshot_dir(file_path, cache_dir), 'domains.json'), 'r') as domains_file:
+            domains = json.load(domains_file)
+    except (OSError, ValueError):
+        return None
+    if domains['source'] != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+        return None
+    return domains
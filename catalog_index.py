@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+
+
+def normalize(value):
+    """Normalize a lookup value the same way index keys are normalized."""
+    return str(value).strip().lower()
+
+
+def bitmap_from_positions(positions, size):
+    """Return a packed bitmap with the given row positions set."""
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return np.packbits(mask)
+
+
+def positions_from_bitmap(bitmap, size):
+    """Return the sorted row positions set in a packed bitmap."""
+    return np.flatnonzero(np.unpackbits(bitmap, count=size))
+
+
+def bitmap_test(bitmap, positions):
+    """Return a boolean array telling which positions are set in a packed bitmap."""
+    return ((bitmap[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+
+_BYTE_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def bitmap_count(bitmap):
+    """Return the number of rows set in a packed bitmap."""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bitmap).sum(dtype=np.int64))
+    return int(_BYTE_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+
+class CatalogIndex:
+    """
+    Per-value bitmaps for categorical columns and sorted arrays for numeric columns.
+    Values are normalized (stripped, lower case) once at build time, so a filter
+    is a handful of bitmap intersections and binary searches instead of full scans.
+    """
+
+    def __init__(self, df, columns, range_columns=()):
+        self.size = len(df)
+        self.bitmaps = {}
+        self.counts = {}
+        self.labels = {}
+        self.sorted = {}
+        self.values = {}
+        # Rows still eligible for matches and facets; None until something is excluded
+        self.available = None
+        self.available_count = self.size
+        for column in columns:
+            if column in df.columns:
+                self._build_bitmaps(column, df[column])
+        for column in range_columns:
+            if column in df.columns:
+                self._build_sorted(column, df[column])
+
+    def _build_bitmaps(self, column, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            keys = [normalize(category) for category in series.cat.categories]
+        else:
+            codes, uniques = pd.factorize(series)
+            keys = [normalize(value) for value in uniques]
+
+        # Group row positions by code with one stable sort
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+        labels = series.cat.categories if isinstance(series.dtype, pd.CategoricalDtype) else uniques
+        positions_by_key = {}
+        self.labels[column] = {}
+        for code, key in enumerate(keys):
+            positions = order[boundaries[code]:boundaries[code + 1]]
+            if len(positions):
+                positions_by_key.setdefault(key, []).append(positions)
+                # Facets show the first spelling seen for a normalized value
+                self.labels[column].setdefault(key, labels[code])
+
+        self.bitmaps[column] = {}
+        self.counts[column] = {}
+        for key, parts in positions_by_key.items():
+            positions = np.concatenate(parts)
+            self.bitmaps[column][key] = bitmap_from_positions(positions, self.size)
+            self.counts[column][key] = len(positions)
+
+    def _build_sorted(self, column, series):
+        values = series.to_numpy()
+        order = np.argsort(values, kind='stable')
+        if values.dtype.kind == 'f':
+            # NaNs sort last; leave them out of every range
+            order = order[:len(values) - int(np.isnan(values).sum())]
+        self.sorted[column] = (order, values[order])
+        self.values[column] = values
+
+    def refresh(self, column, series):
+        """Rebuild one column's bitmaps or sorted array after its values changed in place."""
+        if column in self.bitmaps:
+            self._build_bitmaps(column, series)
+        elif column in self.sorted:
+            self._build_sorted(column, series)
+
+    def has_column(self, column):
+        return column in self.bitmaps or column in self.sorted
+
+    def count(self, column, value):
+        """Return the number of rows whose column equals value (or any of a list of values)."""
+        if isinstance(value, (list, tuple, set)):
+            return sum(self.count(column, item) for item in set(map(normalize, value)))
+        return self.counts[column].get(normalize(value), 0)
+
+    def bitmap(self, column, value):
+        """Return the packed bitmap of rows whose column equals value (or any of a list of values), or None."""
+        if isinstance(value, (list, tuple, set)):
+            found = [self.bitmaps[column][key] for key in set(map(normalize, value)) if key in self.bitmaps[column]]
+            if not found:
+                return None
+            return found[0] if len(found) == 1 else np.bitwise_or.reduce(found)
+        return self.bitmaps[column].get(normalize(value))
+
+    def range_bounds(self, column, low=None, high=None):
+        """Return the (start, stop) slice of the sorted column that lies in [low, high]."""
+        order, values = self.sorted[column]
+        if values.dtype.kind == 'f':
+            # Compare in the column's own type so float32 carats match their displayed values
+            low = None if low is None else values.dtype.type(low)
+            high = None if high is None else values.dtype.type(high)
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        stop = len(values) if high is None else np.searchsorted(values, high, side='right')
+        return start, max(start, stop)
+
+    def range_positions(self, column, low=None, high=None):
+        """Return the unsorted row positions whose column lies in [low, high]."""
+        order, values = self.sorted[column]
+        start, stop = self.range_bounds(column, low, high)
+        return order[start:stop]
+
+    def exclude(self, positions):
+        """Leave the given rows out of every later match and facet count (e.g. sold stones)."""
+        if self.available is None:
+            self.available = np.packbits(np.ones(self.size, dtype=bool))
+        # Bitmap subtraction: available AND NOT excluded
+        self.available = np.bitwise_and(self.available, np.invert(bitmap_from_positions(positions, self.size)))
+        self.available_count = bitmap_count(self.available)
+
+    def match(self, equals=None, ranges=None):
+        """
+        Return the sorted row positions matching every equality and range condition.
+        equals maps column -> value or list of values, ranges maps column -> (low, high).
+        """
+        equals = equals or {}
+        ranges = ranges or {}
+
+        bitmaps = []
+        for column, value in equals.items():
+            bitmap = self.bitmap(column, value)
+            if bitmap is None:
+                return np.empty(0, dtype=np.int64)
+            bitmaps.append((self.count(column, value), bitmap))
+        if self.available is not None:
+            bitmaps.append((self.available_count, self.available))
+
+        range_slices = [(column, self.range_bounds(column, *bounds)) for column, bounds in ranges.items()]
+        range_slices.sort(key=lambda item: item[1][1] - item[1][0])
+
+        # Start from whichever condition is most selective
+        bitmaps.sort(key=lambda item: item[0])
+        smallest_bitmap = bitmaps[0][0] if bitmaps else self.size
+        smallest_range = range_slices[0][1][1] - range_slices[0][1][0] if range_slices else self.size
+
+        if range_slices and smallest_range < smallest_bitmap:
+            column, (start, stop) = range_slices.pop(0)
+            positions = np.sort(self.sorted[column][0][start:stop])
+            for _, bitmap in bitmaps:
+                positions = positions[bitmap_test(bitmap, positions)]
+        else:
+            if bitmaps:
+                combined = bitmaps[0][1]
+                for _, bitmap in bitmaps[1:]:
+                    combined = np.bitwise_and(combined, bitmap)
+                positions = positions_from_bitmap(combined, self.size)
+            else:
+                positions = np.arange(self.size)
+
+        # Remaining ranges are checked on the surviving candidates only
+        for column, (start, stop) in range_slices:
+            values = self.sorted[column][1]
+            if start >= stop:
+                return np.empty(0, dtype=np.int64)
+            low, high = values[start], values[stop - 1]
+            column_values = self.values[column][positions]
+            positions = positions[(column_values >= low) & (column_values <= high)]
+        return positions
+
+    def facets(self, equals=None, ranges=None, columns=None, extra=None):
+        """
+        For each facet column, return [(value, count), ...] of the values still reachable
+        when every condition except the ones on that column itself is applied.
+        Counts come from bitmap intersections; extra is an optional bitmap of rows that
+        must also match (e.g. from predicates without an index).
+        """
+        equals = equals or {}
+        ranges = ranges or {}
+        columns = columns if columns is not None else list(self.bitmaps) + list(self.sorted)
+
+        conditions = []
+        for column, value in equals.items():
+            bitmap = self.bitmap(column, value)
+            conditions.append((column, bitmap if bitmap is not None else np.zeros((self.size + 7) // 8, dtype=np.uint8)))
+        for column, bounds in ranges.items():
+            conditions.append((column, bitmap_from_positions(self.range_positions(column, *bounds), self.size)))
+        if extra is not None:
+            conditions.append((None, extra))
+        if self.available is not None:
+            conditions.append((None, self.available))
+
+        facets = {}
+        for facet in columns:
+            others = [bitmap for column, bitmap in conditions if column != facet]
+            combined = None
+            if others:
+                combined = others[0]
+                for bitmap in others[1:]:
+                    combined = np.bitwise_and(combined, bitmap)
+
+            if facet in self.bitmaps:
+                if combined is None:
+                    counts = self.counts[facet].items()
+                else:
+                    counts = [(key, bitmap_count(np.bitwise_and(combined, bitmap))) for key, bitmap in self.bitmaps[facet].items()]
+                facets[facet] = sorted(((self.labels[facet][key], count) for key, count in counts if count),
+                                       key=lambda item: str(item[0]))
+            elif facet in self.sorted:
+                if combined is None:
+                    values = self.sorted[facet][1]
+                else:
+                    values = self.values[facet][positions_from_bitmap(combined, self.size)]
+                    values = np.sort(values[~np.isnan(values)] if values.dtype.kind == 'f' else values)
+                distinct, counts = np.unique(values, return_counts=True)
+                if distinct.dtype == np.float32:
+                    # List float32 carats as they are displayed, e.g. 0.3 rather than 0.30000001
+                    distinct = [float(str(value)) for value in distinct]
+                else:
+                    distinct = distinct.tolist()
+                facets[facet] = list(zip(distinct, counts.tolist()))
+        return facets
+
+
+class StockIdIndex:
+    """
+    Hash index from stock ID to row position.
+    Appended rows go to a small side table and removed rows are marked deleted,
+    so point operations never scan the catalog; rebuild() compacts both.
+    """
+
+    def __init__(self, ids):
+        self.rebuild(ids)
+
+    def rebuild(self, ids):
+        """Rebuild the index from the current column of IDs."""
+        self._base = pd.Index(ids)
+        self._tail = {}
+        self._deleted = set()
+        self.size = len(self._base)
+
+    def positions(self, stock_id):
+        """Return every live row position holding stock_id."""
+        found = []
+        try:
+            location = self._base.get_loc(stock_id)
+        except (KeyError, TypeError):
+            location = None
+        if isinstance(location, (int, np.integer)):
+            found.append(int(location))
+        elif isinstance(location, slice):
+            found.extend(range(*location.indices(len(self._base))))
+        elif location is not None:
+            found.extend(np.flatnonzero(location).tolist())
+        found.extend(self._tail.get(stock_id, []))
+        if self._deleted:
+            found = [position for position in found if position not in self._deleted]
+        return found
+
+    def get(self, stock_id):
+        """Return the row position of stock_id, or None."""
+        found = self.positions(stock_id)
+        return found[0] if found else None
+
+    def contains(self, stock_id):
+        return self.get(stock_id) is not None
+
+    def __contains__(self, stock_id):
+        return self.contains(stock_id)
+
+    def get_many(self, stock_ids):
+        """Return the row position of each ID as an int64 array, -1 where absent."""
+        stock_ids = list(stock_ids)
+        if self._base.is_unique and not self._tail and not self._deleted:
+            return self._base.get_indexer(stock_ids).astype(np.int64)
+        found = [self.get(stock_id) for stock_id in stock_ids]
+        return np.array([-1 if position is None else position for position in found], dtype=np.int64)
+
+    def append(self, stock_id):
+        """Record a row appended at the end of the table and return its position."""
+        position = self.size
+        self._tail.setdefault(stock_id, []).append(position)
+        self.size += 1
+        return position
+
+    def remove(self, stock_id):
+        """Mark every row holding stock_id as deleted and return their positions."""
+        found = self.positions(stock_id)
+        self._deleted.update(found)
+        return found
@@ -1,5 +1,7 @@
-import pandas as pd
 import re  # Regular expression module for validation
+from catalog import load_catalog
+from query_engine import QueryEngine, Eq
+from sales_tracker import SalesTracker
 
 
 class DiamondRecommendationSystem:
@@ -7,9 +9,11 @@ class DiamondRecommendationSystem:
         """
         Initialize the system with the diamonds dataset.
         """
+        self.sales = None
         try:
-            self.df = pd.read_csv(file_path)
+            self.df = load_catalog(file_path)
             print(f"Dataset loaded successfully with {len(self.df)} rows.")
+            self.engine = QueryEngine(self.df)
         except FileNotFoundError:
             print("Error: The file was not found. Please check the file path.")
             self.df = None
@@ -22,31 +26,14 @@ class DiamondRecommendationSystem:
             print("Dataset not loaded. Cannot perform filtering.")
             return None
 
-        filtered_df = self.df.copy()
-
-        # Filter by color
-        if color:
-            if 'color' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['color'].str.lower() == color.lower()]
-            else:
-                print("Error: 'color' column not found in the dataset.")
-                return None
-
-        # Filter by polish
-        if polish:
-            if 'polish' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['polish'].str.lower() == polish.lower()]
-            else:
-                print("Error: 'polish' column not found in the dataset.")
+        # Check that every requested field exists before querying
+        for column, value in (('color', color), ('polish', polish), ('clarity', clarity)):
+            if value and column not in self.df.columns:
+                print(f"Error: '{column}' column not found in the dataset.")
                 return None
 
-        # Filter by clarity
-        if clarity:
-            if 'clarity' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['clarity'].str.lower() == clarity.lower()]
-            else:
-                print("Error: 'clarity' column not found in the dataset.")
-                return None
+        result = self.engine.select([Eq('color', color or None), Eq('polish', polish or None), Eq('clarity', clarity or None)])
+        filtered_df = result.to_frame()
 
         if filtered_df.empty:
             print("No diamonds match the given preferences. Please refine your criteria.")
@@ -83,16 +70,21 @@ class DiamondRecommendationSystem:
         """
         return bool(re.match("^[A-Za-z0-9]+$", clarity))  # Only letters and numbers allowed
 
-    def recommend_top_selling(self, top_n=5):
+    def recommend_top_selling(self, top_n=5, by=None, metric='count'):
         """
-        Recommend the top-selling diamonds based on sales count or popularity.
+        Recommend the best-selling kinds of diamond (by cut, clarity and lab unless given),
+        ranked by stones sold or by revenue in the order history.
         """
-        if 'total_sales_price' in self.df.columns:
-            top_selling_df = self.df.sort_values(by='total_sales_price', ascending=False).head(top_n)
-            print("\n--- Top-Selling Diamonds ---")
-            print(top_selling_df[['color', 'polish', 'clarity', 'total_sales_price']])
+        if self.sales is None:
+            self.sales = SalesTracker()
+        # Only orders placed since the last call are read
+        self.sales.update()
+        top_selling_df = self.sales.top(top_n, by=by, metric=metric)
+        if top_selling_df.empty:
+            print("No sales recorded yet for a top-selling recommendation.")
         else:
-            print("Error: 'total_sales_price' column not found for top-selling recommendation.")
+            print("\n--- Top-Selling Diamonds ---")
+            print(top_selling_df)
 
 FILE_PATH = "diamonds_updated.csv"
 recommendation_system = DiamondRecommendationSystem(FILE_PATH)
@@ -1,39 +1,191 @@
-import pandas as pd
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
+import metrics
+from catalog_domains import load_domains
+from gui_worker import BackgroundExecutor
+from result_grid import ResultGrid
+
+# pandas and the query modules are imported when the catalog loads, not at startup
+
+REQUIRED_COLUMNS = {'cut', 'carat', 'clarity', 'cut_quality', 'lab', 'total_sales_price', 'stock_id'}
+RESULT_COLUMNS = ["stock_id", "cut", "carat", "clarity", "cut_quality", "lab", "total_sales_price"]
+
+# Closest alternatives shown when a search has no exact match
+ALTERNATIVES_SHOWN = 10
+
+# The catalog's carat_weight column is offered as carat
+COLUMN_RENAMES = {'carat_weight': 'carat'}
+
+# Dropdown fields narrowed by the current selections, and the menus that show each
+FACET_MENUS = {
+    'cut': ['cut_menu'],
+    'carat': ['carat_min_menu', 'carat_max_menu'],
+    'clarity': ['clarity_menu'],
+    'cut_quality': ['cut_quality_menu'],
+    'lab': ['lab_menu'],
+}
+
+
+def _selected(variable):
+    # A cleared DoubleVar holds "" and raises on get(); treat it, 0 and blanks as no selection
+    try:
+        value = variable.get()
+    except tk.TclError:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+    return value or None
+
+
+def narrow_dropdowns(recommendation_system, gui):
+    """
+    Limit each dropdown of a recommendation or order window to the values that still have
+    matches given the other selections. Does nothing until the catalog has loaded.
+    """
+    if not recommendation_system.loaded:
+        return
+    facets = recommendation_system.facets(
+        cut=_selected(gui.cut_var), carat_min=_selected(gui.carat_min_var), carat_max=_selected(gui.carat_max_var),
+        clarity=_selected(gui.clarity_var), cut_quality=_selected(gui.cut_quality_var), lab=_selected(gui.lab_var)
+    )
+    for column, menus in FACET_MENUS.items():
+        values = [value for value, _ in facets.get(column, [])]
+        for menu in menus:
+            getattr(gui, menu)['values'] = values
 
 
 class DiamondRecommendationSystem:
-    def __init__(self, file_path):
+    """
+    With background=True the catalog is loaded on a separate thread. Dropdown values and the
+    column list come from the snapshot's domains sidecar meanwhile, so a window can open at once;
+    df, engine and id_index wait for the load to finish.
+    """
+
+    def __init__(self, file_path, background=False):
         self.file_path = file_path
-        self.df = pd.read_csv(file_path, low_memory=False)
-        print("Dataset loaded successfully with", len(self.df), "rows.")
-        if 'carat_weight' in self.df.columns:
-            self.df.rename(columns={'carat_weight': 'carat'}, inplace=True)
+        self.domains = load_domains(file_path)
+        self._loaded = threading.Event()
+        self._load_error = None
+        if background and self.domains is not None:
+            threading.Thread(target=self._load, name="catalog-loader", daemon=True).start()
+        else:
+            self._load()
+            if self._load_error is not None:
+                raise self._load_error
+
+    def _load(self):
+        try:
+            from catalog import load_catalog
+            from catalog_index import StockIdIndex
+            from query_engine import QueryEngine
+
+            df = load_catalog(self.file_path)
+            print("Dataset loaded successfully with", len(df), "rows.")
+            df.rename(columns=COLUMN_RENAMES, inplace=True)
+            self._df = df
+            self._engine = QueryEngine(df)
+            self._id_index = StockIdIndex(df['stock_id']) if 'stock_id' in df.columns else None
+            self._similarity = None
+        except Exception as exc:
+            self._load_error = exc
+        finally:
+            self._loaded.set()
+
+    def _wait(self):
+        self._loaded.wait()
+        if self._load_error is not None:
+            raise self._load_error
+
+    @property
+    def loaded(self):
+        return self._loaded.is_set()
+
+    @property
+    def df(self):
+        self._wait()
+        return self._df
+
+    @property
+    def engine(self):
+        self._wait()
+        return self._engine
+
+    @property
+    def id_index(self):
+        self._wait()
+        return self._id_index
+
+    @property
+    def columns(self):
+        if self.domains is not None:
+            return [COLUMN_RENAMES.get(column, column) for column in self.domains['columns']]
+        return list(self.df.columns)
 
     def get_unique_values(self, column_name):
         """Return unique values for a column."""
+        if self.domains is not None:
+            for column, values in self.domains['values'].items():
+                if COLUMN_RENAMES.get(column, column) == column_name:
+                    return values
+            if column_name not in self.columns:
+                return []
         if column_name in self.df.columns:
             return sorted(self.df[column_name].dropna().unique())
         return []
 
+    def missing_columns(self):
+        """Columns the filters need that the dataset lacks."""
+        return REQUIRED_COLUMNS - set(self.columns)
+
     def filter_diamonds(self, cut, carat_min, carat_max, clarity, cut_quality, lab):
-        required_columns = {'cut', 'carat', 'clarity', 'cut_quality', 'lab', 'total_sales_price', 'stock_id'}
-        if not required_columns.issubset(self.df.columns):
-            missing = required_columns - set(self.df.columns)
+        missing = self.missing_columns()
+        if missing:
             messagebox.showerror("Data Error", f"Missing columns in dataset: {', '.join(missing)}")
             return None
+        return self.query(cut, carat_min, carat_max, clarity, cut_quality, lab)
+
+    @metrics.timed('filter_diamonds')
+    def query(self, cut, carat_min, carat_max, clarity, cut_quality, lab):
+        """filter_diamonds without any dialogs, safe to call from a worker thread."""
+        return self.select(cut, carat_min, carat_max, clarity, cut_quality, lab).to_frame(RESULT_COLUMNS)
+
+    def select(self, cut, carat_min, carat_max, clarity, cut_quality, lab):
+        """Return the matches as a lazy ResultView, for paging through large results."""
+        # Apply filtering logic through the shared query engine
+        return self.engine.select(self._predicates(cut, carat_min, carat_max, clarity, cut_quality, lab))
+
+    def alternatives(self, cut, carat_min, carat_max, clarity, cut_quality, lab, k=ALTERNATIVES_SHOWN):
+        """
+        Return the k stones closest to the selection as a ResultView, closest first.
+        The carat range is aimed at its midpoint.
+        """
+        from query_engine import ResultView
+        from similarity import SimilarityIndex
+
+        df = self.df
+        if self._similarity is None:
+            self._similarity = SimilarityIndex(df)
+        carat = (carat_min + carat_max) / 2 if carat_min and carat_max else carat_min or carat_max or None
+        positions, _ = self._similarity.nearest(
+            k, cut=cut, carat=carat, clarity=clarity, cut_quality=cut_quality, lab=lab)
+        return ResultView(df, positions, self.engine.index)
 
-        # Apply filtering logic
-        filtered = self.df[
-            (self.df['cut'].str.lower() == cut.lower()) &
-            (self.df['carat'] >= carat_min) &
-            (self.df['carat'] <= carat_max) &
-            (self.df['clarity'].str.lower() == clarity.lower()) &
-            (self.df['cut_quality'].str.lower() == cut_quality.lower()) &
-            (self.df['lab'].str.lower() == lab.lower())
+    def facets(self, cut=None, carat_min=None, carat_max=None, clarity=None, cut_quality=None, lab=None):
+        """
+        Return {field: [(value, count), ...]} for each dropdown field: the values that still have
+        matches given the selections on the other fields. Computed from the index bitmaps.
+        """
+        predicates = self._predicates(cut, carat_min, carat_max, clarity, cut_quality, lab)
+        return self.engine.facets(predicates, list(FACET_MENUS))
+
+    def _predicates(self, cut, carat_min, carat_max, clarity, cut_quality, lab):
+        from query_engine import Eq, Range
+
+        return [
+            Eq('cut', cut), Range('carat', carat_min, carat_max), Eq('clarity', clarity),
+            Eq('cut_quality', cut_quality), Eq('lab', lab)
         ]
-        return filtered[["stock_id", "cut", "carat", "clarity", "cut_quality", "lab", "total_sales_price"]]
 
 
 class DiamondGUI:
@@ -84,22 +236,34 @@ class DiamondGUI:
         self.recommend_button = tk.Button(master, text="Get Recommendations", command=self.get_recommendations)
         self.recommend_button.grid(row=6, column=0, columnspan=2, pady=8)
 
-        # Results Display with Scrollbar
-        self.results_frame = tk.Frame(master)
-        self.results_frame.grid(row=7, column=0, columnspan=2, pady=8)
-
-        self.scrollbar = tk.Scrollbar(self.results_frame)
-        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        self.results = tk.Text(self.results_frame, height=15, width=80, yscrollcommand=self.scrollbar.set)
-        self.results.pack(side=tk.LEFT, fill=tk.BOTH)
-
-        self.scrollbar.config(command=self.results.yview)
+        # Results Display: only the visible rows are ever formatted
+        self.results = ResultGrid(master, RESULT_COLUMNS, height=15)
+        self.results.grid(row=7, column=0, columnspan=2, pady=8)
 
         # Clear Button 
         self.clear_button = tk.Button(master, text="Clear", command=self.clear_fields)
         self.clear_button.grid(row=8, column=1, pady=8, sticky="e", padx=8)
 
+        # Queries run in the background; the bar moves while one is in flight
+        self.progress = ttk.Progressbar(master, mode="indeterminate", length=150)
+        self.progress.grid(row=8, column=0, pady=8, sticky="w", padx=8)
+        self.executor = BackgroundExecutor(master, progress=self.progress)
+
+        # Changing any selection makes a running query obsolete and narrows the other dropdowns
+        for menu in (self.cut_menu, self.carat_min_menu, self.carat_max_menu,
+                     self.clarity_menu, self.cut_quality_menu, self.lab_menu):
+            menu.bind("<<ComboboxSelected>>", self.selection_changed)
+
+    def selection_changed(self, event=None):
+        self.cancel_query()
+        narrow_dropdowns(self.recommendation_system, self)
+
+    def cancel_query(self):
+        """Drop a query that no longer matches the selection."""
+        if self.executor.busy("recommend"):
+            self.executor.cancel("recommend")
+            self.results.clear()
+
     def get_recommendations(self):
         # Get user input from dropdown menus
         cut = self.cut_var.get().strip()
@@ -118,18 +282,40 @@ class DiamondGUI:
             messagebox.showerror("Input Error", "Carat Min cannot be greater than Carat Max.")
             return
 
-        # Generate recommendations
-        filtered = self.recommendation_system.filter_diamonds(
-            cut=cut, carat_min=carat_min, carat_max=carat_max, clarity=clarity, cut_quality=cut_quality, lab=lab
+        missing = self.recommendation_system.missing_columns()
+        if missing:
+            messagebox.showerror("Data Error", f"Missing columns in dataset: {', '.join(missing)}")
+            return
+
+        # Generate recommendations off the main thread
+        self.results.set_message("Searching...")
+        self.executor.submit(
+            "recommend", self.search, cut, carat_min, carat_max, clarity, cut_quality, lab,
+            on_done=self.show_results, on_error=self.show_error
         )
-        self.results.delete(1.0, tk.END)  
 
-        if filtered is not None and not filtered.empty:
-            # Display the count of stones
-            self.results.insert(tk.END, f"Total Stones: {len(filtered)}\n\n")
-            self.results.insert(tk.END, filtered.to_string(index=False))
+    def search(self, cut, carat_min, carat_max, clarity, cut_quality, lab):
+        """
+        The matches, or the closest alternatives when nothing matches; runs on a worker thread.
+        Returns (view, message), message being None for exact matches.
+        """
+        view = self.recommendation_system.select(cut, carat_min, carat_max, clarity, cut_quality, lab)
+        if not view.empty:
+            return view, None
+        view = self.recommendation_system.alternatives(cut, carat_min, carat_max, clarity, cut_quality, lab)
+        return view, f"No exact match. Showing the {len(view)} closest alternatives."
+
+    def show_results(self, outcome):
+        view, message = outcome
+        if view.empty:
+            self.results.set_message("No diamonds match the given preferences.")
         else:
-            self.results.insert(tk.END, "No diamonds match the given preferences.")
+            # The grid shows the count of stones and pages through the rows
+            self.results.set_view(view, message)
+
+    def show_error(self, error):
+        self.results.clear()
+        messagebox.showerror("Query Error", str(error))
 
     def clear_fields(self):
         # Reset all dropdown menus and results
@@ -139,13 +325,15 @@ class DiamondGUI:
         self.clarity_var.set("")
         self.cut_quality_var.set("")
         self.lab_var.set("")
-        self.results.delete(1.0, tk.END)
+        self.cancel_query()
+        self.results.clear()
+        narrow_dropdowns(self.recommendation_system, self)
 
 
 # Main Function
 if __name__ == "__main__":
     FILE_PATH = "diamonds.csv"  
-    recommendation_system = DiamondRecommendationSystem(FILE_PATH)  
+    recommendation_system = DiamondRecommendationSystem(FILE_PATH, background=True)
 
     root = tk.Tk()
     gui = DiamondGUI(root, recommendation_system)  # Pass the instance to the GUI
@@ -1,27 +1,48 @@
-import pandas as pd
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import ttk, messagebox
+from catalog import load_catalog
+from query_engine import QueryEngine, Eq, ResultView
+from similarity import SimilarityIndex
+from gui_worker import BackgroundExecutor
+from result_grid import ResultGrid
+
+RESULT_COLUMNS = ["color", "polish", "clarity", "total_sales_price"]
+
+# Closest alternatives shown when a search has no exact match
+ALTERNATIVES_SHOWN = 10
 
 class DiamondQualityRecommendationSystem:
     def __init__(self, file_path):
         self.file_path = file_path
         try:
-            self.df = pd.read_csv(file_path)
+            self.df = load_catalog(file_path)
             print("Dataset loaded successfully with", len(self.df), "rows.")
+            self.engine = QueryEngine(self.df)
+            self._similarity = None
         except FileNotFoundError:
             print("Error: File not found. Please check the file path.")
             self.df = None
 
     def filter_diamonds(self, color, polish, clarity):
+        result = self.select(color, polish, clarity)
+        return None if result is None else result.to_frame(RESULT_COLUMNS)
+
+    def select(self, color, polish, clarity):
+        """Return the matches as a lazy ResultView, for paging through large results."""
         if self.df is None:
             return None
 
-        # Apply filtering logic
-        filtered = self.df[(self.df['color'].str.lower() == color.lower()) &
-                           (self.df['polish'].str.lower() == polish.lower()) &
-                           (self.df['clarity'].str.lower() == clarity.lower())]
+        # Apply filtering logic through the shared query engine
+        return self.engine.select([Eq('color', color), Eq('polish', polish), Eq('clarity', clarity)])
 
-        return filtered[["color", "polish", "clarity", "total_sales_price"]]
+    def alternatives(self, color, polish, clarity, k=ALTERNATIVES_SHOWN):
+        """Return the k stones closest in grade to the preferences as a ResultView, closest first."""
+        if self.df is None:
+            return None
+        if self._similarity is None:
+            self._similarity = SimilarityIndex(self.df)
+        positions, _ = self._similarity.nearest(k, color=color, polish=polish, clarity=clarity)
+        return ResultView(self.df, positions, self.engine.index)
 
     def validate_color(self, color):
         return color.isalpha()
@@ -56,27 +77,34 @@ class DiamondQualityGUI:
         self.recommend_button = tk.Button(master, text="Get Recommendations", command=self.get_recommendations)
         self.recommend_button.grid(row=3, column=0, columnspan=2, pady=8)
 
-        # Results Display with Scrollbar
-        self.results_frame = tk.Frame(master)
-        self.results_frame.grid(row=4, column=0, columnspan=2, pady=8)
-
-        self.scrollbar = tk.Scrollbar(self.results_frame)
-        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        self.results = tk.Text(self.results_frame, height=15, width=50, yscrollcommand=self.scrollbar.set)
-        self.results.pack(side=tk.LEFT, fill=tk.BOTH)
-
-        self.scrollbar.config(command=self.results.yview)
+        # Results Display: only the visible rows are ever formatted
+        self.results = ResultGrid(master, RESULT_COLUMNS, height=15)
+        self.results.grid(row=4, column=0, columnspan=2, pady=8)
 
         # Clear Button
         self.clear_button = tk.Button(master, text="Clear", command=self.clear_fields)
         self.clear_button.grid(row=5, column=1, pady=8, sticky="e", padx=8)
 
+        # Queries run in the background; the bar moves while one is in flight
+        self.progress = ttk.Progressbar(master, mode="indeterminate", length=150)
+        self.progress.grid(row=5, column=0, pady=8, sticky="w", padx=8)
+        self.executor = BackgroundExecutor(master, progress=self.progress)
+
         # "Enter" key for navigation and submission
         self.color_entry.bind("<Return>", lambda event: self.polish_entry.focus())
         self.polish_entry.bind("<Return>", lambda event: self.clarity_entry.focus())
         self.clarity_entry.bind("<Return>", lambda event: self.get_recommendations())
 
+        # Editing any field makes a running query obsolete
+        for entry in (self.color_entry, self.polish_entry, self.clarity_entry):
+            entry.bind("<Key>", lambda event: self.cancel_query(), add="+")
+
+    def cancel_query(self):
+        """Drop a query that no longer matches the input."""
+        if self.executor.busy("recommend"):
+            self.executor.cancel("recommend")
+            self.results.clear()
+
     def get_recommendations(self):
         # User input
         color = self.color_entry.get().strip()
@@ -96,20 +124,37 @@ class DiamondQualityGUI:
             messagebox.showerror("Input Error", "Invalid clarity. Please use alphanumeric characters only.")
             return
 
-        # Generate recommendations
-        filtered = self.recommendation_system.filter_diamonds(color=color, polish=polish, clarity=clarity)
-        self.results.delete(1.0, tk.END)  # Clear previous results
-        if filtered is not None and not filtered.empty:
-            self.results.insert(tk.END, filtered.to_string(index=False))
+        # Generate recommendations off the main thread
+        self.results.set_message("Searching...")
+        self.executor.submit("recommend", self.search, color, polish, clarity,
+                             on_done=self.show_results, on_error=self.show_error)
+
+    def search(self, color, polish, clarity):
+        """The matches, or the closest alternatives when nothing matches; runs on a worker thread."""
+        view = self.recommendation_system.select(color, polish, clarity)
+        if view is None or not view.empty:
+            return view, None
+        view = self.recommendation_system.alternatives(color, polish, clarity)
+        return view, f"No exact match. Showing the {len(view)} closest alternatives."
+
+    def show_results(self, outcome):
+        view, message = outcome
+        if view is None or view.empty:
+            self.results.set_message("No diamonds match the given preferences.")
         else:
-            self.results.insert(tk.END, "No diamonds match the given preferences.")
+            self.results.set_view(view, message)
+
+    def show_error(self, error):
+        self.results.clear()
+        messagebox.showerror("Query Error", str(error))
 
     def clear_fields(self):
         # Reset all fields 
         self.color_entry.delete(0, tk.END)
         self.polish_entry.delete(0, tk.END)
         self.clarity_entry.delete(0, tk.END)
-        self.results.delete(1.0, tk.END)
+        self.cancel_query()
+        self.results.clear()
 
 # Main Function
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 import pandas as pd
 import os  
+from catalog import load_catalog
+from query_engine import QueryEngine, Eq
+from similarity import SimilarityIndex
 
 class DiamondRecommendationSystem:
     def __init__(self, file_path):
@@ -7,8 +10,10 @@ class DiamondRecommendationSystem:
         Initialize the system with the diamonds dataset.
         """
         try:
-            self.df = pd.read_csv(file_path)
+            self.df = load_catalog(file_path)
             print(f"Dataset loaded successfully with {len(self.df)} rows.")
+            self.engine = QueryEngine(self.df)
+            self._similarity = None
         except FileNotFoundError:
             print("Error: The file was not found. Please check the file path.")
             self.df = None
@@ -21,31 +26,16 @@ class DiamondRecommendationSystem:
             print("Dataset not loaded. Cannot perform filtering.")
             return pd.DataFrame()  # Return an empty DataFrame
 
-        filtered_df = self.df.copy()
-
-        # Filter by cut
-        if cut:
-            if 'cut' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['cut'].str.lower() == cut.lower()]
-            else:
-                print("Error: 'cut' column not found in the dataset.")
+        # Check that every requested field exists before querying
+        for column, value in (('cut', cut), ('carat_weight', carat_weight), ('clarity', clarity)):
+            if value and column not in self.df.columns:
+                print(f"Error: '{column}' column not found in the dataset.")
                 return pd.DataFrame()  # Return an empty DataFrame
 
-        # Filter by carat_weight
-        if carat_weight:
-            if 'carat_weight' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['carat_weight'] == carat_weight]
-            else:
-                print("Error: 'carat_weight' column not found in the dataset.")
-                return pd.DataFrame()  # Return an empty DataFrame
-
-        # Filter by clarity
-        if clarity:
-            if 'clarity' in self.df.columns:
-                filtered_df = filtered_df[filtered_df['clarity'].str.lower() == clarity.lower()]
-            else:
-                print("Error: 'clarity' column not found in the dataset.")
-                return pd.DataFrame()  # Return an empty DataFrame
+        result = self.engine.select([
+            Eq('cut', cut or None), Eq('carat_weight', carat_weight or None), Eq('clarity', clarity or None)
+        ])
+        filtered_df = result.to_frame()
 
         if filtered_df.empty:
             print("No diamonds match the given preferences. Please refine your criteria.")
@@ -53,9 +43,29 @@ class DiamondRecommendationSystem:
 
         return filtered_df
 
+    @property
+    def similarity(self):
+        """Nearest-neighbour index over the catalog, built on first use."""
+        if self._similarity is None:
+            self._similarity = SimilarityIndex(self.df)
+        return self._similarity
+
+    def alternatives(self, cut=None, carat_weight=None, clarity=None, k=5, weights=None):
+        """
+        Return the k diamonds closest to the preferences, closest first, with their distance.
+        Used when filter_diamonds finds no exact match.
+        """
+        if self.df is None:
+            return pd.DataFrame()
+        positions, distances = self.similarity.nearest(
+            k, weights, cut=cut or None, carat_weight=carat_weight or None, clarity=clarity or None)
+        alternatives = self.df.iloc[positions].copy()
+        alternatives['distance'] = distances
+        return alternatives
+
     def recommend(self, cut=None, carat_weight=None, clarity=None):
         """
-        Display all matching diamonds.
+        Display all matching diamonds, or the closest alternatives when none match.
         """
         print("\n--- User Preference-Based Recommendations ---")
         filtered = self.filter_diamonds(cut=cut, carat_weight=carat_weight, clarity=clarity)
@@ -63,6 +73,10 @@ class DiamondRecommendationSystem:
             print(filtered[['cut', 'carat_weight', 'clarity']])
         else:
             print("No diamonds match the given preferences.")
+            alternatives = self.alternatives(cut=cut, carat_weight=carat_weight, clarity=clarity)
+            if not alternatives.empty:
+                print("\n--- Closest Alternatives ---")
+                print(alternatives[['cut', 'carat_weight', 'clarity', 'distance']])
 
     def validate_cut(self, cut):
         """
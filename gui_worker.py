@@ -0,0 +1,126 @@
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# How often the Tk main loop checks for finished work; about one frame at 60 Hz
+POLL_MS = 16
+
+
+class Task:
+    """One submitted piece of work. Cancelled tasks never call back into the GUI."""
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Mark the task cancelled; returns True if it had not started and never will."""
+        self._cancelled.set()
+        return self.future is not None and self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class BackgroundExecutor:
+    """
+    Runs queries and file writes on worker threads so the Tk main loop keeps drawing.
+    Results are handed back on the main thread through master.after(), the only safe way
+    to touch widgets. Submitting under a key cancels the previous task with that key, so
+    only the latest query for a form is ever shown.
+    """
+
+    def __init__(self, master, max_workers=2, progress=None, poll_ms=POLL_MS):
+        self.master = master
+        self.progress = progress
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-worker')
+        self._finished = queue.SimpleQueue()
+        self._current = {}
+        self._pending = 0
+        self._polling = False
+
+    def submit(self, key, fn, *args, on_done=None, on_error=None, **kwargs):
+        """Run fn(*args, **kwargs) in the background; on_done(result) or on_error(exc) runs on the main thread."""
+        self.cancel(key)
+        task = Task(key)
+        self._current[key] = task
+        self._pending += 1
+        task.future = self._pool.submit(self._run, task, fn, args, kwargs, on_done, on_error)
+        self._set_busy(True)
+        if not self._polling:
+            self._polling = True
+            self.master.after(self.poll_ms, self._poll)
+        return task
+
+    def cancel(self, key):
+        """Cancel the task running under key, if any; its result is dropped."""
+        task = self._current.pop(key, None)
+        if task is not None and task.cancel():
+            self._pending -= 1
+
+    def busy(self, key=None):
+        if key is None:
+            return self._pending > 0
+        return key in self._current
+
+    def _run(self, task, fn, args, kwargs, on_done, on_error):
+        try:
+            if task.cancelled:
+                result, error = None, None
+            else:
+                result, error = fn(*args, **kwargs), None
+        except Exception as exc:
+            result, error = None, exc
+        self._finished.put((task, result, error, on_done, on_error))
+
+    def _poll(self):
+        while True:
+            try:
+                task, result, error, on_done, on_error = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if task.cancelled or self._current.get(task.key) is not task:
+                continue
+            del self._current[task.key]
+            try:
+                if error is not None:
+                    if on_error is None:
+                        raise error
+                    on_error(error)
+                elif on_done is not None:
+                    on_done(result)
+            except Exception as exc:
+                # Report and keep polling, so later results are still delivered
+                self._report(exc)
+
+        if self._pending:
+            self.master.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+            self._set_busy(False)
+
+    def _report(self, error):
+        # Tk's handler for errors in callbacks prints the traceback (and can be overridden)
+        report = getattr(self.master, 'report_callback_exception', None)
+        if report is not None:
+            report(type(error), error, error.__traceback__)
+        else:
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    def _set_busy(self, busy):
+        if self.progress is None:
+            return
+        if busy:
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+
+    def shutdown(self):
+        for key in list(self._current):
+            self.cancel(key)
+        self._pool.shutdown(wait=False)
@@ -1,9 +1,58 @@
+import json
+import os
+import threading
+import metrics
 import pandas as pd
+from catalog import _file_hash, load_catalog
+from catalog_index import StockIdIndex
+from inventory_journal import InventoryJournal
+from query_cache import invalidate_rows
+from smart_restocking import catalog_version, record_stock_changes
 
 class Inventory:
-    def __init__(self, file_path='diamonds.csv'):
+    def __init__(self, file_path='diamonds.csv', journaled=False, sync_every=64, checkpoint_interval=None):
         self.file_path = file_path
-        self.data = pd.read_csv(file_path) if self._file_exists() else pd.DataFrame(columns=['ID', 'Type', 'Carat', 'Price', 'Stock'])
+        self._lock = threading.RLock()
+        self.data = load_catalog(file_path) if self._file_exists() else pd.DataFrame(columns=['ID', 'Type', 'Carat', 'Price', 'Stock'])
+
+        # Journaled mode: mutations go to an append-only log and a small in-memory overlay
+        self.journal = None
+        self._pending = {}
+        # Per-(cut, clarity) row count changes not yet in the data file, logged for the restocking report
+        self._stock_changes = {}
+        self._checkpoint_timer = None
+        if journaled:
+            self.journal = InventoryJournal(file_path + '.journal', sync_every=sync_every)
+            self._recover()
+            if checkpoint_interval:
+                self._schedule_checkpoint(checkpoint_interval)
+
+    @property
+    def data(self):
+        with self._lock:
+            if self._pending:
+                self._apply_overlay()
+            if not self._removed:
+                return self._data
+            if self._view is None:
+                # Removed rows stay in the stored table until it is compacted, so positions hold
+                self._view = self._data.drop(index=self._data.index[sorted(self._removed)])
+            return self._view
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._removed = set()
+        self._view = None
+        # The table was replaced wholesale; the ID index is rebuilt on next use
+        self._id_index = None
+
+    @property
+    def id_index(self):
+        """Hash index from ID to row position in the stored table."""
+        if self._id_index is None:
+            self._id_index = StockIdIndex(self._data['ID'])
+        return self._id_index
 
     def _file_exists(self):
         try:
@@ -12,29 +61,263 @@ class Inventory:
         except FileNotFoundError:
             return False
 
+    @metrics.timed('inventory_mutation', operation='add_item')
     def add_item(self, item):
-        self.data = pd.concat([self.data, pd.DataFrame([item])], ignore_index=True)
-        self.save_data()
+        if self.journal is not None:
+            with self._lock:
+                self.journal.append('add', item=item)
+                self._add_to_overlay(item)
+                self._count_stock([item], 1)
+        else:
+            with self._lock:
+                self._add_to_overlay(item)
+                self._count_stock([item], 1)
+                self.save_data()
+        invalidate_rows([item])
         print("Item added successfully!")
 
+    @metrics.timed('inventory_mutation', operation='remove_item')
     def remove_item(self, item_id):
-        if item_id in self.data['ID'].values:
-            self.data = self.data[self.data['ID'] != item_id]
-            self.save_data()
-            print(f"Item with ID {item_id} removed successfully!")
-        else:
-            print(f"No item found with ID {item_id}.")
+        with self._lock:
+            if not self._contains(item_id):
+                print(f"No item found with ID {item_id}.")
+                return
 
+            if self.journal is not None:
+                self.journal.append('remove', id=item_id)
+                removed = self._remove_from_overlay(item_id)
+                self._count_stock(removed, -1)
+            else:
+                removed = self._remove_from_overlay(item_id)
+                self._count_stock(removed, -1)
+                self.save_data()
+        invalidate_rows(removed, removed=True)
+        print(f"Item with ID {item_id} removed successfully!")
+
+    @metrics.timed('inventory_mutation', operation='update_stock')
     def update_stock(self, item_id, new_stock):
-        if item_id in self.data['ID'].values:
-            self.data.loc[self.data['ID'] == item_id, 'Stock'] = new_stock
-            self.save_data()
-            print(f"Stock for item {item_id} updated successfully!")
-        else:
-            print(f"No item found with ID {item_id}.")
+        with self._lock:
+            if not self._contains(item_id):
+                print(f"No item found with ID {item_id}.")
+                return
+
+            if self.journal is not None:
+                self.journal.append('update_stock', id=item_id, stock=new_stock)
+            positions = self._update_in_place(item_id, new_stock)
+            if self.journal is None:
+                self.save_data()
+        invalidate_rows(self._data.iloc[positions], changed_columns=['Stock'])
+        print(f"Stock for item {item_id} updated successfully!")
+
+    @metrics.timed('inventory_mutation', operation='bulk_upsert')
+    def bulk_upsert(self, frame_or_path):
+        """
+        Insert or update a whole batch of items in one vectorized pass and save once.
+        Rows without an ID are rejected, and so are all but the last row for a repeated ID.
+        Returns the inserted, updated and rejected counts.
+        """
+        batch = pd.read_csv(frame_or_path) if isinstance(frame_or_path, str) else pd.DataFrame(frame_or_path)
+        if 'ID' not in batch.columns:
+            print("Error: 'ID' column not found in the batch.")
+            return {'inserted': 0, 'updated': 0, 'rejected': len(batch)}
+
+        with self._lock:
+            valid = batch[batch['ID'].notna()]
+            valid = valid[~valid['ID'].duplicated(keep='last')]
+            rejected = len(batch) - len(valid)
+
+            data = self.data
+            exists = valid['ID'].isin(data['ID'])
+            updates = valid[exists]
+            inserts = valid[~exists]
+
+            # Update matching rows column by column through a hash lookup on ID
+            touched = data[data['ID'].isin(updates['ID'])]
+            if not updates.empty:
+                data = data.copy()
+                by_id = updates.set_index('ID')
+                for column in by_id.columns:
+                    new_values = data['ID'].map(by_id[column])
+                    changed = new_values.notna()
+                    if column not in data.columns:
+                        data[column] = None
+                    data.loc[changed, column] = new_values[changed]
+            if not inserts.empty:
+                data = pd.concat([data, inserts], ignore_index=True)
+            self._count_stock(touched, -1)
+            self._count_stock(data[data['ID'].isin(updates['ID'])], 1)
+            self._count_stock(inserts, 1)
+            self.data = data
+            self._persist()
+
+        invalidate_rows(pd.concat([touched, valid], ignore_index=True))
+        result = {'inserted': len(inserts), 'updated': len(updates), 'rejected': rejected}
+        print(f"Bulk upsert: {result['inserted']} inserted, {result['updated']} updated, {result['rejected']} rejected.")
+        return result
+
+    @metrics.timed('inventory_mutation', operation='bulk_update_stock')
+    def bulk_update_stock(self, mapping):
+        """
+        Set the stock of many items at once from an ID -> stock mapping and save once.
+        Unknown IDs are rejected. Returns the updated and rejected counts.
+        """
+        stock = pd.Series(mapping, dtype=object)
+        with self._lock:
+            data = self.data
+            known = stock.index.isin(data['ID'])
+            new_stock = data['ID'].map(stock[known])
+            changed = new_stock.notna()
+            if changed.any():
+                data = data.copy()
+                data.loc[changed, 'Stock'] = new_stock[changed]
+                self.data = data
+            self._persist()
+
+        invalidate_rows(data[changed], changed_columns=['Stock'])
+        result = {'updated': int(known.sum()), 'rejected': int((~known).sum())}
+        print(f"Bulk stock update: {result['updated']} updated, {result['rejected']} rejected.")
+        return result
+
+    def _persist(self):
+        # Bulk operations write the whole table once, which also checkpoints the journal
+        self.save_data()
+        if self.journal is not None:
+            self.journal.truncate()
 
+    @metrics.timed('save_data')
     def save_data(self):
-        self.data.to_csv(self.file_path, index=False)
+        # Write a temporary file and swap it in, so a crash never leaves a half-written table
+        temp_path = self.file_path + '.tmp'
+        before = catalog_version(self.file_path)
+        self.data.to_csv(temp_path, index=False)
+        if self.journal is not None:
+            # Record which journal records the new table holds before it replaces the old one
+            self._write_checkpoint_state({'seq': self.journal.seq, 'sha1': _file_hash(temp_path)})
+        os.replace(temp_path, self.file_path)
+        record_stock_changes(self.file_path, before, self._stock_changes)
+        self._stock_changes = {}
+        if metrics.enabled():
+            metrics.increment('bytes_written', os.path.getsize(self.file_path), target='inventory')
+
+    # Point operation helpers
+
+    def _contains(self, item_id):
+        return item_id in self._pending or self.id_index.contains(item_id)
+
+    def _update_in_place(self, item_id, new_stock):
+        """Set the stock of every row holding item_id and return their stored positions."""
+        for item in self._pending.get(item_id, []):
+            item['Stock'] = new_stock
+        positions = self.id_index.positions(item_id)
+        if positions:
+            self._data.iloc[positions, self._data.columns.get_loc('Stock')] = new_stock
+            self._view = None
+        return positions
+
+    def _count_stock(self, rows, sign):
+        rows = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if rows.empty or 'cut' not in rows.columns or 'clarity' not in rows.columns:
+            return
+        for (cut, clarity), count in rows.groupby(['cut', 'clarity'], observed=True).size().items():
+            key = (str(cut), str(clarity))
+            self._stock_changes[key] = self._stock_changes.get(key, 0) + sign * int(count)
+
+    # Journaled mode helpers
+
+    def _add_to_overlay(self, item):
+        self._pending.setdefault(item.get('ID'), []).append(dict(item))
+
+    def _remove_from_overlay(self, item_id):
+        """Remove an ID from the overlay and the stored table, and return the removed rows."""
+        removed = pd.DataFrame(self._pending.pop(item_id, []))
+        positions = self.id_index.remove(item_id)
+        if positions:
+            self._removed.update(positions)
+            self._view = None
+            removed = pd.concat([removed, self._data.iloc[positions]], ignore_index=True)
+            if len(self._removed) > len(self._data) // 4:
+                # Compact once removed rows make up a quarter of the table, so the cost is amortized
+                self.data = self.data
+        return removed
+
+    def _apply_overlay(self):
+        """Append pending adds to the stored table, recording their positions in the ID index."""
+        rows = [item for items in self._pending.values() for item in items]
+        id_index = self.id_index
+        self._data = pd.concat([self._data, pd.DataFrame(rows)], ignore_index=True)
+        for item in rows:
+            id_index.append(item.get('ID'))
+        self._pending = {}
+        self._view = None
+
+    def _checkpoint_state_path(self):
+        return self.file_path + '.checkpoint'
+
+    def _read_checkpoint_state(self):
+        try:
+            with open(self._checkpoint_state_path(), 'r') as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {'seq': 0, 'sha1': None}
+
+    def _write_checkpoint_state(self, state):
+        temp_path = self._checkpoint_state_path() + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self._checkpoint_state_path())
+
+    def _recover(self):
+        """
+        Replay the journal left by a previous run on top of the last checkpoint.
+        Records the data file already holds (a crash after saving it but before the journal
+        was emptied) are skipped, so replaying never adds a row twice.
+        """
+        state = self._read_checkpoint_state()
+        self.journal.seq = state['seq']
+        saved_seq = None
+        for record in self.journal.replay():
+            if record.get('seq', state['seq'] + 1) <= state['seq']:
+                if saved_seq is None:
+                    # The state is written before the table is swapped in; trust it only if the swap happened
+                    saved = self._file_exists() and _file_hash(self.file_path) == state['sha1']
+                    saved_seq = state['seq'] if saved else 0
+                if record['seq'] <= saved_seq:
+                    continue
+            if record['op'] == 'add':
+                self._add_to_overlay(record['item'])
+                self._count_stock([record['item']], 1)
+            elif record['op'] == 'remove' and self._contains(record['id']):
+                self._count_stock(self._remove_from_overlay(record['id']), -1)
+            elif record['op'] == 'update_stock' and self._contains(record['id']):
+                self._update_in_place(record['id'], record['stock'])
+
+    def checkpoint(self):
+        """Compact the journal into the data file."""
+        if self.journal is None:
+            return
+        with self._lock:
+            self.journal.sync()
+            if self.journal.records:
+                self.save_data()
+                self.journal.truncate()
+
+    def _schedule_checkpoint(self, interval):
+        def run():
+            self.checkpoint()
+            self._schedule_checkpoint(interval)
+
+        self._checkpoint_timer = threading.Timer(interval, run)
+        self._checkpoint_timer.daemon = True
+        self._checkpoint_timer.start()
+
+    def close(self):
+        """Stop background checkpoints and checkpoint whatever is left in the journal."""
+        if self._checkpoint_timer is not None:
+            self._checkpoint_timer.cancel()
+            self._checkpoint_timer = None
+        self.checkpoint()
+        if self.journal is not None:
+            self.journal.close()
 
     def get_inventory(self):
         return self.data
@@ -48,7 +331,7 @@ class Inventory:
 
 # User Interaction Function
 def inventory_interaction():
-    inv = Inventory()
+    inv = Inventory(journaled=True)
     while True:
         print("\nInventory Management Menu:")
         print("1. Display Inventory")
@@ -78,6 +361,7 @@ def inventory_interaction():
             new_stock = int(input("Enter the new stock value: ").strip())
             inv.update_stock(item_id, new_stock)
         elif choice == "5":
+            inv.close()
             print("Exiting Inventory Management. Goodbye!")
             break
         else:
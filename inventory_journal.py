@@ -0,0 +1,75 @@
+import json
+import os
+
+
+def _to_json(value):
+    # numpy scalars and anything else pandas hands back
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class InventoryJournal:
+    """
+    Append-only log of inventory mutations, one JSON record per line.
+    Records are flushed on every append and fsynced in batches of sync_every.
+    Each record carries a sequence number that keeps counting across truncations,
+    so a checkpoint can tell which records it already holds.
+    """
+
+    def __init__(self, file_path, sync_every=64):
+        self.file_path = file_path
+        self.sync_every = sync_every
+        self.unsynced = 0
+        self.records = 0
+        self.seq = 0
+        self.file = None
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.file_path, 'a', encoding='utf-8')
+        return self.file
+
+    def append(self, op, **fields):
+        """Append one mutation record."""
+        file = self._open()
+        fields['op'] = op
+        self.seq += 1
+        fields['seq'] = self.seq
+        file.write(json.dumps(fields, default=_to_json) + '\n')
+        file.flush()
+        self.records += 1
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """Force appended records to disk."""
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def replay(self):
+        """Yield the records in the log; a torn last line from a crash is skipped."""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.records += 1
+                self.seq = max(self.seq, record.get('seq', 0))
+                yield record
+
+    def truncate(self):
+        """Empty the log once its records are part of the checkpoint."""
+        self.close()
+        with open(self.file_path, 'w', encoding='utf-8') as file:
+            os.fsync(file.fileno())
+        self.records = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -1,9 +1,8 @@
-import pandas as pd
 from datetime import datetime
+from price_engine import PriceEngine
+from streaming import memory_limit_from_env
 
-# Load the diamonds data
 diamonds_file = 'diamonds.csv'
-diamonds_df = pd.read_csv(diamonds_file)
 
 # Authentication for manager
 def authenticate_manager():
@@ -17,40 +16,83 @@ def authenticate_manager():
         print("Authentication failed!")
         return False
 
+def _optional(prompt, convert=str):
+    value = input(prompt).strip()
+    return convert(value) if value else None
+
+
 # Adjust prices
-def adjust_prices(diamonds_df):
+def adjust_prices(price_engine, reason):
     try:
         adjustment = float(input("Enter percentage to adjust prices (e.g., 10 for +10%, -10 for -10%): "))
-        confirm = input(f"This will adjust prices by {adjustment}%. Do you want to proceed? (yes/no): ").strip().lower()
+        print("Limit the adjustment to a segment (leave blank to include all stones).")
+        rule = {
+            'cut': _optional("Cut: "),
+            'clarity': _optional("Clarity: "),
+            'lab': _optional("Lab: "),
+            'carat_min': _optional("Carat Min: ", float),
+            'carat_max': _optional("Carat Max: ", float),
+        }
+        stones = len(price_engine.select(**rule))
+        confirm = input(f"This will adjust prices of {stones} stones by {adjustment}%. Do you want to proceed? (yes/no): ").strip().lower()
         if confirm == 'yes':
-            diamonds_df['total_sales_price'] = diamonds_df['total_sales_price'] * (1 + adjustment / 100)
-            print("Prices adjusted successfully.")
-            return diamonds_df, adjustment
+            version = price_engine.adjust(adjustment, reason, **rule)
+            if version is None:
+                print("No stones match the given segment.")
+            else:
+                print(f"Prices adjusted successfully (version {version}).")
+            return version
         else:
             print("Operation canceled.")
-            return diamonds_df, None
+            return None
     except Exception as e:
         print(f"Error: {e}")
-        return diamonds_df, None
-
-# Logging adjustments
-def log_adjustment(adjustment, reason):
-    if adjustment is not None:
-        with open("adjustment_log.txt", "a") as log_file:
-            log_file.write(f"{datetime.now()} | Adjustment: {adjustment}% | Reason: {reason}\n")
-        print("Adjustment logged.")
-    else:
-        print("No adjustment to log.")
+        return None
+
+# Undo adjustments
+def rollback_prices(price_engine, reason):
+    try:
+        version = int(input(f"Enter the version to return to (0-{price_engine.version}): "))
+        confirm = input(f"This will restore prices as of version {version}. Do you want to proceed? (yes/no): ").strip().lower()
+        if confirm == 'yes':
+            new_version = price_engine.rollback(version, reason)
+            print("Nothing to roll back." if new_version is None else f"Prices restored (version {new_version}).")
+            return new_version
+        else:
+            print("Operation canceled.")
+            return None
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# Show the adjustment history
+def show_history(price_engine):
+    for entry in price_engine.history():
+        when = datetime.fromtimestamp(entry['time']).strftime('%Y-%m-%d %H:%M:%S')
+        if entry['kind'] == 'adjust':
+            rule = ', '.join(f"{key}={value}" for key, value in entry['rule'].items()) or 'all stones'
+            change = f"{entry['percent']}% on {rule}"
+        else:
+            change = f"rollback to version {entry['to_version']}"
+        print(f"{entry['version']:>5} | {when} | {change} | {entry['rows']} stones | Reason: {entry['reason']}")
 
 # Main script
 if __name__ == "__main__":
     if authenticate_manager():
-        reason = input("Enter reason for price adjustment: ").strip()
-        diamonds_df, adjustment = adjust_prices(diamonds_df)
-        log_adjustment(adjustment, reason)
-        if adjustment is not None:
-            # Overwrite the original diamonds.csv file
-            diamonds_df.to_csv(diamonds_file, index=False)
-            print(f"Prices updated directly in '{diamonds_file}'.")
+        # Prices are versioned next to diamonds.csv; the CSV itself is not rewritten
+        price_engine = PriceEngine(diamonds_file, memory_limit=memory_limit_from_env())
+        while True:
+            print("\n1. Adjust prices\n2. Roll back prices\n3. Show adjustment history\n4. Exit")
+            choice = input("Enter your choice: ").strip()
+            if choice == '1':
+                adjust_prices(price_engine, input("Enter reason for price adjustment: ").strip())
+            elif choice == '2':
+                rollback_prices(price_engine, input("Enter reason for rollback: ").strip())
+            elif choice == '3':
+                show_history(price_engine)
+            elif choice == '4':
+                break
+            else:
+                print("Invalid choice. Please try again.")
     else:
         print("Access denied.")
@@ -0,0 +1,312 @@
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Latency buckets grow by this factor from LATENCY_MIN seconds, so a reported quantile is
+# within about 5% of the true value whatever the scale; slower observations share the last bucket
+LATENCY_MIN = 1e-6
+LATENCY_GROWTH = 1.1
+LATENCY_BUCKETS = 200
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Prefix of every exported metric name
+NAMESPACE = 'diamonds'
+
+_LOG_GROWTH = math.log(LATENCY_GROWTH)
+
+
+class Histogram:
+    """Observations counted in log-spaced buckets: constant memory and O(1) per observation."""
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (LATENCY_BUCKETS + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        if value <= LATENCY_MIN:
+            bucket = 0
+        else:
+            bucket = min(LATENCY_BUCKETS, math.ceil(math.log(value / LATENCY_MIN) / _LOG_GROWTH))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate the q quantile (0..1), interpolating inside its bucket; None when empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = LATENCY_MIN * LATENCY_GROWTH ** (bucket - 1) if bucket else 0.0
+                high = LATENCY_MIN * LATENCY_GROWTH ** bucket
+                value = low + (high - low) * max(0.0, rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'sum': self.sum,
+                   'mean': self.sum / self.count if self.count else None,
+                   'min': self.min if self.count else None, 'max': self.max if self.count else None}
+        summary.update({f'p{round(q * 100)}': self.quantile(q) for q in QUANTILES})
+        return summary
+
+
+class _Timer:
+    __slots__ = ('registry', 'key', 'start')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.registry.observe_key(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    """Shared stand-in for a timer while metrics are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class Registry:
+    """
+    Timers (latency histograms), counters and gauges, each keyed by name and labels.
+    Disabled, every call returns after checking one attribute, so the instrumented paths
+    cost next to nothing; enabled, updates take a lock so worker threads can share it.
+    Gauges are read from collector functions only when the metrics are exported.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = []
+
+    def timer(self, name, **labels):
+        """Context manager recording the time spent in its block under name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, _key(name, labels))
+
+    def timed(self, name, **labels):
+        """Decorator recording the time spent in each call of a function under name."""
+        key = _key(name, labels)
+
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe_key(key, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def observe(self, name, seconds, **labels):
+        if self.enabled:
+            self.observe_key(_key(name, labels), seconds)
+
+    def observe_key(self, key, seconds):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_collector(self, collector):
+        """Add a function returning [(name, labels, value), ...] gauges, called on every export."""
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """Every metric as a JSON-ready dict of timers, counters and gauges, each name mapping to its label sets."""
+        with self._lock:
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        gauges = {}
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                gauges[_key(name, labels)] = value
+
+        result = {'time': time.time(), 'enabled': self.enabled, 'timers': {}, 'counters': {}, 'gauges': {}}
+        for section, values in (('timers', histograms), ('counters', counters), ('gauges', gauges)):
+            for (name, labels), value in sorted(values.items(), key=lambda item: repr(item[0])):
+                entry = {'labels': dict(labels)}
+                entry.update(value if section == 'timers' else {'value': value})
+                result[section].setdefault(name, []).append(entry)
+        return result
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format; timers are summaries in seconds."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, entries in snapshot['timers'].items():
+            metric = f'{NAMESPACE}_{name}_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for entry in entries:
+                for q in QUANTILES:
+                    value = entry[f'p{round(q * 100)}']
+                    labels = _labels({**entry['labels'], 'quantile': q})
+                    lines.append(f'{metric}{labels} {_number(value)}')
+                lines.append(f"{metric}_sum{_labels(entry['labels'])} {_number(entry['sum'])}")
+                lines.append(f"{metric}_count{_labels(entry['labels'])} {entry['count']}")
+        for section, kind, suffix in (('counters', 'counter', '_total'), ('gauges', 'gauge', '')):
+            for name, entries in snapshot[section].items():
+                metric = f'{NAMESPACE}_{name}{suffix}'
+                lines.append(f'# TYPE {metric} {kind}')
+                lines.extend(f"{metric}{_labels(entry['labels'])} {_number(entry['value'])}" for entry in entries)
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, file_path, format=None):
+        """
+        Write the metrics to a file, as Prometheus text when format is 'prometheus' or the
+        file ends in .prom or .txt, else as JSON.
+        """
+        if format is None:
+            format = 'prometheus' if os.path.splitext(file_path)[1] in ('.prom', '.txt') else 'json'
+        text = self.to_prometheus() if format == 'prometheus' else self.to_json()
+        # Write to a temporary file first so a scraper never reads a partial dump
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as output:
+            output.write(text)
+        os.replace(temp_path, file_path)
+
+    def serve(self, port=9464, host='127.0.0.1'):
+        """
+        Serve /metrics (Prometheus text) and /metrics.json over HTTP from a daemon thread;
+        returns the server, whose shutdown() stops it.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = registry.to_json(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# The process-wide registry the instrumented modules report to
+registry = Registry()
+
+timer = registry.timer
+timed = registry.timed
+observe = registry.observe
+increment = registry.increment
+register_collector = registry.register_collector
+reset = registry.reset
+snapshot = registry.snapshot
+to_json = registry.to_json
+to_prometheus = registry.to_prometheus
+dump = registry.dump
+serve = registry.serve
+
+
+def enable(enabled=True):
+    registry.enabled = enabled
+
+
+def enabled():
+    return registry.enabled
+
+
+def configure_from_env():
+    """
+    Apply DIAMONDS_METRICS (any value but 0 turns metrics on), DIAMONDS_METRICS_FILE (enable
+    and dump there when the process exits) and DIAMONDS_METRICS_PORT (enable and serve over HTTP).
+    """
+    if os.environ.get('DIAMONDS_METRICS', '0') not in ('', '0'):
+        enable()
+    file_path = os.environ.get('DIAMONDS_METRICS_FILE')
+    if file_path:
+        enable()
+        atexit.register(dump, file_path)
+    port = os.environ.get('DIAMONDS_METRICS_PORT')
+    if port:
+        enable()
+        serve(int(port))
+
+
+configure_from_env()
@@ -1,19 +1,40 @@
-from diamond_gui import DiamondRecommendationSystem  # Import the reusable class
+from diamond_gui import DiamondRecommendationSystem, narrow_dropdowns  # Import the reusable class
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-import os
+import metrics
+from gui_worker import BackgroundExecutor
+
+# NumPy and pandas are imported on first use so the window opens before the catalog loads
+
+# Stone selection offered for multi-stone orders, mapped to allocation.py strategies
+SELECTION_STRATEGIES = {
+    "First available": "first",
+    "Lowest total price": "lowest_price",
+    "Closest carat match": "matched_carat",
+    "Target total carat": "target_carat",
+}
+
+# Attempts at reserving an allocation before giving up when other counters keep taking its stones
+ALLOCATION_ATTEMPTS = 3
 
 
 class DiamondOrderGUI:
-    def __init__(self, master, order_system):
+    def __init__(self, master, order_system, order_service=None, order_ledger=None):
         self.master = master
         self.order_system = order_system
+        # Shared order database (see order_service.py), opened on the order worker with the first order
+        self._order_service = order_service
+        # Order history (see order_ledger.py), opened with the first order
+        self.order_ledger = order_ledger
+        # Customer lookups over the ledger (see order_index.py), built on first use
+        self.order_index = None
 
         master.title("Diamond Order System")
 
-        # Load the sold stones list from file
-        self.sold_stones = self.load_sold_stones()
+        # Sold stones (see sold_stones.py), loaded with the first order and left out
+        # of the catalog's query index once it has loaded
+        self.sold_stones = None
+        self._sold_excluded = False
 
         # Dropdown Menus and Input Fields
         tk.Label(master, text="Cut:").grid(row=0, column=0, padx=8, pady=5)
@@ -62,28 +83,92 @@ class DiamondOrderGUI:
         self.num_stones_entry = tk.Entry(master, textvariable=self.num_stones_var)
         self.num_stones_entry.grid(row=7, column=1, padx=8, pady=5)
 
+        tk.Label(master, text="Selection:").grid(row=8, column=0, padx=8, pady=5)
+        self.selection_var = tk.StringVar(value="First available")
+        self.selection_menu = ttk.Combobox(master, textvariable=self.selection_var, state="readonly")
+        self.selection_menu['values'] = list(SELECTION_STRATEGIES)
+        self.selection_menu.grid(row=8, column=1, padx=8, pady=5)
+
+        tk.Label(master, text="Target Total Carat:").grid(row=9, column=0, padx=8, pady=5)
+        self.target_carat_var = tk.StringVar()
+        self.target_carat_entry = tk.Entry(master, textvariable=self.target_carat_var)
+        self.target_carat_entry.grid(row=9, column=1, padx=8, pady=5)
+
+        tk.Label(master, text="Carat Tolerance:").grid(row=10, column=0, padx=8, pady=5)
+        self.tolerance_var = tk.StringVar(value="0.05")
+        self.tolerance_entry = tk.Entry(master, textvariable=self.tolerance_var)
+        self.tolerance_entry.grid(row=10, column=1, padx=8, pady=5)
+
         # Buttons
         self.order_button = tk.Button(master, text="Place Order", command=self.place_order)
-        self.order_button.grid(row=8, column=0, columnspan=2, pady=8)
+        self.order_button.grid(row=11, column=0, pady=8)
+        self.history_button = tk.Button(master, text="Customer History", command=self.show_history)
+        self.history_button.grid(row=11, column=1, pady=8)
 
         # Results Display
         self.results_frame = tk.Frame(master)
-        self.results_frame.grid(row=9, column=0, columnspan=2, pady=8)
+        self.results_frame.grid(row=12, column=0, columnspan=2, pady=8)
 
         self.results = tk.Text(self.results_frame, height=15, width=80)
         self.results.pack()
 
-    def load_sold_stones(self):
-        """Load sold stones from file to keep track of unavailable stock."""
-        if os.path.exists("sold_stones.csv"):
-            sold_stones = pd.read_csv("sold_stones.csv")["stock_id"].tolist()
-            return set(sold_stones)
-        return set()
+        # Orders are placed in the background; the bar moves while one is being saved
+        self.progress = ttk.Progressbar(master, mode="indeterminate", length=150)
+        self.progress.grid(row=13, column=0, columnspan=2, pady=5)
+        self.executor = BackgroundExecutor(master, max_workers=1, progress=self.progress)
 
-    def update_sold_stones(self, sold_ids):
+        # Each selection narrows the other dropdowns to combinations that have stones
+        for menu in (self.cut_menu, self.carat_min_menu, self.carat_max_menu,
+                     self.clarity_menu, self.cut_quality_menu, self.lab_menu):
+            menu.bind("<<ComboboxSelected>>", lambda event: narrow_dropdowns(self.order_system, self))
+
+    @property
+    def order_service(self):
+        """Reservations and sales visible to every running counter; opening it reads the legacy sold-stone CSV once."""
+        if self._order_service is None:
+            from order_service import OrderService
+
+            self._order_service = OrderService()
+        return self._order_service
+
+    def load_sold_stones(self):
+        """Open the compact sold-stone set kept next to the order database and catch up on sales."""
+        import os
+        from sold_stones import SoldStoneSet
+
+        directory = os.path.join(os.path.dirname(self.order_service.db_path), 'sold_stones.idx')
+        return SoldStoneSet(directory, self.order_service)
+
+    def refresh_sold_stones(self):
+        """Pick up stones sold since the last refresh, by any counter, and exclude them from every query."""
+        import numpy as np
+
+        if self.sold_stones is None:
+            self.sold_stones = self.load_sold_stones()
+        sold_ids = self.sold_stones.update()
+        engine = self.order_system.engine
+        if not self._sold_excluded:
+            # One vectorized lookup of the catalog's stock IDs in the set
+            stock_ids = self.order_system.df['stock_id'].to_numpy()
+            engine.exclude(np.flatnonzero(self.sold_stones.contains_many(stock_ids)))
+            self._sold_excluded = True
+        elif len(sold_ids):
+            positions = self.order_system.id_index.get_many(sold_ids.tolist())
+            engine.exclude(positions[positions >= 0])
+
+    @metrics.timed('update_sold_stones')
+    def update_sold_stones(self, sold_ids, sold_rows=None):
         """Update the sold stones file."""
+        import pandas as pd
+        from query_cache import invalidate_rows
+
         with open("sold_stones.csv", mode="a") as file:
-            pd.DataFrame({"stock_id": sold_ids}).to_csv(file, index=False, header=file.tell() == 0)
+            start = file.tell()
+            pd.DataFrame({"stock_id": sold_ids}).to_csv(file, index=False, header=start == 0)
+            metrics.increment('bytes_written', file.tell() - start, target='sold_stones')
+        if sold_rows is not None:
+            # Cached queries that returned these stones are stale now
+            invalidate_rows(sold_rows)
 
     def place_order(self):
         # Get user input
@@ -95,6 +180,7 @@ class DiamondOrderGUI:
         lab = self.lab_var.get().strip()
         customer_name = self.customer_name_var.get().strip()
         num_stones = self.num_stones_var.get()
+        strategy = SELECTION_STRATEGIES.get(self.selection_var.get(), "first")
 
         # Validate input
         if not cut or not carat_min or not carat_max or not clarity or not cut_quality or not lab or not customer_name or num_stones <= 0:
@@ -105,43 +191,168 @@ class DiamondOrderGUI:
             messagebox.showerror("Input Error", "Carat Min cannot be greater than Carat Max.")
             return
 
-        # Filter diamonds based on criteria
-        filtered = self.order_system.filter_diamonds(
-            cut=cut, carat_min=carat_min, carat_max=carat_max, clarity=clarity, cut_quality=cut_quality, lab=lab
-        )
-
-        # Exclude sold stones
-        filtered = filtered[~filtered["stock_id"].isin(self.sold_stones)]
+        target_carat, tolerance = None, 0.0
+        if strategy == "target_carat":
+            try:
+                target_carat = float(self.target_carat_var.get())
+                tolerance = float(self.tolerance_var.get() or 0)
+            except ValueError:
+                messagebox.showerror("Input Error", "Please enter a numeric target total carat and tolerance.")
+                return
+            if target_carat <= 0 or tolerance < 0:
+                messagebox.showerror("Input Error", "The target total carat must be positive and the tolerance not negative.")
+                return
 
+        # Filtering, reservation and the file updates run off the main thread
+        self.order_button.config(state=tk.DISABLED)
         self.results.delete(1.0, tk.END)  # Clear previous results
+        self.results.insert(tk.END, "Placing order...")
+        self.executor.submit(
+            "order", self.process_order, cut, carat_min, carat_max, clarity, cut_quality, lab, customer_name, num_stones,
+            strategy, target_carat, tolerance, on_done=self.show_order, on_error=self.show_order_error
+        )
 
-        if filtered is not None and not filtered.empty:
-            if num_stones > len(filtered):
-                messagebox.showerror("Input Error", f"Only {len(filtered)} stones are available for the selected criteria.")
-                return
+    def process_order(self, cut, carat_min, carat_max, clarity, cut_quality, lab, customer_name, num_stones,
+                      strategy="first", target_carat=None, tolerance=0.0):
+        """
+        Select, reserve and sell the stones and append them to the order files; runs on a worker thread.
+        Returns ("error", title, message) or ("done", summary).
+        """
+        with metrics.timer('order', strategy=strategy):
+            outcome = self._process_order(cut, carat_min, carat_max, clarity, cut_quality, lab, customer_name,
+                                          num_stones, strategy, target_carat, tolerance)
+        if outcome[0] == "error":
+            metrics.increment('orders', outcome='rejected')
+        return outcome
+
+    def _process_order(self, cut, carat_min, carat_max, clarity, cut_quality, lab, customer_name, num_stones,
+                       strategy, target_carat, tolerance):
+        # Stones another counter reserved while an allocation was being made
+        taken = set()
+        for _ in range(ALLOCATION_ATTEMPTS):
+            # Sold stones are subtracted inside the query index, so bring them up to date first
+            self.refresh_sold_stones()
+            available = self.order_system.query(cut, carat_min, carat_max, clarity, cut_quality, lab)
+            if taken:
+                available = available[~available["stock_id"].isin(taken)]
+
+            if available.empty:
+                metrics.increment('orders', outcome='no_match')
+                return "done", "No diamonds match the given criteria."
+            if num_stones > len(available):
+                return "error", "Input Error", f"Only {len(available)} stones are available for the selected criteria."
+
+            if strategy == "first":
+                # Reserve the stones first so another counter cannot sell them at the same time
+                token, reserved = self.order_service.reserve(available["stock_id"].tolist(), num_stones)
+                if token is None:
+                    return "error", "Input Error", f"Only {len(reserved)} stones are available for the selected criteria."
+                break
+
+            from allocation import allocate
+
+            chosen = allocate(available["carat"].to_numpy(), available["total_sales_price"].to_numpy(),
+                              num_stones, strategy, target_carat, tolerance)
+            if chosen is None:
+                return "error", "Input Error", (f"No {num_stones} available stones total {target_carat} "
+                                                f"carats within {tolerance}.")
+            # Another counter may have taken one of the chosen stones; allocate again without it
+            chosen_ids = available["stock_id"].iloc[chosen].tolist()
+            token, reserved = self.order_service.reserve(chosen_ids, num_stones)
+            if token is not None:
+                break
+            taken.update(set(chosen_ids) - set(reserved))
+        else:
+            return "error", "Order Error", "The selected stones were taken by another order. Please try again."
+        order_id, sold_ids = self.order_service.commit(token, customer_name)
+        if order_id is None:
+            return "error", "Order Error", "The reservation expired before the order was saved. Please try again."
+
+        selected_stones = available[available["stock_id"].isin(sold_ids)].copy()
+        total_price = selected_stones['total_sales_price'].sum()
+        total_carat = selected_stones['carat'].sum()
+
+        # Update sold stones
+        self.update_sold_stones(sold_ids, selected_stones)
+        self.sold_stones.add(sold_ids)
+        # The catalog has a RangeIndex, so labels are row positions
+        self.order_system.engine.exclude(selected_stones.index.to_numpy())
+
+        # Save order details to a file
+        selected_stones["Customer Name"] = customer_name
+        with open("order_details.csv", mode="a", newline="") as file:
+            start = file.tell()
+            selected_stones.to_csv(file, index=False, header=start == 0)
+            metrics.increment('bytes_written', file.tell() - start, target='order_details')
+        # The ledger dates the order as the order database does, so a later CSV migration recognizes it
+        placed_at = self.order_service.order_time(order_id)
+        self.ledger().append(order_id, customer_name, selected_stones, when=placed_at)
+        if self.order_index is not None:
+            self.order_index.add(order_id, customer_name, selected_stones, placed_at)
+        metrics.increment('orders', outcome='placed')
+        metrics.increment('stones_sold', len(sold_ids))
+
+        # Order summary
+        return "done", (f"Order {order_id} Details for {customer_name}:\n"
+                        f"Total Stones: {num_stones}\n"
+                        f"Total Carat: {total_carat:.2f}\n"
+                        f"Total Price: ${total_price:,.2f}\n"
+                        f"Order saved to 'order_details.csv'.\n")
+
+    def ledger(self):
+        if self.order_ledger is None:
+            from order_ledger import OrderLedger
+
+            self.order_ledger = OrderLedger()
+        return self.order_ledger
+
+    def customer_history(self, customer_name):
+        """Summary of a customer's earlier orders from the order index; runs on a worker thread."""
+        if self.order_index is None:
+            from order_index import OrderIndex
+
+            self.order_index = OrderIndex(self.ledger())
+        else:
+            # Orders placed at other counters since the last lookup
+            self.order_index.refresh()
+        totals = self.order_index.customer_totals(customer_name)
+        if totals is None:
+            return f"No earlier orders for {customer_name}.\n"
+        lines = [f"Order history for {totals['name']}:",
+                 f"Orders: {totals['orders']}  Stones: {totals['stones']}  "
+                 f"Total Carat: {totals['carat']:.2f}  Total Spent: ${totals['revenue']:,.2f}",
+                 f"First order: {totals['first_order']:%Y-%m-%d}  Last order: {totals['last_order']:%Y-%m-%d}", ""]
+        for order in self.order_index.customer_history(customer_name).itertuples(index=False):
+            lines.append(f"Order {order.order_id}  {order.order_time:%Y-%m-%d %H:%M}  "
+                         f"{order.stones} stones  {order.carat:.2f} ct  ${order.total:,.2f}")
+        return "\n".join(lines) + "\n"
+
+    def show_history(self):
+        customer_name = self.customer_name_var.get().strip()
+        if not customer_name:
+            messagebox.showerror("Input Error", "Please enter a customer name.")
+            return
+        self.results.delete(1.0, tk.END)
+        self.results.insert(tk.END, "Looking up order history...")
+        self.executor.submit("history", self.customer_history, customer_name,
+                             on_done=self.show_history_result, on_error=self.show_order_error)
+
+    def show_history_result(self, text):
+        self.results.delete(1.0, tk.END)
+        self.results.insert(tk.END, text)
 
-            # Select the top stones based on availability
-            selected_stones = filtered.head(num_stones)
-            total_price = selected_stones['total_sales_price'].sum()
-            total_carat = selected_stones['carat'].sum()
-
-            # Update sold stones
-            sold_ids = selected_stones["stock_id"].tolist()
-            self.update_sold_stones(sold_ids)
-            self.sold_stones.update(sold_ids)
-
-            # Save order details to a file
-            selected_stones["Customer Name"] = customer_name
-            selected_stones.to_csv("order_details.csv", mode="a", index=False, header=not os.path.exists("order_details.csv"))
-
-            # Display order summary
-            self.results.insert(tk.END, f"Order Details for {customer_name}:\n")
-            self.results.insert(tk.END, f"Total Stones: {num_stones}\n")
-            self.results.insert(tk.END, f"Total Carat: {total_carat:.2f}\n")
-            self.results.insert(tk.END, f"Total Price: ${total_price:,.2f}\n")
-            self.results.insert(tk.END, f"Order saved to 'order_details.csv'.\n")
+    def show_order(self, outcome):
+        self.order_button.config(state=tk.NORMAL)
+        self.results.delete(1.0, tk.END)
+        if outcome[0] == "error":
+            messagebox.showerror(outcome[1], outcome[2])
         else:
-            self.results.insert(tk.END, "No diamonds match the given criteria.")
+            self.results.insert(tk.END, outcome[1])
+
+    def show_order_error(self, error):
+        self.order_button.config(state=tk.NORMAL)
+        self.results.delete(1.0, tk.END)
+        messagebox.showerror("Order Error", str(error))
 
     def clear_fields(self):
         # Reset all fields
@@ -153,13 +364,17 @@ class DiamondOrderGUI:
         self.lab_var.set("")
         self.customer_name_var.set("")
         self.num_stones_var.set(0)
+        self.selection_var.set("First available")
+        self.target_carat_var.set("")
+        self.tolerance_var.set("0.05")
         self.results.delete(1.0, tk.END)
+        narrow_dropdowns(self.order_system, self)
 
 
 # Main Function
 if __name__ == "__main__":
     FILE_PATH = "diamonds.csv"  # Update this to your dataset's file path
-    order_system = DiamondRecommendationSystem(FILE_PATH)  # Reusing the imported class
+    order_system = DiamondRecommendationSystem(FILE_PATH, background=True)  # Reusing the imported class
 
     root = tk.Tk()
     gui = DiamondOrderGUI(root, order_system)  # Pass the instance to the GUI
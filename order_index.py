@@ -0,0 +1,309 @@
+import numpy as np
+import pandas as pd
+from catalog_index import StockIdIndex, normalize
+from order_ledger import ITEM_COLUMNS, OrderLedger, _timestamp
+
+# Orders taken in one batch above which the lookup structures are rebuilt instead of extended
+REBUILD_ROWS = 4096
+
+ORDER_COLUMNS = ['order_id', 'order_time', 'Customer Name', 'stones', 'carat', 'total']
+
+_TEXT_COLUMNS = ['cut', 'clarity', 'cut_quality', 'lab']
+
+
+def _utc_times(seconds):
+    # Cheaper than pd.to_datetime(unit='s'), which matters for small results
+    return pd.DatetimeIndex((seconds * 1e9).astype('datetime64[ns]'), tz='UTC')
+
+
+class _Column:
+    """A NumPy array that grows by doubling, for columns appended to one order at a time."""
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.zeros(max(end + end // 2, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def grow(self, size, fill=0):
+        """Extend with fill up to size entries."""
+        if size > self.size:
+            self.extend(np.full(size - self.size, fill))
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+
+class OrderIndex:
+    """
+    In-memory order history with secondary indexes, for questions the order window asks
+    while a customer waits: a customer's orders and totals, who bought a stone, the orders
+    of a date range.
+    Orders are held column-wise (one row per order, line items contiguous per order), with
+    hash indexes on order id and stock id, per-customer order lists and running totals, and
+    order times kept sorted for binary search. Built from the order ledger once; add() and
+    refresh() extend every structure in place instead of rebuilding it.
+    """
+
+    def __init__(self, ledger=None):
+        self.ledger = OrderLedger() if ledger is None else ledger
+        self.watermark = None
+
+        self.order_ids = _Column(np.int64)
+        self.times = _Column(np.float64)
+        self.customers = _Column(np.int32)
+        self.first_items = _Column(np.int64)
+        self.stones = _Column(np.int32)
+        self.carats = _Column(np.float64)
+        self.totals = _Column(np.float64)
+
+        self.stock_ids = _Column(np.int64)
+        self.prices = _Column(np.float64)
+        self.item_carats = _Column(np.float64)
+        self.item_orders = _Column(np.int64)
+        self.item_text = {column: _Column(np.int32) for column in _TEXT_COLUMNS}
+        self.text_values = {column: {} for column in _TEXT_COLUMNS}
+
+        # Customers by normalized name, as typed the first time
+        self.customer_codes = {}
+        self.customer_names = []
+        self.customer_orders = _Column(np.int64)
+        self.customer_stones = _Column(np.int64)
+        self.customer_carat = _Column(np.float64)
+        self.customer_revenue = _Column(np.float64)
+        self.customer_first = _Column(np.float64)
+        self.customer_last = _Column(np.float64)
+
+        self._rebuild_lookups()
+        self.refresh()
+
+    def _rebuild_lookups(self):
+        self.by_order_id = StockIdIndex(self.order_ids.values)
+        self.by_stock_id = StockIdIndex(self.stock_ids.values)
+        # Orders of each customer: a sorted base split by customer, plus orders added since
+        codes = self.customers.values
+        self._customer_rows = np.argsort(codes, kind='stable')
+        self._customer_starts = np.searchsorted(codes[self._customer_rows], np.arange(len(self.customer_names) + 1))
+        self._recent_rows = {}
+        self._appended = 0
+        self._time_order = None
+
+    # Updates
+
+    def refresh(self):
+        """Take in orders the ledger gained since the last refresh, e.g. from other counters."""
+        items, self.watermark = self.ledger.read_since(self.watermark)
+        self._ingest(items)
+
+    def add(self, order_id, customer, items, when):
+        """Index one order as it is placed (items with the ITEM_COLUMNS, when in epoch seconds)."""
+        items = pd.DataFrame(items)[ITEM_COLUMNS].assign(order_id=int(order_id), time=float(when), customer=customer)
+        self._ingest(items)
+
+    def _ingest(self, items):
+        if items.empty:
+            return
+        # Orders seen before (added here, or read again after their tail was compacted) are skipped by
+        # id; ledger ids are unique, with negative ones for orders migrated from order_details.csv
+        order_ids = items['order_id'].to_numpy(dtype=np.int64)
+        known = self.by_order_id.get_many(np.unique(order_ids))
+        if (known >= 0).any():
+            items = items[~np.isin(order_ids, np.unique(order_ids)[known >= 0])]
+            order_ids = items['order_id'].to_numpy(dtype=np.int64)
+            if items.empty:
+                return
+        # Line items of one order are stored next to each other
+        items = items.iloc[np.argsort(order_ids, kind='stable')]
+        order_ids = items['order_id'].to_numpy(dtype=np.int64)
+        unique_ids, first, counts = np.unique(order_ids, return_index=True, return_counts=True)
+        order_count = len(unique_ids)
+        order_start = self.order_ids.size
+        item_start = self.stock_ids.size
+
+        prices = pd.to_numeric(items['total_sales_price'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        carats = pd.to_numeric(items['carat'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        stock_ids = pd.to_numeric(items['stock_id'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        times = items['time'].to_numpy(dtype=np.float64)[first]
+        codes = self._customer_code(items['customer'].to_numpy()[first])
+
+        self.stock_ids.extend(stock_ids)
+        self.prices.extend(prices)
+        self.item_carats.extend(carats)
+        self.item_orders.extend(np.repeat(np.arange(order_start, order_start + order_count), counts))
+        for column in _TEXT_COLUMNS:
+            self.item_text[column].extend(self._text_code(column, items[column].to_numpy()))
+
+        order_totals = np.add.reduceat(prices, first)
+        order_carats = np.add.reduceat(carats, first)
+        # Orders usually arrive in time order; anything else re-sorts on the next date query
+        in_order = np.all(times[1:] >= times[:-1]) and (not self.times.size or times[0] >= self.times.values[-1])
+        if not (in_order and self._time_order is True):
+            self._time_order = None
+        self.order_ids.extend(unique_ids)
+        self.times.extend(times)
+        self.customers.extend(codes)
+        self.first_items.extend(item_start + first)
+        self.stones.extend(counts)
+        self.carats.extend(order_carats)
+        self.totals.extend(order_totals)
+
+        customer_count = len(self.customer_names)
+        for column in (self.customer_orders, self.customer_stones, self.customer_carat, self.customer_revenue):
+            column.grow(customer_count)
+        self.customer_first.grow(customer_count, np.inf)
+        self.customer_last.grow(customer_count, -np.inf)
+        np.add.at(self.customer_orders.data, codes, 1)
+        np.add.at(self.customer_stones.data, codes, counts)
+        np.add.at(self.customer_carat.data, codes, order_carats)
+        np.add.at(self.customer_revenue.data, codes, order_totals)
+        np.minimum.at(self.customer_first.data, codes, times)
+        np.maximum.at(self.customer_last.data, codes, times)
+
+        self._appended += order_count
+        if self._appended > REBUILD_ROWS:
+            self._rebuild_lookups()
+            return
+        for row, order_id in enumerate(unique_ids, order_start):
+            self.by_order_id.append(int(order_id))
+            self._recent_rows.setdefault(int(codes[row - order_start]), []).append(row)
+        for stock_id in stock_ids:
+            self.by_stock_id.append(int(stock_id))
+
+    def _customer_code(self, names):
+        inverse, uniques = pd.factorize(pd.Series(names).fillna('').astype(str))
+        codes = np.empty(len(uniques), dtype=np.int32)
+        for position, name in enumerate(uniques):
+            key = normalize(name)
+            code = self.customer_codes.get(key)
+            if code is None:
+                code = self.customer_codes[key] = len(self.customer_names)
+                self.customer_names.append(name)
+            codes[position] = code
+        return codes[inverse]
+
+    def _text_code(self, column, values):
+        codes, uniques = pd.factorize(values)
+        table = self.text_values[column]
+        # Missing values (code -1) read back as empty text
+        mapping = np.array([table.setdefault(str(value), len(table)) for value in uniques]
+                           + [table.setdefault('', len(table)) if (codes < 0).any() else 0], dtype=np.int32)
+        return mapping[codes]
+
+    # Queries
+
+    def _time_sorted(self):
+        """Order rows by time; None while the rows themselves are in time order."""
+        if self._time_order is None:
+            times = self.times.values
+            self._time_order = True if np.all(times[1:] >= times[:-1]) else np.argsort(times, kind='stable')
+        return None if self._time_order is True else self._time_order
+
+    def _orders_frame(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        names = np.array(self.customer_names, dtype=object) if len(rows) > len(self.customer_names) else None
+        return pd.DataFrame({
+            'order_id': self.order_ids.data[rows],
+            'order_time': _utc_times(self.times.data[rows]),
+            'Customer Name': (names[self.customers.data[rows]] if names is not None
+                              else [self.customer_names[code] for code in self.customers.data[rows]]),
+            'stones': self.stones.data[rows],
+            'carat': self.carats.data[rows],
+            'total': self.totals.data[rows],
+        })
+
+    def _rows_of(self, customer):
+        code = self.customer_codes.get(normalize(customer))
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        rows = np.empty(0, dtype=np.int64)
+        if code + 1 < len(self._customer_starts):
+            rows = self._customer_rows[self._customer_starts[code]:self._customer_starts[code + 1]]
+        recent = self._recent_rows.get(code)
+        if recent:
+            rows = np.concatenate([rows, recent])
+        return rows[np.argsort(self.times.data[rows], kind='stable')]
+
+    def customer_history(self, customer):
+        """A customer's orders, oldest first, with stones, carat and total per order; name case is ignored."""
+        return self._orders_frame(self._rows_of(customer))
+
+    def customer_totals(self, customer):
+        """
+        A customer's lifetime totals as a dict (name, orders, stones, carat, revenue, first_order,
+        last_order), or None for a customer without orders.
+        """
+        code = self.customer_codes.get(normalize(customer))
+        if code is None:
+            return None
+        return {
+            'name': self.customer_names[code],
+            'orders': int(self.customer_orders.data[code]),
+            'stones': int(self.customer_stones.data[code]),
+            'carat': float(self.customer_carat.data[code]),
+            'revenue': float(self.customer_revenue.data[code]),
+            'first_order': pd.Timestamp(self.customer_first.data[code], unit='s', tz='UTC'),
+            'last_order': pd.Timestamp(self.customer_last.data[code], unit='s', tz='UTC'),
+        }
+
+    def top_customers(self, n=10, by='revenue'):
+        """The n customers with the most revenue (or orders, stones, carat), as a DataFrame."""
+        columns = {'orders': self.customer_orders, 'stones': self.customer_stones,
+                   'carat': self.customer_carat, 'revenue': self.customer_revenue}
+        if by not in columns:
+            raise ValueError(f"by must be one of {', '.join(columns)}")
+        values = columns[by].values
+        n = min(n, len(values))
+        best = np.argpartition(-values, n - 1)[:n] if 0 < n < len(values) else np.arange(n)
+        best = best[np.lexsort((best, -values[best]))]
+        return pd.DataFrame({
+            'Customer Name': [self.customer_names[code] for code in best],
+            **{name: column.data[best] for name, column in columns.items()},
+        })
+
+    def stone_order(self, stock_id):
+        """The sale of a stone as a dict (order_id, order_time, customer, price), or None if unsold."""
+        item = self.by_stock_id.get(int(stock_id))
+        if item is None:
+            return None
+        row = int(self.item_orders.data[item])
+        return {
+            'order_id': int(self.order_ids.data[row]),
+            'order_time': pd.Timestamp(self.times.data[row], unit='s', tz='UTC'),
+            'customer': self.customer_names[self.customers.data[row]],
+            'price': float(self.prices.data[item]),
+        }
+
+    def order_items(self, order_id):
+        """The line items of one order as a DataFrame with the ITEM_COLUMNS, empty if unknown."""
+        row = self.by_order_id.get(int(order_id))
+        if row is None:
+            return pd.DataFrame(columns=ITEM_COLUMNS)
+        items = np.arange(self.first_items.data[row], self.first_items.data[row] + self.stones.data[row])
+        frame = {'stock_id': self.stock_ids.data[items], 'carat': self.item_carats.data[items],
+                 'total_sales_price': self.prices.data[items]}
+        for column in _TEXT_COLUMNS:
+            values = list(self.text_values[column])
+            frame[column] = [values[code] for code in self.item_text[column].data[items]]
+        return pd.DataFrame({column: frame[column] for column in ITEM_COLUMNS})
+
+    def orders_between(self, start=None, end=None):
+        """Orders placed in [start, end) (epoch seconds, datetimes or date strings), oldest first."""
+        start, end = _timestamp(start), _timestamp(end)
+        order = self._time_sorted()
+        times = self.times.values if order is None else self.times.values[order]
+        low = 0 if start is None else np.searchsorted(times, start, side='left')
+        high = len(times) if end is None else np.searchsorted(times, end, side='left')
+        rows = np.arange(low, high) if order is None else order[low:high]
+        return self._orders_frame(rows)
+
+    def __len__(self):
+        return self.order_ids.size
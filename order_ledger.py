@@ -0,0 +1,483 @@
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+import metrics
+import numpy as np
+import pandas as pd
+
+# Line item columns, as written to order_details.csv by the order window
+ITEM_COLUMNS = ['stock_id', 'cut', 'carat', 'clarity', 'cut_quality', 'lab', 'total_sales_price']
+_TEXT_COLUMNS = ['cut', 'clarity', 'cut_quality', 'lab']
+
+# Orders appended to a partition's tail are folded into a compressed segment past this size
+COMPACT_BYTES = 256 * 1024
+
+# A compaction lock older than this was left by a crashed process and is taken over
+LOCK_TIMEOUT = 60
+
+LEDGER_VERSION = 1
+
+_PARTITION_FORMATS = {'month': '%Y-%m', 'day': '%Y-%m-%d'}
+
+
+def _partition_key(when, granularity):
+    return datetime.datetime.fromtimestamp(when, datetime.timezone.utc).strftime(_PARTITION_FORMATS[granularity])
+
+
+def _partition_bounds(key, granularity):
+    """[start, end) of a partition in epoch seconds."""
+    start = datetime.datetime.strptime(key, _PARTITION_FORMATS[granularity]).replace(tzinfo=datetime.timezone.utc)
+    if granularity == 'day':
+        end = start + datetime.timedelta(days=1)
+    else:
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.timestamp(), end.timestamp()
+
+
+def _timestamp(value):
+    """Epoch seconds for None, a number, a datetime or a date string (UTC unless it says otherwise)."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize('UTC')
+    return stamp.timestamp()
+
+
+def _encode(values):
+    """Integer codes and the sorted dictionary of a text column."""
+    dictionary, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), dictionary
+
+
+class OrderLedger:
+    """
+    Order history stored as order headers (id, time, customer) and line items (one per stone).
+    Orders are partitioned by month (or day) of their time. Within a partition they sit in
+    immutable compressed columnar segments, text columns dictionary-encoded, plus a small
+    JSON-lines tail that new orders are appended to and that is compacted into a segment
+    once it grows. manifest.json records each segment's time range and cuts, so scans by
+    date window or cut skip partitions and segments without opening them; a customer
+    filter only reads a segment's customer dictionary to rule it out.
+    """
+
+    def __init__(self, directory='order_ledger', partition='month', compact_bytes=COMPACT_BYTES):
+        if partition not in _PARTITION_FORMATS:
+            raise ValueError(f"partition must be one of {', '.join(_PARTITION_FORMATS)}")
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self.manifest = self._read_manifest()
+        if self.manifest is None:
+            self.manifest = {'version': LEDGER_VERSION, 'partition': partition, 'partitions': {}, 'next_order_id': 1,
+                             'next_legacy_id': -1, 'migrated': []}
+        # An existing ledger keeps the granularity it was created with
+        self.partition = self.manifest['partition']
+
+    # Storage
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path('manifest.json'), 'r') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._path('manifest.json.tmp')
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file)
+        os.replace(temp_path, self._path('manifest.json'))
+
+    def _refresh(self):
+        # Other processes may have compacted or migrated since the manifest was read
+        manifest = self._read_manifest()
+        if manifest is not None:
+            self.manifest = manifest
+
+    def _lock(self):
+        """Take the ledger's compaction lock; returns its path for _unlock."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path('compact.lock')
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+
+    @staticmethod
+    def _unlock(path):
+        os.remove(path)
+
+    def _partition(self, key):
+        return self.manifest['partitions'].setdefault(key, {'segments': [], 'tail_offset': 0})
+
+    # Writing
+
+    def append(self, order_id, customer, items, when=None):
+        """
+        Record one order: its id (e.g. from OrderService.commit), the customer and its line
+        items (rows with the ITEM_COLUMNS). The order is durable when this returns.
+        """
+        when = time.time() if when is None else _timestamp(when)
+        items = pd.DataFrame(items)
+        record = {'order_id': int(order_id), 'time': when, 'customer': customer,
+                  'items': {column: items[column].tolist() for column in ITEM_COLUMNS}}
+        key = _partition_key(when, self.partition)
+        tail_path = self._path(key, 'tail.jsonl')
+        os.makedirs(self._path(key), exist_ok=True)
+        line = (json.dumps(record, default=_json_default) + '\n').encode('utf-8')
+        # One write per order to a file opened for appending, so concurrent counters never interleave
+        with open(tail_path, 'ab') as tail:
+            tail.write(line)
+            tail.flush()
+            os.fsync(tail.fileno())
+            size = tail.tell()
+        metrics.increment('bytes_written', len(line), target='order_ledger')
+        if size >= self.compact_bytes:
+            self.compact(key)
+
+    def next_order_id(self):
+        """An order id above every id in the ledger, for orders not numbered by an OrderService."""
+        self._refresh()
+        next_id = self.manifest['next_order_id']
+        # Segments are in the manifest; orders still in a tail are not
+        for key in self._partition_keys():
+            partition = self.manifest['partitions'].get(key, {'segments': [], 'tail_offset': 0})
+            headers, _, _ = self._read_tail(key, partition['tail_offset'])
+            if not headers.empty:
+                next_id = max(next_id, int(headers['order_id'].max()) + 1)
+        return next_id
+
+    def compact(self, key=None):
+        """Fold the tail of one partition (default all of them) into a new compressed segment."""
+        lock = self._lock()
+        try:
+            self._refresh()
+            keys = [key] if key is not None else sorted(self._partition_keys())
+            for partition_key in keys:
+                self._compact_partition(partition_key)
+            self._write_manifest()
+        finally:
+            self._unlock(lock)
+
+    def _partition_keys(self):
+        keys = set(self.manifest['partitions'])
+        if os.path.isdir(self.directory):
+            keys.update(name for name in os.listdir(self.directory) if os.path.isdir(self._path(name)))
+        return keys
+
+    def _compact_partition(self, key):
+        partition = self._partition(key)
+        headers, items, offset = self._read_tail(key, partition['tail_offset'])
+        if headers.empty:
+            return
+        self._write_segment(key, headers, items)
+        partition['tail_offset'] = offset
+        # A finished partition gets no new orders; its fully compacted tail can go
+        tail_path = self._path(key, 'tail.jsonl')
+        if _partition_bounds(key, self.partition)[1] <= time.time() and os.path.getsize(tail_path) == offset:
+            os.remove(tail_path)
+            partition['tail_offset'] = 0
+
+    def _write_segment(self, key, headers, items):
+        """Store headers and items of one partition as a new segment; the caller writes the manifest."""
+        partition = self._partition(key)
+        os.makedirs(self._path(key), exist_ok=True)
+        number = max([segment['number'] for segment in partition['segments']], default=0) + 1
+        file_name = f'seg-{number:06d}.npz'
+
+        order_ids = headers['order_id'].to_numpy(dtype=np.int64)
+        customer_codes, customers = _encode(headers['customer'])
+        columns = {
+            'order_id': order_ids,
+            'time': headers['time'].to_numpy(dtype=np.float64),
+            'customer': customer_codes,
+            'customers': customers,
+            # Line items point at their order's header row
+            'item_order': np.searchsorted(order_ids, items['order_id'].to_numpy(dtype=np.int64)).astype(np.int32),
+            'stock_id': pd.to_numeric(items['stock_id'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64),
+            'carat': pd.to_numeric(items['carat'], errors='coerce').to_numpy(dtype=np.float64),
+            'total_sales_price': pd.to_numeric(items['total_sales_price'], errors='coerce').to_numpy(dtype=np.float64),
+        }
+        for column in _TEXT_COLUMNS:
+            columns[column], columns[column + '_values'] = _encode(items[column].fillna('').astype(str))
+        temp_path = self._path(key, file_name + '.tmp')
+        with open(temp_path, 'wb') as segment_file:
+            np.savez_compressed(segment_file, **columns)
+        os.replace(temp_path, self._path(key, file_name))
+        metrics.increment('bytes_written', os.path.getsize(self._path(key, file_name)), target='order_ledger')
+
+        partition['segments'].append({
+            'number': number, 'file': file_name, 'orders': len(headers), 'items': len(items),
+            'start': float(columns['time'].min()), 'end': float(columns['time'].max()),
+            'cuts': [str(cut) for cut in columns['cut_values'][np.unique(columns['cut'])]],
+        })
+        self.manifest['next_order_id'] = max(self.manifest['next_order_id'], int(order_ids.max()) + 1)
+
+    def _read_tail(self, key, offset):
+        """Headers and items appended to a partition's tail after offset, and the offset read up to."""
+        headers = []
+        items = {column: [] for column in ITEM_COLUMNS + ['order_id']}
+        tail_path = self._path(key, 'tail.jsonl')
+        if os.path.exists(tail_path):
+            with open(tail_path, 'rb') as tail:
+                tail.seek(offset)
+                for line in tail:
+                    if not line.endswith(b'\n'):
+                        # Still being written; left for the next read
+                        break
+                    offset += len(line)
+                    record = json.loads(line)
+                    headers.append((record['order_id'], record['time'], record['customer']))
+                    for column in ITEM_COLUMNS:
+                        items[column].extend(record['items'][column])
+                    items['order_id'].extend([record['order_id']] * len(record['items']['stock_id']))
+        headers = pd.DataFrame(headers, columns=['order_id', 'time', 'customer'])
+        items = pd.DataFrame(items)
+        # Segments keep headers sorted by order id so items find theirs by binary search
+        order = np.argsort(headers['order_id'].to_numpy(), kind='stable')
+        return headers.iloc[order].reset_index(drop=True), items, offset
+
+    # Reading
+
+    def _plan(self, start, end, cut):
+        """(partition key, segments, read the tail) for every partition a scan has to look at."""
+        self._refresh()
+        plan = []
+        for key in sorted(self._partition_keys()):
+            low, high = _partition_bounds(key, self.partition)
+            if (start is not None and high <= start) or (end is not None and low >= end):
+                continue
+            partition = self.manifest['partitions'].get(key, {'segments': [], 'tail_offset': 0})
+            segments = [segment for segment in partition['segments']
+                        if (start is None or segment['end'] >= start) and (end is None or segment['start'] < end)
+                        and (cut is None or cut in segment['cuts'])]
+            plan.append((key, segments, partition['tail_offset']))
+        return plan
+
+    @metrics.timed('ledger_scan')
+    def scan(self, start=None, end=None, customer=None, cut=None):
+        """
+        Return the line items of orders placed in [start, end) (epoch seconds, datetimes or
+        date strings), optionally only for one customer and/or stones of one cut, as a DataFrame
+        with order_id, order_time, Customer Name and the ITEM_COLUMNS, oldest order first.
+        """
+        start, end = _timestamp(start), _timestamp(end)
+        frames = []
+        for key, segments, tail_offset in self._plan(start, end, cut):
+            for segment in segments:
+                frame = self._read_segment(key, segment, customer, True, start, end, cut)
+                if frame is not None:
+                    frames.append(frame)
+            headers, items, _ = self._read_tail(key, tail_offset)
+            if not headers.empty:
+                frames.append(items.merge(headers, on='order_id'))
+        frame = (pd.concat(frames, ignore_index=True) if frames
+                 else pd.DataFrame(columns=ITEM_COLUMNS + ['order_id', 'time', 'customer']))
+        frame = _filter(frame, start, end, customer, cut)
+        metrics.increment('rows_returned', len(frame), operation='ledger_scan')
+        frame = frame.sort_values(['time', 'order_id'], kind='stable').reset_index(drop=True)
+        frame['order_time'] = pd.to_datetime(frame['time'], unit='s', utc=True)
+        frame = frame.rename(columns={'customer': 'Customer Name'})
+        return frame[['order_id', 'order_time', 'Customer Name'] + ITEM_COLUMNS]
+
+    def orders(self, start=None, end=None, customer=None):
+        """Order headers (order_id, order_time, Customer Name) in [start, end), reading no line items."""
+        start, end = _timestamp(start), _timestamp(end)
+        frames = []
+        for key, segments, tail_offset in self._plan(start, end, None):
+            for segment in segments:
+                frame = self._read_segment(key, segment, customer, False, start, end)
+                if frame is not None:
+                    frames.append(frame)
+            headers, _, _ = self._read_tail(key, tail_offset)
+            frames.append(headers)
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['order_id', 'time', 'customer'])
+        frame = _filter(frame, start, end, customer, None)
+        frame = frame.sort_values(['time', 'order_id'], kind='stable').reset_index(drop=True)
+        return pd.DataFrame({'order_id': frame['order_id'].astype(np.int64),
+                             'order_time': pd.to_datetime(frame['time'].astype(np.float64), unit='s', utc=True),
+                             'Customer Name': frame['customer']})
+
+    def _read_segment(self, key, segment, customer, items, start=None, end=None, cut=None):
+        """Rows of one segment matching the filters, decoded only after filtering on the stored codes."""
+        with np.load(self._path(key, segment['file']), allow_pickle=False) as data:
+            customers = data['customers']
+            if customer is not None and customer not in customers:
+                return None
+            metrics.increment('rows_scanned', segment['items'] if items else segment['orders'], operation='ledger_scan')
+            times = data['time']
+            keep = np.ones(len(times), dtype=bool)
+            if start is not None:
+                keep &= times >= start
+            if end is not None:
+                keep &= times < end
+            if customer is not None:
+                keep &= data['customer'] == np.flatnonzero(customers == customer)[0]
+            if not items:
+                return pd.DataFrame({'order_id': data['order_id'][keep], 'time': times[keep],
+                                     'customer': customers[data['customer'][keep]].astype(object)})
+
+            item_order = data['item_order']
+            rows = keep[item_order]
+            if cut is not None:
+                cut_code = np.flatnonzero(data['cut_values'] == cut)
+                rows &= data['cut'] == (cut_code[0] if len(cut_code) else -1)
+            rows = np.flatnonzero(rows)
+            item_order = item_order[rows]
+            frame = pd.DataFrame({
+                'stock_id': data['stock_id'][rows], 'carat': data['carat'][rows],
+                'total_sales_price': data['total_sales_price'][rows],
+                **{column: data[column + '_values'][data[column][rows]].astype(object) for column in _TEXT_COLUMNS},
+            })
+            frame['order_id'] = data['order_id'][item_order]
+            frame['time'] = times[item_order]
+            frame['customer'] = customers[data['customer'][item_order]].astype(object)
+            return frame
+
+    def read_since(self, watermark=None):
+        """
+        Return (items, watermark): the line items (with order_id, time and customer) of the
+        segments and tail orders not covered by watermark, and the watermark covering them now.
+        Orders read from a tail show up again once compacted, so callers skip order ids they
+        already hold.
+        """
+        self._refresh()
+        watermark = {key: dict(value) for key, value in (watermark or {}).items()}
+        frames = []
+        for key in sorted(self._partition_keys()):
+            seen = watermark.setdefault(key, {'segments': [], 'tail_offset': 0})
+            partition = self.manifest['partitions'].get(key, {'segments': [], 'tail_offset': 0})
+            for segment in partition['segments']:
+                if segment['number'] not in seen['segments']:
+                    frames.append(self._read_segment(key, segment, None, True))
+                    seen['segments'] = seen['segments'] + [segment['number']]
+            tail_path = self._path(key, 'tail.jsonl')
+            tail_size = os.path.getsize(tail_path) if os.path.exists(tail_path) else 0
+            if tail_size < seen['tail_offset']:
+                # The tail was compacted away and started over
+                seen['tail_offset'] = 0
+            headers, items, seen['tail_offset'] = self._read_tail(key, seen['tail_offset'])
+            if not headers.empty:
+                frames.append(items.merge(headers, on='order_id'))
+        columns = ITEM_COLUMNS + ['order_id', 'time', 'customer']
+        frame = pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+        return frame, watermark
+
+    def __len__(self):
+        """Number of orders in the ledger."""
+        self._refresh()
+        count = 0
+        for key in self._partition_keys():
+            partition = self.manifest['partitions'].get(key, {'segments': [], 'tail_offset': 0})
+            count += sum(segment['orders'] for segment in partition['segments'])
+            count += len(self._read_tail(key, partition['tail_offset'])[0])
+        return count
+
+
+def _filter(frame, start, end, customer, cut):
+    mask = np.ones(len(frame), dtype=bool)
+    times = frame['time'].to_numpy(dtype=np.float64)
+    if start is not None:
+        mask &= times >= start
+    if end is not None:
+        mask &= times < end
+    if customer is not None:
+        mask &= (frame['customer'] == customer).to_numpy()
+    if cut is not None:
+        mask &= (frame['cut'] == cut).to_numpy()
+    return frame[mask]
+
+
+def _json_default(value):
+    # NumPy scalars from DataFrame rows
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in the order ledger")
+
+
+def migrate_csv(csv_path='order_details.csv', ledger=None, db_path='orders.db'):
+    """
+    Load an order_details.csv into the ledger in one pass and return the number of orders added.
+    Order ids and times come from the order database where it knows the stone; other rows are
+    grouped into orders by runs of the same customer, dated by the file's modification time and
+    numbered downwards from -1, so they never take an id the order database hands out later.
+    Sales already in the ledger (same stock_id and customer, e.g. recorded by the order window)
+    are not added again, and a file already migrated (same size and modification time) is skipped.
+    """
+    ledger = OrderLedger() if ledger is None else ledger
+    stat = os.stat(csv_path)
+    source = {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    ledger._refresh()
+    if source in ledger.manifest['migrated']:
+        return 0
+
+    rows = pd.read_csv(csv_path)
+    if 'Customer Name' not in rows.columns:
+        raise ValueError(f"{csv_path} has no Customer Name column")
+    for column in ITEM_COLUMNS:
+        if column not in rows.columns:
+            rows[column] = None
+    customers = rows['Customer Name'].fillna('').astype(str)
+    recorded = ledger.scan()
+    recorded = set(zip(pd.to_numeric(recorded['stock_id'], errors='coerce'), recorded['Customer Name']))
+    new = np.array([(stock_id, customer) not in recorded
+                    for stock_id, customer in zip(pd.to_numeric(rows['stock_id'], errors='coerce'), customers)], dtype=bool)
+    rows, customers = rows[new].reset_index(drop=True), customers[new].reset_index(drop=True)
+
+    sold = {}
+    if db_path is not None and os.path.exists(db_path):
+        connection = sqlite3.connect(db_path)
+        try:
+            sold = {stock_id: (order_id, created_at) for stock_id, order_id, created_at in connection.execute(
+                'SELECT sold.stock_id, orders.order_id, orders.created_at FROM sold JOIN orders USING (order_id)')}
+        finally:
+            connection.close()
+    known = rows['stock_id'].map(lambda stock_id: sold.get(int(stock_id)) if pd.notna(stock_id) else None)
+
+    # Rows the database does not know: a run of the same customer is one order
+    unknown = known.isna().to_numpy()
+    run_starts = np.r_[True, (customers.to_numpy()[1:] != customers.to_numpy()[:-1]) | (unknown[1:] != unknown[:-1])]
+    run_numbers = np.cumsum(run_starts & unknown)
+    rows['time'] = np.where(unknown, stat.st_mtime, [value[1] if value else 0.0 for value in known])
+    rows['customer'] = customers
+
+    lock = ledger._lock()
+    try:
+        ledger._refresh()
+        # Legacy orders have their own sequence, taken under the lock
+        first_id = ledger.manifest.get('next_legacy_id', -1)
+        run_ids = first_id + 1 - run_numbers
+        rows['order_id'] = np.where(unknown, run_ids, [value[0] if value else 0 for value in known]).astype(np.int64)
+        ledger.manifest['next_legacy_id'] = first_id - int(run_numbers[-1]) if len(rows) else first_id
+        keys = np.array([_partition_key(when, ledger.partition) for when in rows['time']])
+        for key in np.unique(keys):
+            part = rows[keys == key]
+            headers = part.drop_duplicates('order_id')[['order_id', 'time', 'customer']].sort_values('order_id')
+            ledger._write_segment(str(key), headers.reset_index(drop=True), part[ITEM_COLUMNS + ['order_id']])
+        ledger.manifest['migrated'].append(source)
+        ledger._write_manifest()
+    finally:
+        ledger._unlock(lock)
+    return int(rows['order_id'].nunique())
+
+
+if __name__ == "__main__":
+    import sys
+
+    added = migrate_csv(*sys.argv[1:2])
+    print(f"Migrated {added} orders into the order ledger.")
@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+class OrderService:
+    """
+    Order placement with reserve-then-commit semantics backed by a local SQLite database.
+    Every process running the order GUI shares the same database, so a stone can only
+    be reserved by one counter at a time and sold once.
+    """
+
+    def __init__(self, db_path='orders.db', reservation_ttl=60, sold_stones_file='sold_stones.csv'):
+        self.db_path = db_path
+        self.reservation_ttl = reservation_ttl
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables(sold_stones_file)
+
+    def _create_tables(self, sold_stones_file):
+        with self._transaction() as cursor:
+            cursor.execute('CREATE TABLE IF NOT EXISTS orders ('
+                           'order_id INTEGER PRIMARY KEY AUTOINCREMENT, customer TEXT, created_at REAL)')
+            cursor.execute('CREATE TABLE IF NOT EXISTS sold ('
+                           'seq INTEGER PRIMARY KEY AUTOINCREMENT, stock_id INTEGER UNIQUE, order_id INTEGER)')
+            cursor.execute('CREATE TABLE IF NOT EXISTS reservations ('
+                           'stock_id INTEGER PRIMARY KEY, token TEXT, expires_at REAL)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS reservations_token ON reservations (token)')
+
+            # Seed the sold table from the legacy CSV the first time the database is created
+            empty = cursor.execute('SELECT COUNT(*) FROM sold').fetchone()[0] == 0
+            if empty and sold_stones_file and os.path.exists(sold_stones_file):
+                import pandas as pd
+
+                sold_ids = pd.read_csv(sold_stones_file)['stock_id'].dropna().astype('int64').tolist()
+                cursor.executemany('INSERT OR IGNORE INTO sold (stock_id) VALUES (?)', [(i,) for i in sold_ids])
+
+    def _transaction(self):
+        return _Transaction(self.connection, self._lock)
+
+    @metrics.timed('order_service', step='reserve')
+    def reserve(self, candidate_ids, count, ttl=None):
+        """
+        Atomically reserve the first count candidates that are neither sold nor reserved.
+        Returns (token, reserved_ids); token is None when fewer than count are available,
+        in which case reserved_ids holds how many were available.
+        """
+        ttl = self.reservation_ttl if ttl is None else ttl
+        now = time.time()
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM reservations WHERE expires_at < ?', (now,))
+
+            available = []
+            candidate_ids = [int(stock_id) for stock_id in candidate_ids]
+            for start in range(0, len(candidate_ids), _CHUNK):
+                chunk = candidate_ids[start:start + _CHUNK]
+                marks = ','.join('?' * len(chunk))
+                taken = {row[0] for row in cursor.execute(
+                    f'SELECT stock_id FROM sold WHERE stock_id IN ({marks}) '
+                    f'UNION SELECT stock_id FROM reservations WHERE stock_id IN ({marks})', chunk + chunk)}
+                available.extend(stock_id for stock_id in chunk if stock_id not in taken)
+                if len(available) >= count:
+                    break
+
+            if len(available) < count:
+                return None, available
+            reserved = available[:count]
+            token = uuid.uuid4().hex
+            cursor.executemany('INSERT INTO reservations (stock_id, token, expires_at) VALUES (?, ?, ?)',
+                               [(stock_id, token, now + ttl) for stock_id in reserved])
+        return token, reserved
+
+    @metrics.timed('order_service', step='commit')
+    def commit(self, token, customer_name):
+        """
+        Turn a reservation into a sale. Returns (order_id, sold_ids), or (None, [])
+        when the reservation expired and was taken over.
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            reserved = [row[0] for row in cursor.execute(
+                'SELECT stock_id FROM reservations WHERE token = ? AND expires_at >= ?', (token, now))]
+            total = cursor.execute('SELECT COUNT(*) FROM reservations WHERE token = ?', (token,)).fetchone()[0]
+            if not reserved or len(reserved) != total:
+                cursor.execute('DELETE FROM reservations WHERE token = ?', (token,))
+                return None, []
+
+            cursor.execute('INSERT INTO orders (customer, created_at) VALUES (?, ?)', (customer_name, now))
+            order_id = cursor.lastrowid
+            cursor.executemany('INSERT INTO sold (stock_id, order_id) VALUES (?, ?)',
+                               [(stock_id, order_id) for stock_id in reserved])
+            cursor.execute('DELETE FROM reservations WHERE token = ?', (token,))
+        return order_id, reserved
+
+    def release(self, token):
+        """Give back a reservation without selling it."""
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM reservations WHERE token = ?', (token,))
+
+    def sold_since(self, cursor_position=0):
+        """
+        Return (new_cursor, stock_ids) for stones sold after cursor_position, so a process
+        can follow sales made elsewhere without re-reading everything.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT seq, stock_id FROM sold WHERE seq > ? ORDER BY seq', (cursor_position,)).fetchall()
+        if not rows:
+            return cursor_position, []
+        return rows[-1][0], [row[1] for row in rows]
+
+    def order_time(self, order_id):
+        """When an order was committed (epoch seconds), or None for an unknown order id."""
+        with self._lock:
+            row = self.connection.execute('SELECT created_at FROM orders WHERE order_id = ?', (int(order_id),)).fetchone()
+        return None if row is None else row[0]
+
+    def is_sold(self, stock_id):
+        with self._lock:
+            row = self.connection.execute('SELECT 1 FROM sold WHERE stock_id = ?', (int(stock_id),)).fetchone()
+        return row is not None
+
+    def close(self):
+        self.connection.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error; serializes writers across processes."""
+
+    def __init__(self, connection, lock):
+        self.connection = connection
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.connection.execute('BEGIN IMMEDIATE')
+        except Exception:
+            self.lock.release()
+            raise
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.lock.release()
+        return False
+
+
+def _load_test_worker(db_path, candidates, orders, stones_per_order, results):
+    service = OrderService(db_path, sold_stones_file=None)
+    sold = []
+    for number in range(orders):
+        token, reserved = service.reserve(candidates, stones_per_order)
+        if token is None:
+            break
+        order_id, ids = service.commit(token, f'Customer {number}')
+        sold.extend(ids)
+    service.close()
+    results.put(sold)
+
+
+def load_test(db_path='load_test.db', processes=4, orders_per_process=250, stones_per_order=2, catalog_size=5000):
+    """Place orders from several processes over the same stones and report throughput."""
+    import multiprocessing
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    OrderService(db_path, sold_stones_file=None).close()
+    candidates = list(range(catalog_size))
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_load_test_worker,
+                                       args=(db_path, candidates, orders_per_process, stones_per_order, results))
+               for _ in range(processes)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    sold = [stock_id for _ in workers for stock_id in results.get()]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    orders = len(sold) // stones_per_order
+    print(f"{orders} orders from {processes} processes in {elapsed:.2f}s ({orders / elapsed:.0f} orders/s)")
+    print("Stones sold twice:", len(sold) - len(set(sold)))
+    return {'orders': orders, 'seconds': elapsed, 'duplicates': len(sold) - len(set(sold))}
+
+
+if __name__ == "__main__":
+    load_test()
@@ -0,0 +1,206 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import metrics
+import numpy as np
+import pandas as pd
+
+# Below this many rows the process start-up costs more than it saves
+PARALLEL_MIN_ROWS = 1_000_000
+
+# Resolution of the mergeable histograms used for quantiles, and a cap on their total size
+QUANTILE_BINS = 4096
+MAX_HISTOGRAM_CELLS = 1 << 22
+
+
+class SharedArray:
+    """A NumPy array copied once into shared memory so workers can attach to it by name."""
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.spec = (self.shm.name, array.shape, array.dtype.str)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf)[:] = array
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _partial(groups, values, start, stop, group_count, value_range, bins=QUANTILE_BINS):
+    """Counts, sums, minima, maxima and histograms for rows [start, stop)."""
+    groups = groups[start:stop]
+    result = {'count': np.bincount(groups, minlength=group_count)}
+    if values is None:
+        return result
+
+    values = values[start:stop].astype(np.float64)
+    result['sum'] = np.bincount(groups, weights=values, minlength=group_count)
+
+    # Minima and maxima via one sort by group
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    sorted_values = values[order]
+    present = np.flatnonzero(result['count'])
+    starts = np.searchsorted(sorted_groups, present)
+    result['min'] = np.full(group_count, np.inf)
+    result['max'] = np.full(group_count, -np.inf)
+    if len(present):
+        result['min'][present] = np.minimum.reduceat(sorted_values, starts)
+        result['max'][present] = np.maximum.reduceat(sorted_values, starts)
+
+    if value_range is not None:
+        low, high = value_range
+        width = (high - low) / bins or 1.0
+        value_bins = np.clip(((values - low) / width).astype(np.int64), 0, bins - 1)
+        flat = np.bincount(groups * bins + value_bins, minlength=group_count * bins)
+        result['histogram'] = flat.reshape(group_count, bins)
+    return result
+
+
+def _partial_worker(group_spec, value_spec, start, stop, group_count, value_range, bins):
+    group_shm, groups = _attach(group_spec)
+    value_shm, values = _attach(value_spec) if value_spec is not None else (None, None)
+    try:
+        return _partial(groups, values, start, stop, group_count, value_range, bins)
+    finally:
+        group_shm.close()
+        if value_shm is not None:
+            value_shm.close()
+
+
+def _merge(partials):
+    merged = {}
+    for partial in partials:
+        for name, array in partial.items():
+            if name not in merged:
+                merged[name] = array.copy()
+            elif name == 'min':
+                np.minimum(merged[name], array, out=merged[name])
+            elif name == 'max':
+                np.maximum(merged[name], array, out=merged[name])
+            else:
+                merged[name] += array
+    return merged
+
+
+def _histogram_quantile(histogram, counts, q, value_range):
+    """Interpolate quantile q from per-group histograms."""
+    low, high = value_range
+    bin_count = histogram.shape[1]
+    width = (high - low) / bin_count
+    cumulative = np.cumsum(histogram, axis=1)
+    target = q * counts
+    bins = (cumulative < target[:, None]).sum(axis=1).clip(0, bin_count - 1)
+    before = np.where(bins > 0, cumulative[np.arange(len(bins)), bins - 1], 0)
+    inside = histogram[np.arange(len(bins)), bins]
+    fraction = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0)
+    return low + (bins + fraction) * width
+
+
+def _group_ids(df, keys):
+    """Combine the key columns into one dense group id per row."""
+    codes, levels = [], []
+    for key in keys:
+        column = df[key]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            key_codes, key_levels = column.cat.codes.to_numpy(), column.cat.categories
+        else:
+            key_codes, key_levels = pd.factorize(column, sort=True)
+        codes.append(key_codes.astype(np.int64))
+        levels.append(key_levels)
+
+    valid = np.logical_and.reduce([key_codes >= 0 for key_codes in codes])
+    shape = tuple(len(key_levels) for key_levels in levels)
+    groups = np.ravel_multi_index([key_codes[valid] for key_codes in codes], shape) if len(keys) > 1 else codes[0][valid]
+    return groups, valid, shape, levels
+
+
+@metrics.timed('parallel_groupby')
+def parallel_groupby(df, keys, value=None, quantiles=(), processes=None, partitions=None):
+    """
+    Group df by keys and return count (plus sum, mean, min, max and approximate quantiles
+    of value) per group, sorted by keys like DataFrame.groupby.
+    The key codes and values are placed in shared memory once; each worker aggregates one
+    partition and only the small per-group partials travel back to be merged.
+    """
+    processes = processes or os.cpu_count() or 1
+    groups, valid, shape, levels = _group_ids(df, keys)
+    group_count = int(np.prod(shape))
+    values = df[value].to_numpy()[valid] if value is not None else None
+    value_range = None
+    if values is not None and quantiles and len(values):
+        value_range = (float(np.min(values)), float(np.max(values)))
+    bins = int(max(64, min(QUANTILE_BINS, MAX_HISTOGRAM_CELLS // max(group_count, 1))))
+
+    if processes == 1 or len(groups) < PARALLEL_MIN_ROWS:
+        merged = _partial(groups, values, 0, len(groups), group_count, value_range, bins)
+    else:
+        partitions = partitions or processes
+        bounds = np.linspace(0, len(groups), partitions + 1).astype(np.int64)
+        shared_groups = SharedArray(groups)
+        shared_values = SharedArray(values) if values is not None else None
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [pool.submit(_partial_worker, shared_groups.spec,
+                                       shared_values.spec if shared_values else None,
+                                       int(start), int(stop), group_count, value_range, bins)
+                           for start, stop in zip(bounds[:-1], bounds[1:])]
+                merged = _merge(future.result() for future in futures)
+        finally:
+            shared_groups.close()
+            if shared_values is not None:
+                shared_values.close()
+
+    # Keep only groups that occur, in key order
+    present = np.flatnonzero(merged['count'])
+    key_positions = np.unravel_index(present, shape)
+    result = pd.DataFrame({key: np.asarray(key_levels)[positions]
+                           for key, key_levels, positions in zip(keys, levels, key_positions)})
+    for key in keys:
+        if isinstance(df[key].dtype, pd.CategoricalDtype):
+            result[key] = pd.Categorical(result[key], categories=df[key].cat.categories)
+        else:
+            result[key] = result[key].astype(df[key].dtype)
+    result['count'] = merged['count'][present]
+    if values is not None:
+        result['sum'] = merged['sum'][present]
+        result['mean'] = result['sum'] / result['count']
+        result['min'] = merged['min'][present]
+        result['max'] = merged['max'][present]
+        for q in quantiles:
+            result[f'q{int(q * 100)}'] = _histogram_quantile(
+                merged['histogram'][present], result['count'].to_numpy(), q, value_range)
+    return result
+
+
+def benchmark(rows=4_000_000, process_counts=(1, 2, 4, 8)):
+    """Time parallel_groupby on a synthetic catalog for several process counts."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'cut': pd.Categorical(rng.choice(['Round', 'Oval', 'Pear', 'Emerald', 'Princess', 'Heart'], rows)),
+        'carat_weight': rng.choice(np.round(np.arange(0.2, 5.0, 0.01), 2), rows).astype(np.float32),
+        'clarity': pd.Categorical(rng.choice(['IF', 'VVS1', 'VVS2', 'VS1', 'VS2', 'SI1', 'SI2', 'I1'], rows)),
+        'total_sales_price': rng.gamma(2.0, 2000.0, rows),
+    })
+    timings = {}
+    for processes in process_counts:
+        start = time.perf_counter()
+        parallel_groupby(df, ['cut', 'clarity'], value='total_sales_price', quantiles=(0.5, 0.95), processes=processes)
+        parallel_groupby(df, ['cut', 'carat_weight'], processes=processes)
+        timings[processes] = time.perf_counter() - start
+        print(f"{processes} process(es): {timings[processes]:.2f}s "
+              f"(speedup {timings[process_counts[0]] / timings[processes]:.2f}x)")
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,298 @@
+import bisect
+import json
+import os
+import time
+from functools import lru_cache
+
+import metrics
+import numpy as np
+import pandas as pd
+from catalog import current_prices_path, load_catalog, price_history_dir
+from catalog_index import StockIdIndex
+from query_cache import invalidate_rows
+from query_engine import QueryEngine, Eq, Range
+from streaming import iter_chunks
+
+PRICE_COLUMN = 'total_sales_price'
+
+# A full copy of the price table is kept every this many versions to bound point-in-time replays
+CHECKPOINT_EVERY = 256
+
+# One row per stone, sorted by stock ID; last is the version that last changed the price
+PRICE_TABLE = np.dtype([('stock_id', np.int64), ('price', np.float64), ('last', np.int64)])
+
+
+class PriceEngine:
+    """
+    Versioned price adjustments for a catalog CSV.
+    The CSV is never rewritten: current prices live in a memory-mapped table keyed by stock ID
+    next to it, so they follow the stones when catalog rows are added, removed or reordered.
+    Every adjustment is stored as a delta (stock IDs with old and new prices, and the version
+    that changed each stone before), so an old price is found by reading only the deltas
+    that touched the stone. With a memory_limit the catalog is streamed instead of loaded.
+    """
+
+    def __init__(self, file_path='diamonds.csv', memory_limit=None):
+        self.file_path = file_path
+        self.memory_limit = memory_limit
+        self.directory = price_history_dir(file_path)
+        header = pd.read_csv(file_path, nrows=0).columns
+        for column in ('stock_id', PRICE_COLUMN):
+            if column not in header:
+                raise ValueError(f"{file_path} has no {column} column")
+        self.carat_column = 'carat_weight' if 'carat_weight' in header else 'carat'
+        self.catalog = None
+        self.engine = None
+        self.id_index = None
+        self.versions = []
+        self._delta = lru_cache(maxsize=1024)(self._read_delta)
+        self._open()
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _open(self):
+        os.makedirs(self._path('deltas'), exist_ok=True)
+        os.makedirs(self._path('checkpoints'), exist_ok=True)
+        if not os.path.exists(current_prices_path(self.file_path)):
+            # Version 0 is the price column of the CSV as it is today
+            self.table = np.zeros(0, dtype=PRICE_TABLE)
+            self.catalog_version = None
+            self._add_new_stones()
+            np.save(self._path('checkpoints', 'c000000.npy'), np.asarray(self.table))
+
+        if os.path.exists(self._path('versions.jsonl')):
+            with open(self._path('versions.jsonl'), 'r') as log:
+                for line in log:
+                    try:
+                        self.versions.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line: that version never finished being recorded
+                        break
+
+        self.table = self._load_table()
+        self.checkpoints = sorted(int(name[1:7]) for name in os.listdir(self._path('checkpoints')) if name.endswith('.npy'))
+
+        # Finish versions that were logged but not yet written to the current prices
+        with open(self._path('state.json'), 'r') as state_file:
+            state = json.load(state_file)
+        self.catalog_version = state.get('catalog')
+        for entry in self.versions[state['applied']:]:
+            stock_ids, _, new, _ = self._delta(entry['version'])
+            rows = self._rows(stock_ids)
+            self.table['price'][rows] = new
+            self.table['last'][rows] = entry['version']
+        if len(self.versions) > state['applied']:
+            self.table.flush()
+            self._write_state(len(self.versions))
+
+        # Stones added to the catalog since the last open get a row at their CSV price
+        if self.catalog_version != self._catalog_version():
+            self._add_new_stones()
+
+    def _catalog_version(self):
+        stat = os.stat(self.file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_table(self):
+        return np.load(current_prices_path(self.file_path), mmap_mode='r+')
+
+    def _write_state(self, applied):
+        temp_path = self._path('state.json.tmp')
+        with open(temp_path, 'w') as state_file:
+            json.dump({'applied': applied, 'catalog': self.catalog_version}, state_file)
+        os.replace(temp_path, self._path('state.json'))
+
+    def _catalog_prices(self):
+        """Stock IDs and prices of the catalog's stones; unknown stones carry their CSV price."""
+        if self.memory_limit:
+            chunks = list(iter_chunks(self.file_path, self.memory_limit, usecols=['stock_id', PRICE_COLUMN]))
+            if not chunks:
+                return np.zeros(0, dtype=np.int64), np.zeros(0)
+            return (np.concatenate([chunk['stock_id'].to_numpy(dtype=np.int64) for chunk in chunks]),
+                    np.concatenate([chunk[PRICE_COLUMN].to_numpy(dtype=np.float64) for chunk in chunks]))
+        catalog = self._load_catalog()
+        return catalog['stock_id'].to_numpy(dtype=np.int64), catalog[PRICE_COLUMN].to_numpy(dtype=np.float64)
+
+    def _add_new_stones(self):
+        self.catalog_version = self._catalog_version()
+        stock_ids, prices = self._catalog_prices()
+        ordered = np.sort(stock_ids)
+        repeated = np.unique(ordered[1:][ordered[1:] == ordered[:-1]])
+        if len(repeated):
+            # Prices are kept per stock ID, so rows sharing one could not be priced apart
+            raise ValueError(f"{self.file_path} repeats stock IDs {repeated[:5].tolist()}")
+        new = ~np.isin(stock_ids, self.table['stock_id'])
+        if new.any():
+            stock_ids, first = np.unique(stock_ids[new], return_index=True)
+            added = np.zeros(len(stock_ids), dtype=PRICE_TABLE)
+            added['stock_id'] = stock_ids
+            added['price'] = prices[new][first]
+            table = np.concatenate([np.asarray(self.table), added])
+            table = table[np.argsort(table['stock_id'], kind='stable')]
+            # The whole table is replaced at once; deltas refer to stock IDs, not rows
+            temp_path = self._path('current.tmp.npy')
+            np.save(temp_path, table)
+            os.replace(temp_path, current_prices_path(self.file_path))
+            self.table = self._load_table()
+        self._write_state(self.version)
+
+    def _load_catalog(self):
+        if self.catalog is None:
+            self.catalog = load_catalog(self.file_path)
+            self.id_index = StockIdIndex(self.catalog['stock_id'])
+        return self.catalog
+
+    def _read_delta(self, version):
+        with np.load(self._path('deltas', f'v{version:06d}.npz')) as delta:
+            return delta['stock_ids'], delta['old'], delta['new'], delta['prev']
+
+    def _rows(self, stock_ids):
+        """Rows of the price table holding the given (known) stock IDs."""
+        return np.searchsorted(self.table['stock_id'], stock_ids)
+
+    @property
+    def version(self):
+        return len(self.versions)
+
+    @property
+    def prices(self):
+        """Current prices, in stock ID order."""
+        return self.table['price']
+
+    def select(self, cut=None, clarity=None, lab=None, carat_min=None, carat_max=None):
+        """Stock IDs (sorted) a rule applies to; every criterion left as None matches all stones."""
+        predicates = [Eq('cut', cut), Eq('clarity', clarity), Eq('lab', lab), Range(self.carat_column, carat_min, carat_max)]
+        if self.memory_limit:
+            predicates = [predicate for predicate in predicates if predicate.is_active()]
+            columns = ['stock_id'] + [predicate.column for predicate in predicates]
+            matches = []
+            for chunk in iter_chunks(self.file_path, self.memory_limit, usecols=columns):
+                mask = np.ones(len(chunk), dtype=bool)
+                for predicate in predicates:
+                    mask &= predicate.mask(chunk[predicate.column])
+                matches.append(chunk['stock_id'].to_numpy(dtype=np.int64)[mask])
+            stock_ids = np.concatenate(matches) if matches else np.zeros(0, dtype=np.int64)
+        else:
+            if self.engine is None:
+                self.engine = QueryEngine(self._load_catalog())
+            positions = self.engine.select(predicates).positions
+            stock_ids = self.catalog['stock_id'].to_numpy(dtype=np.int64)[positions]
+        # Stones added since the engine was opened have no price row yet
+        stock_ids = np.unique(stock_ids)
+        return stock_ids[np.isin(stock_ids, self.table['stock_id'])]
+
+    @metrics.timed('price_change', kind='adjust')
+    def adjust(self, percent, reason='', cut=None, clarity=None, lab=None, carat_min=None, carat_max=None):
+        """
+        Change the price of every matching stone by percent (e.g. 10 or -5) and return the new
+        version number, or None when no stone matches.
+        """
+        rule = {'cut': cut, 'clarity': clarity, 'lab': lab, 'carat_min': carat_min, 'carat_max': carat_max}
+        stock_ids = self.select(**rule)
+        if len(stock_ids) == 0:
+            return None
+        rows = self._rows(stock_ids)
+        old = np.asarray(self.table['price'][rows])
+        new = old * (1 + percent / 100)
+        rule = {key: value for key, value in rule.items() if value is not None}
+        return self._record('adjust', rows, old, new, reason, percent=percent, rule=rule)
+
+    @metrics.timed('price_change', kind='rollback')
+    def rollback(self, version, reason=''):
+        """
+        Restore every price changed after version to its value at that version.
+        Recorded as a new version, so the rollback itself can be looked up or undone.
+        """
+        if not 0 <= version <= self.version:
+            raise ValueError(f"Unknown price version {version}")
+        deltas = [self._delta(entry['version']) for entry in self.versions[version:]]
+        if not deltas:
+            return None
+        # Of all deltas after version, the oldest one touching a stone holds its value at version
+        stock_ids = np.concatenate([delta[0] for delta in deltas])
+        values = np.concatenate([delta[1] for delta in deltas])
+        stock_ids, first = np.unique(stock_ids, return_index=True)
+        new = values[first]
+        rows = self._rows(stock_ids)
+        old = np.asarray(self.table['price'][rows])
+        changed = old != new
+        if not changed.any():
+            return None
+        return self._record('rollback', rows[changed], old[changed], new[changed], reason, to_version=version)
+
+    def _record(self, kind, rows, old, new, reason, **details):
+        version = self.version + 1
+        stock_ids = np.asarray(self.table['stock_id'][rows])
+        prev = np.asarray(self.table['last'][rows])
+        np.savez(self._path('deltas', f'v{version:06d}.npz'), stock_ids=stock_ids, old=old, new=new, prev=prev)
+        entry = {'version': version, 'time': time.time(), 'kind': kind, 'rows': len(rows), 'reason': reason, **details}
+        with open(self._path('versions.jsonl'), 'a') as log:
+            log.write(json.dumps(entry) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+        self.versions.append(entry)
+
+        # Only the changed rows of the price table are written
+        self.table['price'][rows] = new
+        self.table['last'][rows] = version
+        self.table.flush()
+        self._write_state(version)
+        if version % CHECKPOINT_EVERY == 0:
+            np.save(self._path('checkpoints', f'c{version:06d}.npy'), np.asarray(self.table))
+            self.checkpoints.append(version)
+
+        metrics.increment('rows_changed', len(rows), operation=f'price_{kind}')
+        if metrics.enabled():
+            metrics.increment('bytes_written', os.path.getsize(self._path('deltas', f'v{version:06d}.npz')), target='prices')
+        if self.catalog is not None:
+            positions = self.id_index.get_many(stock_ids)
+            found = positions >= 0
+            self.catalog.iloc[positions[found], self.catalog.columns.get_loc(PRICE_COLUMN)] = new[found]
+            changed_rows = self.catalog.iloc[positions[found]]
+        else:
+            # Without the catalog, cached queries that filter on price are dropped
+            changed_rows = pd.DataFrame({'stock_id': stock_ids, PRICE_COLUMN: new})
+        invalidate_rows(changed_rows, changed_columns=[PRICE_COLUMN])
+        return version
+
+    def prices_at(self, version):
+        """Prices right after version, as a Series indexed by stock ID."""
+        if not 0 <= version <= self.version:
+            raise ValueError(f"Unknown price version {version}")
+        # Start from the nearest checkpoint at or after version and undo the deltas in between
+        index = bisect.bisect_left(self.checkpoints, version)
+        if index < len(self.checkpoints):
+            start = self.checkpoints[index]
+            table = np.load(self._path('checkpoints', f'c{start:06d}.npy'))
+        else:
+            start = self.version
+            table = np.array(self.table)
+        for number in range(start, version, -1):
+            stock_ids, old, _, _ = self._delta(number)
+            # Stones added after the deltas were recorded are not in an older checkpoint
+            rows = np.searchsorted(table['stock_id'], stock_ids)
+            known = rows < len(table)
+            known[known] = table['stock_id'][rows[known]] == stock_ids[known]
+            table['price'][rows[known]] = old[known]
+        return pd.Series(table['price'], index=pd.Index(table['stock_id'], name='stock_id'), name=PRICE_COLUMN)
+
+    def price(self, stock_id, version=None):
+        """Price of one stone now, or right after version."""
+        row = int(np.searchsorted(self.table['stock_id'], stock_id))
+        if row == len(self.table) or self.table['stock_id'][row] != stock_id:
+            raise KeyError(stock_id)
+        if version is not None and not 0 <= version <= self.version:
+            raise ValueError(f"Unknown price version {version}")
+        price = self.table['price'][row]
+        changed = int(self.table['last'][row])
+        # Follow the stone's own chain of changes back to the last one at or before version
+        while version is not None and changed > version:
+            stock_ids, old, _, prev = self._delta(changed)
+            found = np.searchsorted(stock_ids, stock_id)
+            price, changed = old[found], int(prev[found])
+        return float(price)
+
+    def history(self):
+        """Every recorded version, oldest first."""
+        return list(self.versions)
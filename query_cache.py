@@ -0,0 +1,170 @@
+import weakref
+from collections import OrderedDict
+
+import metrics
+import pandas as pd
+
+# Every cache created in this process, so mutations can reach all of them
+_caches = weakref.WeakSet()
+# Objects holding a copy of catalog rows (query engines) that apply row changes themselves
+_listeners = weakref.WeakSet()
+
+# Inventory file columns standing for the catalog columns queries filter on
+COLUMN_ALIASES = {'cut': 'Type', 'carat': 'Carat', 'carat_weight': 'Carat', 'total_sales_price': 'Price'}
+
+
+class QueryCache:
+    """
+    LRU cache of query results keyed on the normalized filter tuple.
+    Bounded by entry count and by the bytes held in cached row positions.
+    The cache is per process, like the in-memory catalog it indexes: writes made by
+    another process reach it only when this process updates its own catalog (e.g. the
+    order window's refresh of sold stones) or reloads it.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        _caches.add(self)
+
+    @staticmethod
+    def make_key(predicates):
+        """Return the cache key for a list of predicates, ignoring inactive ones and order."""
+        return tuple(sorted((predicate.key() for predicate in predicates if predicate.is_active()), key=repr))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, predicates, positions):
+        if key in self.entries:
+            self._drop(key)
+        active = [predicate for predicate in predicates if predicate.is_active()]
+        # Cached positions are shared by every caller that hits the entry
+        positions.flags.writeable = False
+        self.entries[key] = (active, positions)
+        self.bytes += positions.nbytes
+
+        # Evict least recently used entries until both bounds hold
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, positions = self.entries.pop(key)
+        self.bytes -= positions.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def invalidate_rows(self, rows, changed_columns=None):
+        """
+        Drop the cached results that the given rows can affect.
+        rows holds the touched rows (before and/or after the change). With changed_columns=None
+        the rows were inserted or removed; otherwise only entries filtering on one of the
+        changed columns can be affected.
+        """
+        if not self.entries:
+            return
+        rows = _frame(rows)
+
+        for key, (predicates, _) in list(self.entries.items()):
+            if changed_columns is not None and not any(
+                    p.column in changed_columns or COLUMN_ALIASES.get(p.column) in changed_columns for p in predicates):
+                continue
+            if _any_row_matches(predicates, rows):
+                self._drop(key)
+                self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+def _frame(rows):
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+
+
+def _column(rows, column):
+    """Return the rows' values for a catalog column, read through its inventory alias if needed."""
+    if column in rows.columns:
+        return rows[column]
+    alias = COLUMN_ALIASES.get(column)
+    return rows[alias] if alias in rows.columns else None
+
+
+def _any_row_matches(predicates, rows):
+    """
+    Tell whether some row satisfies every predicate the rows can be checked against.
+    Predicates on columns the rows do not carry cannot decide either way and are skipped;
+    when none can be checked, the rows belong to another table and affect no result.
+    """
+    if rows.empty:
+        return False
+    if not predicates:
+        # An unfiltered result holds every row
+        return True
+    matched = None
+    for predicate in predicates:
+        values = _column(rows, predicate.column)
+        if values is None:
+            continue
+        mask = predicate.mask(values)
+        matched = mask if matched is None else matched & mask
+        if not matched.any():
+            return False
+    return matched is not None
+
+
+def register(listener):
+    """Have listener.rows_changed(rows, changed_columns, removed) called on every row change."""
+    _listeners.add(listener)
+
+
+def invalidate_rows(rows, changed_columns=None, removed=False):
+    """
+    Notify this process that some catalog rows changed.
+    Listeners first apply the change to their own copy of the rows (removed=True marks rows
+    that were deleted), then every query cache drops the results the rows can affect.
+    """
+    rows = _frame(rows)
+    for listener in list(_listeners):
+        listener.rows_changed(rows, changed_columns, removed)
+    for cache in list(_caches):
+        cache.invalidate_rows(rows, changed_columns)
+
+
+def _cache_metrics():
+    """Totals over every live query cache, reported as gauges."""
+    totals = {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+    for cache in list(_caches):
+        for name, value in cache.stats().items():
+            if name in totals:
+                totals[name] += value
+    lookups = totals['hits'] + totals['misses']
+    gauges = [(f'query_cache_{name}', {}, value) for name, value in totals.items()]
+    gauges.append(('query_cache_hit_rate', {}, totals['hits'] / lookups if lookups else 0.0))
+    return gauges
+
+
+metrics.register_collector(_cache_metrics)
@@ -0,0 +1,275 @@
+import metrics
+import numpy as np
+import pandas as pd
+from catalog import CATEGORICAL_COLUMNS
+from catalog_index import CatalogIndex, StockIdIndex, bitmap_from_positions, normalize
+from query_cache import QueryCache, register
+
+# Columns that identify a row across copies of the catalog, in order of preference
+KEY_COLUMNS = ['stock_id', 'ID']
+
+# Numeric columns that get a sorted array for range lookups when present
+RANGE_COLUMNS = ['carat', 'carat_weight', 'total_sales_price']
+
+
+def _isin(values, wanted):
+    if pd.api.types.is_numeric_dtype(values):
+        # Cast to the column type so float32 carats compare equal to their displayed values
+        return values.isin(np.asarray(wanted, dtype=values.dtype)).to_numpy()
+    normalized = values.astype(str).str.strip().str.lower()
+    return normalized.isin([normalize(value) for value in wanted]).to_numpy()
+
+
+class Eq:
+    """Column equals a value (case-insensitive for strings)."""
+
+    def __init__(self, column, value):
+        self.column = column
+        self.value = value
+
+    def is_active(self):
+        # Optional fields: an empty selection does not filter
+        return self.value is not None and self.value != ''
+
+    def key(self):
+        return ('eq', self.column, normalize(self.value))
+
+    def mask(self, values):
+        """Return a boolean array telling which of the given values match."""
+        return _isin(values, [self.value])
+
+
+class In:
+    """Column equals any value in a list."""
+
+    def __init__(self, column, values):
+        self.column = column
+        self.values = list(values) if values is not None else []
+
+    def is_active(self):
+        return len(self.values) > 0
+
+    def key(self):
+        return ('in', self.column, tuple(sorted(set(map(normalize, self.values)))))
+
+    def mask(self, values):
+        return _isin(values, self.values)
+
+
+class Range:
+    """Column lies in [low, high]; either bound may be None."""
+
+    def __init__(self, column, low=None, high=None):
+        self.column = column
+        self.low = low
+        self.high = high
+
+    def is_active(self):
+        return self.low is not None or self.high is not None
+
+    def key(self):
+        return ('range', self.column, self.low, self.high)
+
+    def mask(self, values):
+        low, high = self.low, self.high
+        if values.dtype.kind == 'f':
+            # Compare in the column's own type, as the index does
+            low = None if low is None else values.dtype.type(low)
+            high = None if high is None else values.dtype.type(high)
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= (values >= low).to_numpy()
+        if high is not None:
+            mask &= (values <= high).to_numpy()
+        return mask
+
+
+class ResultView:
+    """
+    Lazy result of a query: only the matching row positions are held.
+    Rows are materialized when a projection or a page is requested.
+    """
+
+    def __init__(self, df, positions, index=None):
+        self.df = df
+        self.positions = positions
+        self.index = index
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def empty(self):
+        return len(self.positions) == 0
+
+    def column(self, name):
+        """Return the values of one column for the matching rows."""
+        return self.df[name].to_numpy()[self.positions]
+
+    def head(self, n):
+        return ResultView(self.df, self.positions[:n], self.index)
+
+    def page(self, start, stop, columns=None):
+        """Materialize only rows [start, stop) of the result."""
+        return self._take(self.positions[start:stop], columns)
+
+    def sort_by(self, column, descending=False):
+        """
+        Return the result ordered by a column; missing values go last.
+        Indexed numeric columns reuse the index's presorted order instead of sorting again.
+        """
+        if self.index is not None and column in self.index.sorted and len(self.positions) > len(self.df) // 64:
+            # Walk the presorted order and keep the rows in the result
+            order = self.index.sorted[column][0]
+            member = np.zeros(len(self.df), dtype=bool)
+            member[self.positions] = True
+            ordered = order[member[order]]
+            member[ordered] = False
+            missing = self.positions[member[self.positions]]
+        else:
+            values = self.df[column].iloc[self.positions]
+            present = values.notna().to_numpy()
+            ordered = self.positions[present][np.argsort(values[present].to_numpy(), kind='stable')]
+            missing = self.positions[~present]
+        if descending:
+            ordered = ordered[::-1]
+        return ResultView(self.df, np.concatenate([ordered, missing]), self.index)
+
+    def to_frame(self, columns=None):
+        """Materialize the matching rows, optionally projected to some columns."""
+        return self._take(self.positions, columns)
+
+    def _take(self, positions, columns):
+        # Project before taking rows, so only the requested columns are copied
+        if columns is None:
+            return self.df.iloc[positions]
+        return self.df.iloc[positions, [self.df.columns.get_loc(column) for column in columns]]
+
+
+class QueryEngine:
+    """
+    Shared query engine for the recommendation systems.
+    Indexed predicates are planned by selectivity through CatalogIndex; predicates on
+    other columns are evaluated afterwards on the surviving rows only.
+    """
+
+    def __init__(self, df, columns=None, range_columns=None, cache=None):
+        self.df = df
+        self.cache = QueryCache() if cache is None else cache
+        if columns is None:
+            columns = [column for column in df.columns
+                       if column in CATEGORICAL_COLUMNS or isinstance(df[column].dtype, pd.CategoricalDtype)]
+        if range_columns is None:
+            range_columns = [column for column in RANGE_COLUMNS
+                             if column in df.columns and pd.api.types.is_numeric_dtype(df[column])]
+        self.index = CatalogIndex(df, columns, range_columns=range_columns)
+        self._key_index = None
+        register(self)
+
+    def select(self, predicates):
+        """Return a ResultView of the rows matching every active predicate."""
+        with metrics.timer('query'):
+            key = self.cache.make_key(predicates)
+            positions = self.cache.get(key)
+            if positions is None:
+                positions = self._match(predicates)
+                self.cache.put(key, predicates, positions)
+        metrics.increment('rows_returned', len(positions), operation='query')
+        return ResultView(self.df, positions, self.index)
+
+    def exclude(self, positions):
+        """
+        Leave catalog rows out of every later select and facet, e.g. sold stones.
+        They are subtracted from the index's available bitmap, so no query has to filter
+        them afterwards; cached results that held them are dropped.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return
+        self.index.exclude(positions)
+        if self.cache.entries:
+            self.cache.invalidate_rows(self.df.iloc[positions])
+
+    def rows_changed(self, rows, changed_columns=None, removed=False):
+        """
+        Apply a row change announced through query_cache.invalidate_rows to this engine's frame
+        and index, so results recomputed after the cache drops its entries are current.
+        Rows are matched on stock ID; changed values are written in place and their columns
+        re-indexed, and removed rows are excluded. Inserted rows reach the engine when the
+        catalog is reloaded.
+        """
+        key = next((column for column in KEY_COLUMNS if column in rows.columns and column in self.df.columns), None)
+        if key is None or rows.empty or (changed_columns is None and not removed):
+            return
+        if self._key_index is None:
+            self._key_index = StockIdIndex(self.df[key])
+        positions = self._key_index.get_many(rows[key])
+        found = positions >= 0
+        if not found.any():
+            return
+        if removed:
+            self.index.exclude(positions[found])
+            return
+        for column in changed_columns:
+            if column not in rows.columns or column not in self.df.columns:
+                continue
+            values = rows[column].to_numpy()[found]
+            # A frame shared with the writer already holds the new values, but its index does not
+            if not np.array_equal(self.df[column].to_numpy()[positions[found]], values):
+                self.df.iloc[positions[found], self.df.columns.get_loc(column)] = values
+            if self.index.has_column(column):
+                self.index.refresh(column, self.df[column])
+
+    def facets(self, predicates, columns=None):
+        """
+        For each facet column, return [(value, count), ...] of the values that still have
+        matches given every predicate on the other columns, for narrowing dropdowns.
+        """
+        with metrics.timer('facets'):
+            return self._facets(predicates, columns)
+
+    def _facets(self, predicates, columns):
+        equals, ranges, residual = self._plan(predicates)
+        extra = None
+        if residual:
+            positions = np.arange(len(self.df))
+            for predicate in residual:
+                positions = positions[predicate.mask(self.df[predicate.column].iloc[positions])]
+            extra = bitmap_from_positions(positions, len(self.df))
+        return self.index.facets(equals=equals, ranges=ranges, columns=columns, extra=extra)
+
+    def _plan(self, predicates):
+        """Split predicates into index equalities, index ranges and residual predicates."""
+        equals = {}
+        ranges = {}
+        residual = []
+        for predicate in predicates:
+            if not predicate.is_active():
+                continue
+            column = predicate.column
+            if isinstance(predicate, Range):
+                if column in self.index.sorted and column not in ranges:
+                    ranges[column] = (predicate.low, predicate.high)
+                else:
+                    residual.append(predicate)
+            elif column in self.index.bitmaps and column not in equals:
+                equals[column] = predicate.value if isinstance(predicate, Eq) else predicate.values
+            elif isinstance(predicate, Eq) and column in self.index.sorted and column not in ranges:
+                # Numeric equality is a degenerate range
+                ranges[column] = (predicate.value, predicate.value)
+            else:
+                residual.append(predicate)
+        return equals, ranges, residual
+
+    def _match(self, predicates):
+        equals, ranges, residual = self._plan(predicates)
+        positions = self.index.match(equals=equals, ranges=ranges)
+        # Rows the index could not rule out, each checked against the remaining predicates
+        metrics.increment('rows_scanned', len(positions), operation='query')
+        for predicate in residual:
+            if len(positions) == 0:
+                break
+            # Predicates without an index are evaluated on the surviving rows only
+            positions = positions[predicate.mask(self.df[predicate.column].iloc[positions])]
+        return positions
+
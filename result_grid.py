@@ -0,0 +1,114 @@
+import numbers
+import tkinter as tk
+from tkinter import ttk
+
+# Columns that can be sorted by clicking their heading
+SORTABLE_COLUMNS = ('carat', 'carat_weight', 'total_sales_price')
+
+
+def format_value(value):
+    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
+        return f"{value:,.2f}" if abs(value) >= 1000 else f"{value:g}"
+    return str(value)
+
+
+class ResultGrid(tk.Frame):
+    """
+    Virtualized result table over a query ResultView.
+    The Treeview only ever holds the rows that fit in the window; scrolling asks the
+    view for the next page, so a result of 100,000 rows costs the same to show as 50.
+    Clicking a sortable heading reorders the result through the catalog index.
+    """
+
+    def __init__(self, master, columns, height=15, sortable=SORTABLE_COLUMNS):
+        super().__init__(master)
+        self.columns = list(columns)
+        self.height = height
+        self.view = None
+        self.sorted_view = None
+        self.sort_column = None
+        self.descending = False
+        self.first = 0
+
+        self.status = tk.Label(self, anchor="w")
+        self.status.pack(side=tk.TOP, fill=tk.X)
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings", height=height, selectmode="browse")
+        for column in self.columns:
+            if column in sortable:
+                self.tree.heading(column, text=column, command=lambda column=column: self.sort(column))
+            else:
+                self.tree.heading(column, text=column)
+            self.tree.column(column, width=100, anchor="e" if column in sortable else "w")
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # The scrollbar tracks the position in the whole result, not the rows in the widget
+        self.scrollbar = tk.Scrollbar(self, command=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_to(self.first - (event.delta // 120) * 3))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.first - 3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.first + 3))
+        self.tree.bind("<Prior>", lambda event: self.scroll_to(self.first - self.height))
+        self.tree.bind("<Next>", lambda event: self.scroll_to(self.first + self.height))
+
+    def __len__(self):
+        return 0 if self.view is None else len(self.view)
+
+    def set_view(self, view, message=None):
+        """Show a new result, keeping the current sort order."""
+        self.view = view
+        self.sorted_view = None
+        self.first = 0
+        if self.sort_column is not None:
+            self.sorted_view = view.sort_by(self.sort_column, self.descending)
+        self.status.config(text=message if message is not None else f"Total Stones: {len(view)}")
+        self._render()
+
+    def set_message(self, message):
+        """Clear the rows and show a message instead, e.g. while a query runs."""
+        self.view = None
+        self.sorted_view = None
+        self.first = 0
+        self.status.config(text=message)
+        self._render()
+
+    def clear(self):
+        self.set_message("")
+
+    def sort(self, column):
+        """Sort by a column; clicking the same heading again reverses the order."""
+        if self.view is None:
+            return
+        self.descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        self.sorted_view = self.view.sort_by(column, self.descending)
+        self.first = 0
+        self._render()
+
+    def scroll_to(self, first):
+        total = len(self)
+        self.first = max(0, min(first, total - self.height))
+        self._render()
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self)))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * self.height)
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def _render(self):
+        self.tree.delete(*self.tree.get_children())
+        view = self.sorted_view if self.sorted_view is not None else self.view
+        total = len(self)
+        if view is None or total == 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+
+        # Only the visible page is materialized and formatted
+        page = view.page(self.first, self.first + self.height, self.columns)
+        for row in page.itertuples(index=False, name=None):
+            self.tree.insert("", tk.END, values=[format_value(value) for value in row])
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + self.height) / total))
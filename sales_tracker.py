@@ -0,0 +1,242 @@
+import heapq
+import io
+import itertools
+import json
+import math
+import os
+import time
+
+import metrics
+import numpy as np
+import pandas as pd
+from streaming import iter_appended_lines
+
+# Attributes best sellers are ranked by; every combination of them is tracked
+SALES_DIMENSIONS = ['cut', 'clarity', 'lab']
+
+# Entries kept ranked per grouping and metric; larger requests fall back to a full scan
+TOP_K = 20
+
+METRICS = ('count', 'revenue')
+
+# With decay, scores are stored relative to an epoch that moves forward before they overflow
+_MAX_EPOCH_HALF_LIVES = 256
+
+
+class TopK:
+    """
+    The k highest-scoring keys under score increases, kept with a lazy min-heap.
+    Scores only ever grow, so a key outside the top k can only enter by passing the
+    current minimum: each offer is O(log k) and reading the ranking never scans all keys.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.members = {}
+        self.heap = []
+        self._ranking = None
+
+    def offer(self, key, score):
+        if key in self.members:
+            self.members[key] = score
+        elif len(self.members) < self.k:
+            self.members[key] = score
+        else:
+            minimum_score, minimum_key = self._minimum()
+            if score <= minimum_score:
+                return
+            heapq.heappop(self.heap)
+            del self.members[minimum_key]
+            self.members[key] = score
+        heapq.heappush(self.heap, (score, key))
+        self._ranking = None
+        # Stale entries pile up as members grow; rebuild before the heap gets large
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(score, key) for key, score in self.members.items()]
+            heapq.heapify(self.heap)
+
+    def _minimum(self):
+        # Entries whose score is no longer the member's score are skipped
+        while self.members.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0]
+
+    def ranking(self):
+        """Members ordered by score, highest first."""
+        if self._ranking is None:
+            self._ranking = sorted(self.members, key=lambda key: (-self.members[key], key))
+        return self._ranking
+
+
+class SalesTracker:
+    """
+    Sale counts and revenue per combination of cut, clarity and lab, fed from the rows
+    appended to order_details.csv since the last update (tracked by a byte offset watermark).
+    Each grouping keeps a TopK per metric, so "top N sellers" is answered without sorting.
+
+    With half_life_days set, sales fade: a sale counts half as much after one half-life.
+    Scores use forward decay (each sale weighted by 2 ** (t / half_life) against a fixed
+    epoch), so old scores never need updating and rankings stay comparable over time.
+    Orders files without an order time column are stamped with the time they are read.
+    """
+
+    def __init__(self, orders_file='order_details.csv', state_file='sales_state.json',
+                 dimensions=SALES_DIMENSIONS, half_life_days=None, top_k=TOP_K, time_column='order_time'):
+        self.orders_file = orders_file
+        self.state_file = state_file
+        self.dimensions = list(dimensions)
+        self.half_life = half_life_days * 86400 if half_life_days else None
+        self.top_k = top_k
+        self.time_column = time_column
+        self.groupings = [grouping for size in range(1, len(self.dimensions) + 1)
+                          for grouping in itertools.combinations(self.dimensions, size)]
+        self.totals = {grouping: {} for grouping in self.groupings}
+        self.epoch = time.time()
+        self.orders_offset = 0
+        self.orders_header = None
+        self._load_state()
+
+    def _load_state(self):
+        if self.state_file is None or not os.path.exists(self.state_file):
+            self._rank_all()
+            return
+        with open(self.state_file, 'r') as state_file:
+            state = json.load(state_file)
+        if state['dimensions'] != self.dimensions or state['half_life'] != self.half_life:
+            # Tracked differently before; count the order history again
+            self._rank_all()
+            return
+        for grouping in self.groupings:
+            self.totals[grouping] = {tuple(key): [count, revenue]
+                                     for key, count, revenue in state['totals'][','.join(grouping)]}
+        self.epoch = state['epoch']
+        self.orders_offset = state['orders_offset']
+        self.orders_header = state['orders_header']
+        self._rank_all()
+
+    def save_state(self):
+        if self.state_file is None:
+            return
+        state = {
+            'dimensions': self.dimensions,
+            'half_life': self.half_life,
+            'totals': {','.join(grouping): [[list(key), count, revenue] for key, (count, revenue) in totals.items()]
+                       for grouping, totals in self.totals.items()},
+            'epoch': self.epoch,
+            'orders_offset': self.orders_offset,
+            'orders_header': self.orders_header,
+        }
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_file)
+
+    def _rank_all(self):
+        self.rankings = {(grouping, metric): TopK(self.top_k) for grouping in self.groupings for metric in METRICS}
+        for grouping, totals in self.totals.items():
+            for key, values in totals.items():
+                for slot, metric in enumerate(METRICS):
+                    self.rankings[grouping, metric].offer(key, values[slot])
+
+    @metrics.timed('sales_update')
+    def update(self):
+        """Take in the orders appended since the last update."""
+        if not os.path.exists(self.orders_file):
+            return
+        if os.path.getsize(self.orders_file) < self.orders_offset:
+            # The order file was replaced or truncated; start over
+            self.totals = {grouping: {} for grouping in self.groupings}
+            self.orders_offset = 0
+            self.orders_header = None
+            self._rank_all()
+        for lines, offset in iter_appended_lines(self.orders_file, self.orders_offset):
+            if self.orders_header is None:
+                header_end = lines.index(b'\n') + 1
+                self.orders_header = lines[:header_end].decode('utf-8')
+                lines = lines[header_end:]
+            if lines.strip():
+                self.record(pd.read_csv(io.BytesIO(self.orders_header.encode('utf-8') + lines)))
+            self.orders_offset = offset
+        self.save_state()
+
+    def _weight(self, when):
+        if self.half_life is None:
+            return 1.0
+        return 2.0 ** ((when - self.epoch) / self.half_life)
+
+    def record(self, orders, when=None):
+        """Count sold stones, one row each; the sale time comes from the time column, else when or now."""
+        if orders.empty:
+            return
+        now = time.time() if when is None else when
+        if self.half_life is not None:
+            self._move_epoch(now)
+        if self.time_column in orders.columns:
+            times = pd.to_datetime(orders[self.time_column], errors='coerce', utc=True)
+            times = (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().fillna(now)
+        else:
+            times = pd.Series(now, index=orders.index)
+        if 'total_sales_price' in orders.columns:
+            prices = pd.to_numeric(orders['total_sales_price'], errors='coerce')
+        else:
+            prices = pd.Series(0.0, index=orders.index)
+        frame = pd.DataFrame({column: orders[column].astype(str) for column in self.dimensions if column in orders.columns})
+        if len(frame.columns) < len(self.dimensions):
+            raise ValueError(f"Orders need the columns {', '.join(self.dimensions)}")
+        frame['weight'] = 1.0 if self.half_life is None else np.exp2((times - self.epoch) / self.half_life)
+        frame['revenue'] = prices.fillna(0) * frame['weight']
+
+        for grouping in self.groupings:
+            sums = frame.groupby(list(grouping), sort=False)[['weight', 'revenue']].sum()
+            totals = self.totals[grouping]
+            for key, (count, revenue) in zip(sums.index, sums.to_numpy()):
+                key = key if isinstance(key, tuple) else (key,)
+                values = totals.setdefault(key, [0.0, 0.0])
+                values[0] += float(count)
+                values[1] += float(revenue)
+                self.rankings[grouping, 'count'].offer(key, values[0])
+                self.rankings[grouping, 'revenue'].offer(key, values[1])
+
+    def _move_epoch(self, now):
+        # Rescaling every score by the same factor keeps every ranking as it is
+        half_lives = math.floor((now - self.epoch) / self.half_life)
+        if half_lives < _MAX_EPOCH_HALF_LIVES:
+            return
+        factor = 2.0 ** -half_lives
+        for totals in self.totals.values():
+            for values in totals.values():
+                values[0] *= factor
+                values[1] *= factor
+        self.epoch += half_lives * self.half_life
+        self._rank_all()
+
+    @metrics.timed('sales_top')
+    def top(self, n=5, by=None, metric='count', now=None):
+        """
+        Return the n best sellers grouped by some of the dimensions (default all of them),
+        ranked by sale count or revenue, as a DataFrame with sold and revenue columns.
+        With decay, sold and revenue are the decayed values as of now.
+        """
+        by = [by] if isinstance(by, str) else list(by or self.dimensions)
+        grouping = tuple(column for column in self.dimensions if column in by)
+        if not grouping or len(grouping) != len(set(by)):
+            raise ValueError(f"Can only group by {', '.join(self.dimensions)}")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}")
+        totals = self.totals[grouping]
+        if n <= self.top_k:
+            keys = self.rankings[grouping, metric].ranking()[:n]
+        else:
+            slot = METRICS.index(metric)
+            keys = sorted(totals, key=lambda key: (-totals[key][slot], key))[:n]
+
+        scale = 1.0 if self.half_life is None else self._weight(time.time() if now is None else now) ** -1
+        rows = [(*key, totals[key][0] * scale, totals[key][1] * scale) for key in keys]
+        return pd.DataFrame(rows, columns=[*grouping, 'sold', 'revenue'])
+
+
+if __name__ == "__main__":
+    tracker = SalesTracker()
+    tracker.update()
+    print("\n--- Top Sellers by Cut, Clarity and Lab ---")
+    print(tracker.top(10))
@@ -0,0 +1,162 @@
+import metrics
+import numpy as np
+import pandas as pd
+from catalog_index import normalize
+
+# Grades from best to worst; a stone's feature is its rank on the scale
+ORDINAL_SCALES = {
+    'clarity': ['FL', 'IF', 'VVS1', 'VVS2', 'VS1', 'VS2', 'SI1', 'SI2', 'I1', 'I2', 'I3'],
+    'color': list('DEFGHIJKLMNOPQRSTUVWXYZ'),
+    'cut_quality': ['Ideal', 'Excellent', 'Very Good', 'Good', 'Fair', 'Poor'],
+    'polish': ['Excellent', 'Very Good', 'Good', 'Fair', 'Poor'],
+}
+
+# Columns that either match or not; a mismatch adds its weight to the distance
+NOMINAL_COLUMNS = ['cut', 'lab']
+
+# Relative importance of each attribute; features are standardized, so weights are comparable
+DEFAULT_WEIGHTS = {
+    'carat': 4.0,
+    'total_sales_price': 2.0,
+    'clarity': 1.0,
+    'color': 1.0,
+    'cut_quality': 0.5,
+    'polish': 0.5,
+    'cut': 3.0,
+    'lab': 0.5,
+}
+
+# Rows scored per step, bounding the temporary arrays of a query
+BATCH_ROWS = 1 << 16
+
+
+def _lowered_codes(series):
+    """Integer codes and the normalized values they stand for; categoricals skip the per-row strings."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = pd.Categorical(series)
+    else:
+        series = series.array
+    return np.asarray(series.codes), [normalize(value) for value in series.categories]
+
+
+def _carat_column(df):
+    return 'carat_weight' if 'carat_weight' in df.columns else 'carat'
+
+
+class SimilarityIndex:
+    """
+    Nearest-neighbour search over the catalog for "closest alternative" recommendations.
+    Stones are encoded once as rows of a contiguous float32 matrix (carat, log price and the
+    ordinal grades, each standardized), plus integer codes for cut and lab. A query is a
+    weighted squared distance computed in vectorized batches and a partial sort for the top k,
+    so weights can change per query without rebuilding anything.
+    """
+
+    def __init__(self, df):
+        self.size = len(df)
+        columns = {'carat': _carat_column(df)}
+        columns.update({name: name for name in ['total_sales_price', *ORDINAL_SCALES]})
+        self.features = [name for name, column in columns.items() if column in df.columns]
+        self.mean = np.zeros(len(self.features))
+        self.scale = np.ones(len(self.features))
+        self.matrix = np.empty((self.size, len(self.features)), dtype=np.float32)
+        for slot, name in enumerate(self.features):
+            values = self._raw(name, df[columns[name]])
+            present = values[~np.isnan(values)]
+            if len(present):
+                self.mean[slot] = present.mean()
+                self.scale[slot] = present.std() or 1.0
+            # Missing values sit at the mean, so they neither attract nor repel
+            self.matrix[:, slot] = np.nan_to_num((values - self.mean[slot]) / self.scale[slot])
+
+        self.codes = {}
+        self.categories = {}
+        for column in NOMINAL_COLUMNS:
+            if column in df.columns:
+                codes, values = _lowered_codes(df[column])
+                # Categories differing only in case or spacing share one code
+                unique = {value: code for code, value in enumerate(dict.fromkeys(values))}
+                remap = np.array([unique[value] for value in values] + [-1], dtype=np.int32)
+                self.codes[column] = remap[codes]
+                self.categories[column] = unique
+
+    @staticmethod
+    def _raw(name, series):
+        if name in ORDINAL_SCALES:
+            ranks = {normalize(grade): rank for rank, grade in enumerate(ORDINAL_SCALES[name])}
+            codes, values = _lowered_codes(series)
+            table = np.array([ranks.get(value, np.nan) for value in values] + [np.nan])
+            return table[codes]
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+        if name == 'total_sales_price':
+            # Price differences matter relative to the price
+            values = np.log1p(np.clip(values, 0, None))
+        return values
+
+    def encode(self, **attributes):
+        """
+        Return (vector, used) for a wanted stone: its standardized features and which of
+        them were given. carat_weight is accepted for carat; unknown grades are ignored.
+        """
+        if 'carat_weight' in attributes:
+            attributes.setdefault('carat', attributes.pop('carat_weight'))
+        vector = np.zeros(len(self.features))
+        used = np.zeros(len(self.features), dtype=bool)
+        for slot, name in enumerate(self.features):
+            value = attributes.get(name)
+            if value is None or value == '':
+                continue
+            raw = self._raw(name, pd.Series([value]))[0]
+            if not np.isnan(raw):
+                vector[slot] = (raw - self.mean[slot]) / self.scale[slot]
+                used[slot] = True
+        return vector, used
+
+    @metrics.timed('similarity_query')
+    def nearest(self, k=5, weights=None, exclude=None, **attributes):
+        """
+        Return (positions, distances) of the k stones closest to the given attributes, closest
+        first. weights override DEFAULT_WEIGHTS per attribute; exclude is a boolean mask over
+        catalog rows (e.g. sold stones) that are never returned.
+        """
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        vector, used = self.encode(**attributes)
+        slots = np.flatnonzero(used)
+        feature_weights = np.array([weights.get(self.features[slot], 0.0) for slot in slots], dtype=np.float32)
+        target = vector[slots].astype(np.float32)
+        mismatches = []
+        for column, codes in self.codes.items():
+            value = attributes.get(column)
+            if value is None or value == '' or not weights.get(column):
+                continue
+            # A value absent from the catalog mismatches every stone equally
+            mismatches.append((codes, self.categories[column].get(normalize(value), -2), weights[column]))
+
+        best_positions = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        for start in range(0, self.size, BATCH_ROWS):
+            stop = min(start + BATCH_ROWS, self.size)
+            difference = self.matrix[start:stop, slots] - target
+            distances = (difference * difference) @ feature_weights
+            for codes, code, weight in mismatches:
+                distances += weight * (codes[start:stop] != code)
+            if exclude is not None:
+                distances[exclude[start:stop]] = np.inf
+
+            # Keep only this batch's k best, merged with the best so far
+            if len(distances) > k:
+                keep = np.argpartition(distances, k - 1)[:k]
+            else:
+                keep = np.arange(len(distances))
+            best_positions = np.concatenate([best_positions, keep + start])
+            best_distances = np.concatenate([best_distances, distances[keep]])
+            if len(best_distances) > k:
+                keep = np.argpartition(best_distances, k - 1)[:k]
+                best_positions, best_distances = best_positions[keep], best_distances[keep]
+
+        found = np.isfinite(best_distances)
+        best_positions, best_distances = best_positions[found], best_distances[found]
+        order = np.lexsort((best_positions, best_distances))
+        return best_positions[order], np.sqrt(best_distances[order])
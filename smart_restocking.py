@@ -1,28 +1,213 @@
 
+import io
+import json
+import os
+
+import metrics
 import pandas as pd
+from catalog import load_catalog
+from parallel_agg import parallel_groupby
+from streaming import group_counts, iter_appended_lines, memory_limit_from_env
 
-# Load the data files
-diamonds_df = pd.read_csv('diamonds.csv')
-order_details_df = pd.read_csv('order_details.csv')
+# Flag low stock items (threshold can be customized; using 5 as default)
+LOW_STOCK_THRESHOLD = 5
 
-# Group the sales by color and clarity
-sales_summary = order_details_df.groupby(['cut', 'clarity']).size().reset_index(name='sold_quantity')
+# The stock change log next to the catalog is trimmed to its newer half past this size
+STOCK_LOG_BYTES = 256 * 1024
 
-# Merge sales summary with diamonds stock to understand the remaining stock
-diamonds_stock_summary = diamonds_df.groupby(['cut', 'clarity']).size().reset_index(name='stock_quantity')
 
-# Merge the sales summary with stock summary
-inventory_status = pd.merge(diamonds_stock_summary, sales_summary, on=['cut', 'clarity'], how='left')
+def catalog_version(file_path):
+    """Return [size, mtime_ns] of the catalog file, or None if it does not exist."""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
 
-# Fill NaN values in sold_quantity with 0 (no sales for that category)
-inventory_status['sold_quantity'] = inventory_status['sold_quantity'].fillna(0)
 
-# Calculate remaining stock
-inventory_status['remaining_stock'] = inventory_status['stock_quantity'] - inventory_status['sold_quantity']
+def stock_log_path(diamonds_file):
+    return diamonds_file + '.stock_changes'
 
-# Flag low stock items (threshold can be customized; using 5 as default)
-low_stock_threshold = 5
-inventory_status['low_stock'] = inventory_status['remaining_stock'] < low_stock_threshold
 
-# Save the results to a new CSV file
-inventory_status.to_csv('inventory_status.csv', index=False)
+def record_stock_changes(diamonds_file, before, changes):
+    """
+    Log how a write to the catalog changed its per-(cut, clarity) row counts.
+    before is the catalog_version() from just before the write and changes maps
+    (cut, clarity) -> delta; RestockingEngine follows the chain of logged versions
+    instead of recounting the catalog.
+    """
+    entry = {'before': before, 'after': catalog_version(diamonds_file),
+             'changes': [[cut, clarity, delta] for (cut, clarity), delta in changes.items() if delta]}
+    path = stock_log_path(diamonds_file)
+    if os.path.exists(path) and os.path.getsize(path) > STOCK_LOG_BYTES:
+        # An engine further behind than the kept half recounts the catalog
+        with open(path, 'r') as log_file:
+            lines = log_file.readlines()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as log_file:
+            log_file.writelines(lines[len(lines) // 2:])
+        os.replace(temp_path, path)
+    with open(path, 'a') as log_file:
+        log_file.write(json.dumps(entry) + '\n')
+
+
+class RestockingEngine:
+    """
+    Keeps running per-(cut, clarity) stock and sold counters.
+    Only orders appended since the last run are read (tracked by a byte offset watermark).
+    Stock follows the changes Inventory logs with each catalog write (record_stock_changes);
+    the catalog is recounted only when it changed without a logged write.
+    """
+
+    def __init__(self, diamonds_file='diamonds.csv', orders_file='order_details.csv',
+                 state_file='restocking_state.json', low_stock_threshold=LOW_STOCK_THRESHOLD, memory_limit=None):
+        self.diamonds_file = diamonds_file
+        self.memory_limit = memory_limit
+        self.orders_file = orders_file
+        self.state_file = state_file
+        self.low_stock_threshold = low_stock_threshold
+        self.stock = {}
+        self.sold = {}
+        self.catalog_version = None
+        self.orders_offset = 0
+        self.orders_header = None
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r') as state_file:
+            state = json.load(state_file)
+        self.stock = {(cut, clarity): count for cut, clarity, count in state['stock']}
+        self.sold = {(cut, clarity): count for cut, clarity, count in state['sold']}
+        self.catalog_version = state['catalog_version']
+        self.orders_offset = state['orders_offset']
+        self.orders_header = state['orders_header']
+
+    def save_state(self):
+        state = {
+            'stock': [[cut, clarity, count] for (cut, clarity), count in self.stock.items()],
+            'sold': [[cut, clarity, count] for (cut, clarity), count in self.sold.items()],
+            'catalog_version': self.catalog_version,
+            'orders_offset': self.orders_offset,
+            'orders_header': self.orders_header,
+        }
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_file)
+
+    @metrics.timed('restocking_update')
+    def update(self):
+        """Bring the counters up to date with the catalog and any newly appended orders."""
+        self._update_stock()
+        self._update_sold()
+        self.save_state()
+
+    def _update_stock(self):
+        version = catalog_version(self.diamonds_file)
+        if version == self.catalog_version or self._apply_stock_changes(version):
+            return
+        # Fallback: the catalog changed in a way the log does not cover
+        if self.memory_limit:
+            counts = group_counts(self.diamonds_file, ['cut', 'clarity'], self.memory_limit)
+        else:
+            diamonds_df = load_catalog(self.diamonds_file)
+            counts = parallel_groupby(diamonds_df, ['cut', 'clarity'])
+            counts = counts.set_index(['cut', 'clarity'])['count']
+        self.stock = {(str(cut), str(clarity)): int(count) for (cut, clarity), count in counts.items()}
+        self.catalog_version = version
+
+    def _apply_stock_changes(self, version):
+        """Follow the logged catalog writes from the counted version to version; False if a write is missing."""
+        if self.catalog_version is None:
+            return False
+        try:
+            with open(stock_log_path(self.diamonds_file), 'r') as log_file:
+                lines = log_file.readlines()
+        except FileNotFoundError:
+            return False
+        writes = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry['before'] is not None:
+                writes[tuple(entry['before'])] = entry
+
+        stock = dict(self.stock)
+        current = self.catalog_version
+        while current != version:
+            entry = writes.pop(tuple(current), None)
+            if entry is None:
+                return False
+            for cut, clarity, delta in entry['changes']:
+                count = stock.get((cut, clarity), 0) + delta
+                if count:
+                    stock[(cut, clarity)] = count
+                else:
+                    stock.pop((cut, clarity), None)
+            current = entry['after']
+        self.stock = stock
+        self.catalog_version = version
+        return True
+
+    def _update_sold(self):
+        if not os.path.exists(self.orders_file):
+            return
+        size = os.path.getsize(self.orders_file)
+        if size < self.orders_offset:
+            # The order file was replaced or truncated; start over
+            self.sold = {}
+            self.orders_offset = 0
+            self.orders_header = None
+
+        # With a memory ceiling the new orders are read in bounded blocks
+        block_size = self.memory_limit // 4 if self.memory_limit else -1
+        # Only whole lines are processed; a partially written last line waits for the next run
+        for lines, offset in iter_appended_lines(self.orders_file, self.orders_offset, block_size):
+            self._count_orders(lines)
+            self.orders_offset = offset
+
+    def _count_orders(self, lines):
+        if self.orders_header is None:
+            header_end = lines.index(b'\n') + 1
+            self.orders_header = lines[:header_end].decode('utf-8')
+            lines = lines[header_end:]
+        if not lines.strip():
+            return
+        new_orders = pd.read_csv(io.BytesIO(self.orders_header.encode('utf-8') + lines))
+        counts = new_orders.groupby(['cut', 'clarity']).size()
+        for (cut, clarity), count in counts.items():
+            key = (str(cut), str(clarity))
+            self.sold[key] = self.sold.get(key, 0) + int(count)
+
+    @metrics.timed('restocking_report')
+    def report(self):
+        """Return the inventory status table, one row per (cut, clarity) in stock."""
+        keys = sorted(self.stock)
+        inventory_status = pd.DataFrame({
+            'cut': [cut for cut, _ in keys],
+            'clarity': [clarity for _, clarity in keys],
+            'stock_quantity': [self.stock[key] for key in keys],
+            'sold_quantity': [float(self.sold.get(key, 0)) for key in keys],
+        })
+
+        # Calculate remaining stock
+        inventory_status['remaining_stock'] = inventory_status['stock_quantity'] - inventory_status['sold_quantity']
+        inventory_status['low_stock'] = inventory_status['remaining_stock'] < self.low_stock_threshold
+        return inventory_status
+
+    def low_stock(self):
+        """Return only the rows flagged as low on stock."""
+        inventory_status = self.report()
+        return inventory_status[inventory_status['low_stock']]
+
+
+if __name__ == "__main__":
+    engine = RestockingEngine(memory_limit=memory_limit_from_env())
+    engine.update()
+
+    # Save the results to a new CSV file
+    engine.report().to_csv('inventory_status.csv', index=False)
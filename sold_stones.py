@@ -0,0 +1,108 @@
+import json
+import os
+
+import numpy as np
+
+# Sold stones held in the in-memory buffer before they are merged into a new base file
+COMPACT_AT = 65536
+
+
+def _merge(values, new_values):
+    """Merge sorted, disjoint int64 arrays without sorting the result again."""
+    return np.insert(values, np.searchsorted(values, new_values), new_values)
+
+
+class SoldStoneSet:
+    """
+    Membership set of sold stock IDs, kept compact for millions of sales.
+    Stones sold up to a cursor (the order database's sale sequence) sit in a sorted int64
+    array saved as .npy and memory-mapped on load, so opening the set costs the same at any
+    size. Later sales go to a small append buffer, caught up from the order database on load
+    and merged into a new base file once it passes COMPACT_AT. Lookups are binary searches.
+    """
+
+    def __init__(self, directory='sold_stones.idx', order_service=None, compact_at=COMPACT_AT):
+        self.directory = directory
+        self.order_service = order_service
+        self.compact_at = compact_at
+        self.base = np.empty(0, dtype=np.int64)
+        self.base_file = None
+        self.cursor = 0
+        self._load()
+        self.buffer = np.empty(0, dtype=np.int64)
+        self.update()
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _load(self):
+        try:
+            with open(self._path('state.json'), 'r') as state_file:
+                state = json.load(state_file)
+            base = np.load(self._path(state['base']), mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            # No set yet, or it was removed; the order database has every sale
+            return
+        self.base = base
+        self.base_file = state['base']
+        self.cursor = state['cursor']
+
+    def update(self):
+        """Take in the sales recorded in the order database since the cursor; returns the newly sold stock IDs."""
+        if self.order_service is None:
+            return np.empty(0, dtype=np.int64)
+        self.cursor, sold_ids = self.order_service.sold_since(self.cursor)
+        return self.add(sold_ids)
+
+    def add(self, stock_ids):
+        """Mark stones sold; returns the stock IDs that were not sold already."""
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        if not len(stock_ids):
+            return stock_ids
+        stock_ids = np.sort(stock_ids[~self.contains_many(stock_ids)])
+        # Drop repeats within the batch
+        stock_ids = stock_ids[np.diff(stock_ids, prepend=stock_ids[:1] - 1) != 0]
+        self.buffer = _merge(self.buffer, stock_ids)
+        if len(self.buffer) >= self.compact_at:
+            self.compact()
+        return stock_ids
+
+    def compact(self):
+        """Merge the buffer into a new base file and point the saved state at it."""
+        os.makedirs(self.directory, exist_ok=True)
+        merged = _merge(self.base, self.buffer)
+        # Named by cursor and size, so a new base never overwrites one another process has mapped
+        file_name = f'base.{self.cursor}.{len(merged)}.npy'
+        if file_name != self.base_file:
+            temp_path = self._path(file_name + '.tmp')
+            with open(temp_path, 'wb') as base_file:
+                np.save(base_file, merged, allow_pickle=False)
+            os.replace(temp_path, self._path(file_name))
+            temp_path = self._path('state.json.tmp')
+            with open(temp_path, 'w') as state_file:
+                json.dump({'base': file_name, 'cursor': self.cursor}, state_file)
+            os.replace(temp_path, self._path('state.json'))
+            if self.base_file is not None:
+                try:
+                    os.remove(self._path(self.base_file))
+                except OSError:
+                    pass
+        self.base = np.load(self._path(file_name), mmap_mode='r')
+        self.base_file = file_name
+        self.buffer = np.empty(0, dtype=np.int64)
+
+    def contains_many(self, stock_ids):
+        """Boolean array telling which of the stock IDs are sold."""
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        found = np.zeros(len(stock_ids), dtype=bool)
+        for values in (self.base, self.buffer):
+            if len(values):
+                slots = np.minimum(np.searchsorted(values, stock_ids), len(values) - 1)
+                found |= values[slots] == stock_ids
+        return found
+
+    def __contains__(self, stock_id):
+        return bool(self.contains_many([stock_id])[0])
+
+    def __len__(self):
+        return len(self.base) + len(self.buffer)
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Run in a fresh interpreter so nothing is imported or cached in memory beforehand
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+marks = {}
+import tkinter as tk
+module = __import__(sys.argv[1])
+marks['import'] = time.perf_counter() - start
+system = module.DiamondRecommendationSystem(sys.argv[2], background=True)
+marks['system'] = time.perf_counter() - start
+try:
+    root = tk.Tk()
+except tk.TclError:
+    root = None
+if root is not None:
+    # The order window opens its order database with the first order, so none is created here
+    gui = module.DiamondOrderGUI(root, system) if sys.argv[1] == 'order' else module.DiamondGUI(root, system)
+    root.update()
+    marks['first_window'] = time.perf_counter() - start
+system.df
+marks['catalog_ready'] = time.perf_counter() - start
+if root is not None:
+    root.destroy()
+print(json.dumps(marks))
+'''
+
+
+def measure(module='order', file_path='diamonds.csv'):
+    """Time one cold start of a GUI entry point; returns seconds to each milestone."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', _PROBE, module, file_path],
+                            check=True, stdout=subprocess.PIPE, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(module='order', file_path='diamonds.csv', runs=5, history_file='startup_times.jsonl'):
+    """
+    Time several cold starts and append the medians to history_file, so regressions in
+    time-to-first-window show up run over run. first_window is left out without a display.
+    """
+    samples = [measure(module, file_path) for _ in range(runs)]
+    medians = {mark: sorted(sample[mark] for sample in samples)[len(samples) // 2] for mark in samples[0]}
+    record = {'time': time.time(), 'module': module, 'runs': runs, **{mark: round(value, 4) for mark, value in medians.items()}}
+    with open(history_file, 'a') as history:
+        history.write(json.dumps(record) + '\n')
+    for mark, value in medians.items():
+        print(f"{mark:>14}: {value * 1000:8.1f} ms")
+    return medians
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:2])
@@ -0,0 +1,86 @@
+import os
+
+import metrics
+import pandas as pd
+from catalog import _with_current_prices, current_prices_path
+
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Parsed chunks take several times their final size while pandas builds them
+_PARSE_OVERHEAD = 4
+
+
+def parse_size(text):
+    """Parse a size such as '512M', '2G' or '1048576' into bytes."""
+    text = str(text).strip().upper()
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def memory_limit_from_env():
+    """
+    Return the memory ceiling set in DIAMONDS_MEMORY_LIMIT, or None.
+    When it is set, the analytics, restocking and price tools stream the catalog in chunks.
+    """
+    value = os.environ.get('DIAMONDS_MEMORY_LIMIT')
+    return parse_size(value) if value else None
+
+
+def estimate_chunk_rows(file_path, memory_limit=DEFAULT_MEMORY_LIMIT, sample_rows=1000):
+    """Return how many rows fit in one chunk under the memory ceiling."""
+    sample = pd.read_csv(file_path, nrows=sample_rows)
+    if sample.empty:
+        return sample_rows
+    row_bytes = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    return max(100, int(memory_limit / (row_bytes * _PARSE_OVERHEAD)))
+
+
+def iter_chunks(file_path, memory_limit=DEFAULT_MEMORY_LIMIT, **read_csv_kwargs):
+    """Yield the file as DataFrames small enough to stay under the memory ceiling."""
+    chunksize = estimate_chunk_rows(file_path, memory_limit)
+    # Versioned prices are looked up by stock ID, so the ID column is read along with the price
+    usecols = read_csv_kwargs.get('usecols')
+    drop_stock_id = usecols is not None and 'total_sales_price' in usecols and 'stock_id' not in usecols
+    if drop_stock_id and os.path.exists(current_prices_path(file_path)):
+        read_csv_kwargs['usecols'] = list(usecols) + ['stock_id']
+    else:
+        drop_stock_id = False
+    with pd.read_csv(file_path, chunksize=chunksize, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            if 'total_sales_price' in chunk.columns:
+                chunk = _with_current_prices(chunk, file_path)
+            if drop_stock_id:
+                chunk = chunk.drop(columns='stock_id')
+            metrics.increment('rows_loaded', len(chunk), source='stream')
+            yield chunk
+
+
+def iter_appended_lines(file_path, offset=0, block_size=-1):
+    """
+    Yield (lines, end_offset) for the whole lines written to a file after offset, in blocks
+    of about block_size bytes (-1 reads everything at once). A partially written last line
+    is left for the next call.
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        carry = b''
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            block = carry + block
+            end = block.rfind(b'\n') + 1
+            carry = block[end:]
+            if end:
+                offset += end
+                yield block[:end], offset
+
+
+def group_counts(file_path, keys, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Return groupby(keys).size() for the whole file, combined from per-chunk counts."""
+    partials = [chunk.groupby(keys).size() for chunk in iter_chunks(file_path, memory_limit, usecols=keys)]
+    if not partials:
+        return pd.Series(dtype='int64')
+    return pd.concat(partials).groupby(level=list(range(len(keys)))).sum()
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# Rows generated per block; every block has its own seeded generator, so a catalog is the
+# same whether it is built in memory or written block by block
+BLOCK_ROWS = 500_000
+
+# Attribute mix of a typical retail catalog, with each grade's price multiplier
+CUTS = {'Round': 0.45, 'Oval': 0.12, 'Princess': 0.08, 'Cushion': 0.08, 'Emerald': 0.07,
+        'Pear': 0.07, 'Radiant': 0.05, 'Marquise': 0.04, 'Heart': 0.04}
+COLORS = {'D': (0.08, 1.45), 'E': (0.13, 1.35), 'F': (0.16, 1.25), 'G': (0.20, 1.15),
+          'H': (0.17, 1.05), 'I': (0.13, 0.95), 'J': (0.09, 0.85), 'K': (0.04, 0.75)}
+CLARITIES = {'IF': (0.03, 1.60), 'VVS1': (0.07, 1.40), 'VVS2': (0.10, 1.30), 'VS1': (0.18, 1.15),
+             'VS2': (0.22, 1.05), 'SI1': (0.22, 0.95), 'SI2': (0.14, 0.85), 'I1': (0.04, 0.60)}
+CUT_QUALITIES = {'Ideal': (0.35, 1.10), 'Excellent': (0.35, 1.05), 'Very Good': (0.20, 0.97), 'Good': (0.10, 0.90)}
+POLISHES = {'Excellent': 0.60, 'Very Good': 0.30, 'Good': 0.10}
+LABS = {'GIA': 0.60, 'IGI': 0.30, 'HRD': 0.10}
+
+# Weights buyers ask for; a share of stones is cut to just reach one of them
+POPULAR_CARATS = np.array([0.30, 0.50, 0.70, 0.90, 1.00, 1.50, 2.00, 3.00])
+
+CATALOG_COLUMNS = ['stock_id', 'cut', 'color', 'clarity', 'carat_weight', 'cut_quality', 'lab', 'polish',
+                   'total_sales_price']
+
+# Layout of order_details.csv as written by order.py
+ORDER_COLUMNS = ['stock_id', 'cut', 'carat', 'clarity', 'cut_quality', 'lab', 'total_sales_price', 'Customer Name']
+
+
+def _choice(rng, table, size):
+    """Draw values from {value: probability} or {value: (probability, multiplier)}."""
+    values = list(table)
+    weights = np.array([entry[0] if isinstance(entry, tuple) else entry for entry in table.values()])
+    codes = rng.choice(len(values), size, p=weights / weights.sum())
+    return codes, values
+
+
+def _categorical(codes, values):
+    return pd.Categorical.from_codes(codes, values)
+
+
+def catalog_block(start, stop, seed=0):
+    """Rows [start, stop) of the synthetic catalog for a seed."""
+    rng = np.random.default_rng([seed, start // BLOCK_ROWS])
+    size = stop - start
+
+    carats = np.exp(rng.normal(np.log(0.7), 0.55, size))
+    popular = rng.random(size) < 0.3
+    # Just over a popular weight, never under it
+    nearest = POPULAR_CARATS[np.clip(np.searchsorted(POPULAR_CARATS, carats), 0, len(POPULAR_CARATS) - 1)]
+    carats[popular] = nearest[popular] + rng.integers(0, 3, popular.sum()) / 100
+    carats = np.clip(np.round(carats, 2), 0.23, 10.0)
+
+    cut_codes, cuts = _choice(rng, CUTS, size)
+    color_codes, colors = _choice(rng, COLORS, size)
+    clarity_codes, clarities = _choice(rng, CLARITIES, size)
+    quality_codes, qualities = _choice(rng, CUT_QUALITIES, size)
+    polish_codes, polishes = _choice(rng, POLISHES, size)
+    lab_codes, labs = _choice(rng, LABS, size)
+
+    multiplier = (np.array([entry[1] for entry in COLORS.values()])[color_codes]
+                  * np.array([entry[1] for entry in CLARITIES.values()])[clarity_codes]
+                  * np.array([entry[1] for entry in CUT_QUALITIES.values()])[quality_codes])
+    prices = np.round(3800 * carats ** 1.9 * multiplier * np.exp(rng.normal(0, 0.15, size)))
+
+    # Unique, non-sequential ten digit stock IDs
+    stock_ids = 6_000_000_000 + np.arange(start, stop, dtype=np.int64) * 97 + rng.integers(0, 97, size)
+
+    return pd.DataFrame({
+        'stock_id': stock_ids,
+        'cut': _categorical(cut_codes, cuts),
+        'color': _categorical(color_codes, colors),
+        'clarity': _categorical(clarity_codes, clarities),
+        'carat_weight': carats,
+        'cut_quality': _categorical(quality_codes, qualities),
+        'lab': _categorical(lab_codes, labs),
+        'polish': _categorical(polish_codes, polishes),
+        'total_sales_price': prices.astype(np.int64),
+    }, index=pd.RangeIndex(start, stop))
+
+
+def _blocks(rows):
+    for start in range(0, rows, BLOCK_ROWS):
+        yield start, min(start + BLOCK_ROWS, rows)
+
+
+def generate_catalog(rows, seed=0):
+    """A synthetic catalog with the diamonds.csv schema, the same for the same rows and seed."""
+    if rows == 0:
+        return catalog_block(0, 0, seed)
+    return pd.concat([catalog_block(start, stop, seed) for start, stop in _blocks(rows)])
+
+
+def write_catalog(file_path, rows, seed=0):
+    """Write a synthetic catalog as CSV, one block at a time so memory stays bounded at any size."""
+    with open(file_path, 'w', newline='') as output:
+        header = True
+        for start, stop in _blocks(rows):
+            catalog_block(start, stop, seed).to_csv(output, index=False, header=header)
+            header = False
+        if header:
+            catalog_block(0, 0, seed).to_csv(output, index=False)
+
+
+def _sold_rows(blocks, rows, seed):
+    """
+    A weighted sample of rows stones without replacement, drawn block by block: each stone
+    gets an exponential key divided by its weight and the smallest keys win. Popular cuts
+    and weights sell more often than their share of the catalog.
+    """
+    pool, pool_keys = [], []
+    for number, block in enumerate(blocks):
+        rng = np.random.default_rng([seed, 1, number])
+        weights = np.where(block['cut'].astype(str).to_numpy() == 'Round', 2.0, 1.0)
+        weights *= np.where(np.isin(block['carat_weight'].to_numpy(), POPULAR_CARATS), 1.5, 1.0)
+        keys = rng.exponential(size=len(block)) / weights
+        keep = np.argpartition(keys, rows - 1)[:rows] if len(keys) > rows else np.arange(len(keys))
+        pool.append(block.iloc[keep])
+        pool_keys.append(keys[keep])
+    pool = pd.concat(pool)
+    keys = np.concatenate(pool_keys)
+    best = np.argpartition(keys, rows - 1)[:rows] if len(keys) > rows else np.arange(len(keys))
+    return pool.iloc[best].sort_index()
+
+
+def _order_rows(sold, seed, customers):
+    rng = np.random.default_rng([seed, 2])
+    orders = sold.rename(columns={'carat_weight': 'carat'})[ORDER_COLUMNS[:-1]].reset_index(drop=True)
+    orders['Customer Name'] = [f'Customer {number}' for number in rng.integers(0, customers, len(orders))]
+    return orders
+
+
+def generate_orders(catalog, rows, seed=0, customers=500):
+    """rows sold stones of a catalog in the order_details.csv layout, each stone sold once."""
+    rows = min(rows, len(catalog))
+    if rows == 0:
+        return pd.DataFrame(columns=ORDER_COLUMNS)
+    blocks = (catalog.iloc[start:stop] for start, stop in _blocks(len(catalog)))
+    return _order_rows(_sold_rows(blocks, rows, seed), seed, customers)
+
+
+def write_orders(file_path, catalog_rows, rows, seed=0, customers=500):
+    """
+    Write the order history of the synthetic catalog with catalog_rows stones and the same seed,
+    regenerating the catalog block by block instead of holding it in memory.
+    """
+    rows = min(rows, catalog_rows)
+    if rows == 0:
+        pd.DataFrame(columns=ORDER_COLUMNS).to_csv(file_path, index=False)
+        return
+    blocks = (catalog_block(start, stop, seed) for start, stop in _blocks(catalog_rows))
+    _order_rows(_sold_rows(blocks, rows, seed), seed, customers).to_csv(file_path, index=False)
+
+
+if __name__ == "__main__":
+    import sys
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    file_path = sys.argv[2] if len(sys.argv) > 2 else 'synthetic_diamonds.csv'
+    write_catalog(file_path, rows)
+    print(f"Wrote {rows} stones to {file_path}")
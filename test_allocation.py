@@ -0,0 +1,68 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from allocation import allocate
+from catalog import load_catalog
+
+
+@pytest.fixture
+def stones():
+    """Carats and prices of a few dozen candidate stones."""
+    rng = np.random.default_rng(5)
+    carats = rng.choice(np.arange(0.30, 2.00, 0.01), 40).round(2)
+    prices = (carats * rng.uniform(900, 2500, 40)).round(0)
+    return carats, prices
+
+
+def test_lowest_price_and_matched_carat(stones):
+    """Test the cheapest set and the set with the smallest carat spread."""
+    carats, prices = stones
+    chosen = allocate(carats, prices, 3, 'lowest_price')
+    assert sorted(prices[chosen]) == sorted(np.sort(prices)[:3])
+
+    chosen = allocate(carats, prices, 2, 'matched_carat')
+    best_spread = min(abs(a - b) for a, b in itertools.combinations(carats, 2))
+    assert np.ptp(carats[chosen]) == pytest.approx(best_spread)
+    assert list(allocate(carats, prices, 2, 'first')) == [0, 1], "First available keeps the catalog order."
+
+
+def test_target_carat_matches_brute_force(stones):
+    """Test that a target total carat is met at the lowest price on a small list."""
+    carats, prices = stones
+    target, tolerance = 3.0, 0.02
+    chosen = allocate(carats, prices, 3, 'target_carat', target, tolerance)
+    feasible = [prices[list(combination)].sum() for combination in itertools.combinations(range(len(carats)), 3)
+                if abs(carats[list(combination)].sum() - target) <= tolerance + 1e-9]
+    assert abs(carats[chosen].sum() - target) <= tolerance + 1e-9
+    assert prices[chosen].sum() == pytest.approx(min(feasible))
+    assert allocate(carats, prices, 3, 'target_carat', 50.0) is None, "An unreachable target has no allocation."
+
+
+def test_target_carat_large_candidate_list():
+    """Test the heuristic on tens of thousands of candidates."""
+    rng = np.random.default_rng(7)
+    carats = rng.choice(np.arange(0.30, 5.00, 0.01), 50000).round(2)
+    prices = carats * rng.uniform(800, 3000, 50000)
+    chosen = allocate(carats, prices, 6, 'target_carat', 9.0, 0.01)
+    assert len(set(chosen)) == 6
+    assert abs(carats[chosen].sum() - 9.0) <= 0.01 + 1e-9
+    # Cheaper than the obvious answer of the six cheapest 1.5 carat stones
+    one_and_a_half = np.flatnonzero(np.isclose(carats, 1.5))
+    assert prices[chosen].sum() <= np.sort(prices[one_and_a_half])[:6].sum()
+
+
+def test_exact_target_from_catalog(tmp_path):
+    """Test that carats read through the catalog snapshot add up to an exact target."""
+    path = tmp_path / 'diamonds.csv'
+    pd.DataFrame({'stock_id': [1, 2, 3, 4], 'carat_weight': [0.3, 0.5, 0.3, 0.7],
+                  'total_sales_price': [900, 1500, 1000, 2600]}).to_csv(path, index=False)
+    catalog = load_catalog(str(path))
+    chosen = allocate(catalog['carat_weight'], catalog['total_sales_price'], 2, 'target_carat', 0.6)
+    assert sorted(catalog['stock_id'].to_numpy()[chosen]) == [1, 3]
+    assert catalog['carat_weight'].to_numpy()[chosen].sum() == 0.6
+
+    # 0.1 + 0.2 is not exactly 0.3 in floating point; the search over a long list still accepts it
+    carats = np.r_[0.1, 0.2, np.full(400, 1.1)]
+    prices = np.r_[5000.0, 5000.0, np.full(400, 100.0)]
+    assert sorted(allocate(carats, prices, 2, 'target_carat', 0.3)) == [0, 1]
@@ -0,0 +1,158 @@
+import os
+
+import analytics_cube
+import pandas as pd
+import pytest
+from analytics_cube import AnalyticsCube
+from order_service import OrderService
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Catalog and cube state file in a temporary directory."""
+    diamonds = tmp_path / 'diamonds.csv'
+    pd.DataFrame({
+        'stock_id': [1, 2, 3, 4, 5, 6],
+        'cut': ['Round', 'Round', 'Round', 'Oval', 'Oval', 'Pear'],
+        'carat_weight': [0.3, 0.3, 0.5, 0.3, 1.0, 0.5],
+        'clarity': ['VS1', 'VS1', 'SI1', 'VS1', 'SI1', 'VS2'],
+        'color': ['D', 'E', 'D', 'F', 'G', 'D'],
+        'lab': ['GIA', 'GIA', 'IGI', 'GIA', 'IGI', 'GIA'],
+        'total_sales_price': [1000.0, 1500.0, 2500.0, 900.0, 6000.0, 1800.0],
+    }).to_csv(diamonds, index=False)
+    return str(diamonds), str(tmp_path / 'cube.json')
+
+
+def test_slices_match_catalog(files):
+    """Test single cells and breakdowns against the catalog."""
+    cube = AnalyticsCube(*files)
+    cube.update()
+    assert cube.cell()['count'] == 6
+    round_vs1 = cube.cell(cut='Round', clarity='VS1')
+    assert round_vs1['count'] == 2
+    assert round_vs1['min_price'] == 1000.0
+    assert round_vs1['mean_price'] == 1250.0
+    assert cube.cell(cut='Heart') is None
+
+    breakdown = cube.breakdown('carat_bucket', cut='Round')
+    assert list(breakdown['carat_bucket']) == [0.3, 0.5]
+    assert list(breakdown['count']) == [2, 1]
+
+
+def test_remove_updates_cells(files):
+    """Test that removing the cheapest stone updates counts and recomputes the minimum."""
+    diamonds, state = files
+    cube = AnalyticsCube(diamonds, state)
+    cube.update()
+    catalog = pd.read_csv(diamonds)
+    cube.remove(catalog[catalog['stock_id'] == 1])
+    assert cube.cell(cut='Round', clarity='VS1')['count'] == 1
+    assert cube.cell(cut='Round', clarity='VS1')['min_price'] == 1500.0
+    assert cube.cell(lab='GIA')['count'] == 3
+
+    cube.remove(catalog[catalog['stock_id'] == 6])
+    assert cube.cell(cut='Pear') is None
+    assert 'Pear' not in cube.values('cut')
+
+
+def test_state_is_reused(files):
+    """Test that a saved cube is reloaded, keeps removed stones out and is rebuilt when the catalog changes."""
+    diamonds, state = files
+    cube = AnalyticsCube(diamonds, state)
+    cube.update()
+    cube.remove(pd.read_csv(diamonds).head(1))
+    cube.save_state()
+
+    cube = AnalyticsCube(diamonds, state)
+    saved = os.stat(state).st_mtime_ns
+    cube.update()
+    assert cube.cell(cut='Round')['count'] == 2
+    # Nothing changed, so the state is not written again
+    assert os.stat(state).st_mtime_ns == saved
+
+    with open(diamonds, 'a') as file:
+        file.write('7,Round,0.3,VS1,D,GIA,1200.0\n')
+    cube = AnalyticsCube(diamonds, state)
+    cube.update()
+    assert cube.cell(cut='Round')['count'] == 3
+    assert cube.cell(cut='Round', carat_bucket=0.3)['count'] == 2
+
+
+def test_streaming_rebuild_matches(files):
+    """Test that the chunked rebuild produces the same cells."""
+    diamonds, state = files
+    in_memory = AnalyticsCube(diamonds, state)
+    in_memory.rebuild()
+    streamed = AnalyticsCube(diamonds, state + '.streamed', memory_limit=1024)
+    streamed.rebuild()
+    assert streamed.base == in_memory.base
+
+
+def test_removing_extremes_matches_rebuild(files, monkeypatch):
+    """Test that selling the cheapest and dearest stones updates every roll-up without reading the catalog."""
+    diamonds, state = files
+    cube = AnalyticsCube(diamonds, state)
+    cube.update()
+    catalog = pd.read_csv(diamonds)
+    monkeypatch.setattr(analytics_cube, 'load_catalog', None)
+    cube.remove(catalog[catalog['stock_id'].isin([4, 5])])
+    monkeypatch.undo()
+    assert cube.cell()['min_price'] == 1000.0
+    assert cube.cell(clarity='SI1')['max_price'] == 2500.0
+
+    fresh = AnalyticsCube(diamonds, state + '.fresh')
+    fresh.removed = {4, 5}
+    fresh.rebuild()
+    assert cube.cells.keys() == fresh.cells.keys()
+    for mask, cells in fresh.cells.items():
+        assert cube.cells[mask].keys() == cells.keys()
+        for key, values in cells.items():
+            assert cube.cells[mask][key] == pytest.approx(values)
+
+
+def test_sold_stones_stay_out_after_rebuild(files, tmp_path):
+    """Test that a rebuild takes sold stones from the order database instead of a saved list."""
+    diamonds, state = files
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    token, _ = service.reserve([1, 5], 2)
+    service.commit(token, 'Ada')
+    cube = AnalyticsCube(diamonds, state)
+    cube.update(service)
+    assert cube.cell()['count'] == 4 and not cube.removed
+
+    with open(diamonds, 'a') as file:
+        file.write('7,Round,0.3,VS1,D,GIA,1200.0\n')
+    cube.update(service)
+    assert cube.cell()['count'] == 5
+    assert cube.cell(cut='Oval')['max_price'] == 900.0
+    service.close()
+
+
+def test_price_sketch_is_bounded_and_refilled(tmp_path, monkeypatch):
+    """Test that cells keep a bounded price sketch and re-read the catalog once a side runs out."""
+    monkeypatch.setattr(analytics_cube, 'SKETCH_SIZE', 2)
+    diamonds = str(tmp_path / 'diamonds.csv')
+    pd.DataFrame({
+        'stock_id': [1, 2, 3, 4, 5, 6],
+        'cut': ['Round'] * 6,
+        'carat_weight': [0.3] * 6,
+        'clarity': ['VS1'] * 6,
+        'color': ['D'] * 6,
+        'lab': ['GIA'] * 6,
+        'total_sales_price': [100.0, 200.0, 300.0, 400.0, 500.0, 600.0],
+    }).to_csv(diamonds, index=False)
+    cube = AnalyticsCube(diamonds, str(tmp_path / 'cube.json'))
+    cube.update()
+    assert cube.extremes[('Round', 0.3, 'VS1', 'D', 'GIA')] == [[100.0, 200.0], [500.0, 600.0]]
+
+    catalog = pd.read_csv(diamonds)
+    cube.remove(catalog[catalog['stock_id'] == 1])
+    assert cube.cell()['min_price'] == 200.0
+    cube.remove(catalog[catalog['stock_id'] == 2])
+    assert cube.cell()['min_price'] == 300.0
+    assert cube.extremes[('Round', 0.3, 'VS1', 'D', 'GIA')][0] == [300.0, 400.0]
+
+    cube.add(pd.DataFrame({'stock_id': [7], 'cut': ['Round'], 'carat_weight': [0.3], 'clarity': ['VS1'],
+                           'color': ['D'], 'lab': ['GIA'], 'total_sales_price': [700.0]}))
+    assert cube.cell()['max_price'] == 700.0
+    assert cube.extremes[('Round', 0.3, 'VS1', 'D', 'GIA')] == [[300.0, 400.0], [600.0, 700.0]]
@@ -0,0 +1,28 @@
+import json
+import benchmark_suite
+from benchmark_suite import baseline_from, compare, main
+
+
+def test_suite_writes_results(tmp_path, monkeypatch):
+    """Test a small run end to end, then a regression against a faster baseline."""
+    output = tmp_path / 'results.json'
+    baseline = tmp_path / 'baseline.json'
+    arguments = ['--rows', '2000', '--repeat', '1', '--scenarios', 'load_warm', 'filter_diamonds', 'place_order',
+                 '--workdir', str(tmp_path / 'data'), '--output', str(output), '--baseline', str(baseline)]
+    assert main(arguments + ['--update-baseline']) == 0
+    results = json.loads(output.read_text())
+    assert set(results['results']['2000']) == {'load_warm', 'filter_diamonds', 'place_order'}
+    assert json.loads(baseline.read_text())['2000']['load_warm'] == results['results']['2000']['load_warm']['median']
+
+    monkeypatch.setattr(benchmark_suite, 'REGRESSION_FLOOR', 0.0)
+    baseline.write_text(json.dumps({'2000': {'place_order': 1e-9}}))
+    assert main(arguments) == 1
+    assert [regression['scenario'] for regression in json.loads(output.read_text())['regressions']] == ['place_order']
+
+
+def test_compare_ignores_noise():
+    """Test that small or sub-millisecond slowdowns are not flagged."""
+    results = {'results': {'10000': {'fast': {'median': 0.002}, 'steady': {'median': 1.1}, 'slow': {'median': 2.0}}}}
+    baseline = baseline_from({'results': {'10000': {'fast': {'median': 0.001}, 'steady': {'median': 1.0},
+                                                     'slow': {'median': 1.0}}}})
+    assert [regression['scenario'] for regression in compare(results, baseline)] == ['slow']
@@ -0,0 +1,75 @@
+import os
+import pandas as pd
+import pytest
+from catalog import load_catalog, snapshot_dir
+from catalog_domains import load_domains
+
+
+@pytest.fixture
+def diamonds_csv(tmp_path):
+    """Write a small diamonds file to a temporary directory."""
+    path = tmp_path / 'diamonds.csv'
+    pd.DataFrame({
+        'stock_id': [6900778016, 6246703285, 6460151818],
+        'cut': ['Round', 'Oval', 'Round'],
+        'carat_weight': [0.5, 1.0, 1.5],
+        'clarity': ['VS1', 'SI1', 'VS1'],
+        'lab': ['GIA', 'IGI', 'GIA'],
+        'total_sales_price': [1200, 3400, 5600],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_snapshot_types(diamonds_csv):
+    """Test that the snapshot narrows the catalog columns."""
+    df = load_catalog(diamonds_csv)
+    assert str(df['cut'].dtype) == 'category', "cut should be categorical."
+    assert df['carat_weight'].dtype == 'float64', "carat_weight should keep its exact decimal values."
+    assert df['stock_id'].dtype == 'int64', "stock_id should be int64."
+    assert list(df['stock_id']) == [6900778016, 6246703285, 6460151818]
+
+
+def test_snapshot_reused(diamonds_csv):
+    """Test that an unchanged file is served from the existing snapshot."""
+    load_catalog(diamonds_csv)
+    meta_path = os.path.join(snapshot_dir(diamonds_csv), 'meta.json')
+    built_at = os.stat(meta_path).st_mtime_ns
+    load_catalog(diamonds_csv)
+    assert os.stat(meta_path).st_mtime_ns == built_at, "Snapshot should not be rebuilt."
+
+
+def test_snapshot_rebuilt_on_change(diamonds_csv):
+    """Test that edits to the CSV are picked up."""
+    load_catalog(diamonds_csv)
+    df = pd.read_csv(diamonds_csv)
+    df.loc[0, 'total_sales_price'] = 999
+    df.to_csv(diamonds_csv, index=False)
+    assert load_catalog(diamonds_csv).loc[0, 'total_sales_price'] == 999
+
+
+def test_mapped_catalog_is_writable(diamonds_csv):
+    """Test that a memory-mapped catalog can be modified without touching the snapshot."""
+    load_catalog(diamonds_csv)
+    df = load_catalog(diamonds_csv)
+    df['total_sales_price'] = df['total_sales_price'] * 2
+    assert load_catalog(diamonds_csv).loc[0, 'total_sales_price'] == 1200
+
+
+def test_domains_sidecar(diamonds_csv):
+    """Test that dropdown values are saved with the snapshot and dropped when the CSV changes."""
+    assert load_domains(diamonds_csv) is None
+    load_catalog(diamonds_csv)
+    domains = load_domains(diamonds_csv)
+    assert domains['values']['cut'] == ['Oval', 'Round']
+    assert domains['values']['carat_weight'] == [0.5, 1.0, 1.5]
+    assert 'stock_id' in domains['columns']
+
+    with open(diamonds_csv, 'a') as file:
+        file.write('6000000001,Pear,0.3,SI2,IGI,800\n')
+    assert load_domains(diamonds_csv) is None
+
+
+def test_missing_file(tmp_path):
+    """Test that a missing file raises FileNotFoundError like pd.read_csv."""
+    with pytest.raises(FileNotFoundError):
+        load_catalog(str(tmp_path / 'missing.csv'))
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from catalog_index import CatalogIndex, StockIdIndex
+
+
+@pytest.fixture
+def diamonds():
+    """Small catalog with mixed-case values and float32 carats."""
+    return pd.DataFrame({
+        'cut': pd.Categorical(['Round', 'Oval', 'round', 'Round', 'Pear']),
+        'clarity': ['VS1', 'SI1', 'vs1', 'VS2', 'VS1'],
+        'carat': np.array([0.3, 0.5, 1.0, 0.3, 1.5], dtype=np.float32),
+    })
+
+
+def test_equality_is_case_insensitive(diamonds):
+    """Test that equality lookups ignore case on both sides."""
+    index = CatalogIndex(diamonds, ['cut', 'clarity'])
+    assert list(index.match(equals={'cut': 'ROUND', 'clarity': 'vs1'})) == [0, 2]
+
+
+def test_float32_range_matches_displayed_values(diamonds):
+    """Test that a range bound of 0.3 includes stones stored as float32 0.3."""
+    index = CatalogIndex(diamonds, ['cut'], range_columns=['carat'])
+    assert list(index.match(equals={'cut': 'Round'}, ranges={'carat': (0.3, 0.3)})) == [0, 3]
+
+
+def test_matches_boolean_mask(diamonds):
+    """Test that the index agrees with a plain pandas filter."""
+    index = CatalogIndex(diamonds, ['cut', 'clarity'], range_columns=['carat'])
+    expected = np.flatnonzero(
+        (diamonds['clarity'].str.lower() == 'vs1') & (diamonds['carat'] >= 0.5) & (diamonds['carat'] <= 1.5)
+    )
+    assert list(index.match(equals={'clarity': 'VS1'}, ranges={'carat': (0.5, 1.5)})) == list(expected)
+
+
+def test_facets_exclude_own_selection(diamonds):
+    """Test that each facet counts rows matching the other selections only."""
+    index = CatalogIndex(diamonds, ['cut', 'clarity'], range_columns=['carat'])
+    facets = index.facets(equals={'cut': 'round'}, ranges={'carat': (0.3, 0.5)})
+    assert facets['cut'] == [('Oval', 1), ('Round', 2)]
+    assert facets['clarity'] == [('VS1', 1), ('VS2', 1)]
+    assert facets['carat'] == [(0.3, 2), (1.0, 1)]
+
+    unfiltered = index.facets(columns=['cut'])
+    assert unfiltered == {'cut': [('Oval', 1), ('Pear', 1), ('Round', 3)]}
+
+
+def test_unknown_value(diamonds):
+    """Test that an unknown value matches nothing."""
+    index = CatalogIndex(diamonds, ['cut'])
+    assert len(index.match(equals={'cut': 'Heart'})) == 0
+
+
+def test_value_list(diamonds):
+    """Test that a list of values matches any of them."""
+    index = CatalogIndex(diamonds, ['cut'])
+    assert list(index.match(equals={'cut': ['Oval', 'pear']})) == [1, 4]
+
+
+def test_stock_id_index_point_lookups():
+    """Test get/contains/get_many through appends and removals."""
+    index = StockIdIndex(pd.Series([6900778016, 6246703285, 6460151818]))
+    assert index.get(6246703285) == 1
+    assert index.contains(6460151818)
+    assert index.append(6818544597) == 3
+    index.remove(6246703285)
+    assert not index.contains(6246703285)
+    assert list(index.get_many([6818544597, 6246703285, 6900778016])) == [3, -1, 0]
+
+
+def test_stock_id_index_duplicates():
+    """Test that every row of a repeated ID is found."""
+    index = StockIdIndex(pd.Series(['D1', 'D2', 'D1']))
+    assert index.positions('D1') == [0, 2]
+    assert index.get('D9') is None
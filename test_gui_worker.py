@@ -0,0 +1,87 @@
+import threading
+import time
+from gui_worker import BackgroundExecutor
+
+
+class FakeMaster:
+    """Stands in for a Tk root: after() callbacks run when pump() is called."""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def pump(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            callback = self.scheduled.pop(0)
+            callback()
+            time.sleep(0.001)
+
+
+def test_result_delivered_on_polling_thread():
+    """Test that on_done runs from the poll loop, not the worker thread."""
+    master = FakeMaster()
+    executor = BackgroundExecutor(master)
+    seen = []
+    executor.submit('query', lambda x: x * 2, 21, on_done=lambda result: seen.append((result, threading.current_thread())))
+    master.pump()
+    assert seen == [(42, threading.main_thread())]
+    assert not executor.busy()
+
+
+def test_superseded_query_is_dropped():
+    """Test that a newer submission under the same key cancels the older one."""
+    master = FakeMaster()
+    executor = BackgroundExecutor(master, max_workers=1)
+    release = threading.Event()
+    seen = []
+    executor.submit('query', release.wait, on_done=lambda result: seen.append('first'))
+    executor.submit('query', lambda: 'second', on_done=seen.append)
+    release.set()
+    master.pump()
+    assert seen == ['second']
+    assert not executor.busy()
+
+
+def test_errors_go_to_on_error():
+    """Test that exceptions raised by the work are handed to on_error."""
+    master = FakeMaster()
+    executor = BackgroundExecutor(master)
+    errors = []
+    executor.submit('query', lambda: 1 / 0, on_error=errors.append)
+    master.pump()
+    assert isinstance(errors[0], ZeroDivisionError)
+
+
+def test_unhandled_error_keeps_polling():
+    """Test that an error without on_error is reported and later results still arrive."""
+    master = FakeMaster()
+    master.reported = []
+    master.report_callback_exception = lambda kind, error, tb: master.reported.append(error)
+    executor = BackgroundExecutor(master, max_workers=1)
+    release = threading.Event()
+    seen = []
+    executor.submit('fails', lambda: release.wait() and 1 / 0)
+    executor.submit('query', lambda: 'done', on_done=seen.append)
+    release.set()
+    master.pump()
+    assert isinstance(master.reported[0], ZeroDivisionError)
+    assert seen == ['done']
+    assert not executor.busy()
+
+
+def test_cancel_before_start():
+    """Test that a queued task cancelled before it starts never calls back."""
+    master = FakeMaster()
+    executor = BackgroundExecutor(master, max_workers=1)
+    release = threading.Event()
+    seen = []
+    executor.submit('slow', release.wait)
+    executor.submit('query', lambda: 'done', on_done=seen.append)
+    executor.cancel('query')
+    release.set()
+    master.pump()
+    assert seen == []
+    assert not executor.busy()
@@ -1,3 +1,4 @@
+import os
 import pytest
 import pandas as pd
 from inventory import Inventory
@@ -38,3 +39,117 @@ def test_high_stock_items(inventory):
     high_stock_items = inventory.get_high_stock_items(threshold=50)
     # Ensure that all returned items have stock > 50
     assert all(high_stock_items['Stock'] > 50)
+
+def test_journaled_mutations_skip_full_rewrite(tmp_path):
+    # Journaled mutations go to the log; the data file only changes on checkpoint
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path, journaled=True)
+    inv.add_item({'ID': 'D2001', 'Type': 'Oval', 'Carat': 1.1, 'Price': 9000, 'Stock': 3})
+    inv.add_item({'ID': 'D2002', 'Type': 'Pear', 'Carat': 0.9, 'Price': 7000, 'Stock': 4})
+    inv.update_stock('D2001', 8)
+    inv.remove_item('D2002')
+    assert not (tmp_path / 'diamonds.csv').exists()
+    assert list(inv.get_inventory()['ID']) == ['D2001']
+    assert inv.get_inventory()['Stock'].iloc[0] == 8
+
+    inv.checkpoint()
+    assert list(pd.read_csv(path)['ID']) == ['D2001']
+    assert (tmp_path / 'diamonds.csv.journal').stat().st_size == 0
+    inv.close()
+
+def test_journal_replayed_after_crash(tmp_path):
+    # A new Inventory replays records that never reached a checkpoint
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path, journaled=True)
+    inv.add_item({'ID': 'D3001', 'Type': 'Round', 'Carat': 0.5, 'Price': 2000, 'Stock': 6})
+    inv.checkpoint()
+    inv.add_item({'ID': 'D3002', 'Type': 'Heart', 'Carat': 0.7, 'Price': 3000, 'Stock': 2})
+    inv.update_stock('D3001', 1)
+    inv.journal.sync()
+
+    recovered = Inventory(file_path=path, journaled=True)
+    data = recovered.get_inventory()
+    assert list(data['ID']) == ['D3001', 'D3002']
+    assert list(data['Stock']) == [1, 2]
+
+def test_checkpoint_interrupted_before_journal_truncate(tmp_path):
+    # A crash after the table is saved but before the journal is emptied must not replay adds twice
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path, journaled=True)
+    inv.add_item({'ID': 'D4001', 'Type': 'Round', 'Carat': 0.5, 'Price': 2000, 'Stock': 6})
+    inv.add_item({'ID': 'D4002', 'Type': 'Oval', 'Carat': 0.8, 'Price': 4000, 'Stock': 2})
+    inv.journal.sync()
+    inv.save_data()
+
+    recovered = Inventory(file_path=path, journaled=True)
+    assert list(recovered.get_inventory()['ID']) == ['D4001', 'D4002']
+    recovered.add_item({'ID': 'D4003', 'Type': 'Pear', 'Carat': 0.4, 'Price': 1500, 'Stock': 1})
+    recovered.journal.sync()
+    assert list(Inventory(file_path=path, journaled=True).get_inventory()['ID']) == ['D4001', 'D4002', 'D4003']
+
+def test_checkpoint_interrupted_before_table_swap(tmp_path, monkeypatch):
+    # A crash while writing the table leaves the previous checkpoint intact and replays the journal
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path, journaled=True)
+    inv.add_item({'ID': 'D5001', 'Type': 'Round', 'Carat': 0.5, 'Price': 2000, 'Stock': 6})
+    inv.checkpoint()
+    inv.add_item({'ID': 'D5002', 'Type': 'Oval', 'Carat': 0.8, 'Price': 4000, 'Stock': 2})
+    inv.journal.sync()
+
+    real_replace = os.replace
+    def crash(source, target):
+        if target == path:
+            raise OSError('crash')
+        real_replace(source, target)
+    monkeypatch.setattr(os, 'replace', crash)
+    with pytest.raises(OSError):
+        inv.checkpoint()
+    monkeypatch.undo()
+
+    assert list(pd.read_csv(path)['ID']) == ['D5001']
+    assert list(Inventory(file_path=path, journaled=True).get_inventory()['ID']) == ['D5001', 'D5002']
+
+def test_bulk_upsert(tmp_path):
+    # One batch inserts new IDs, updates known ones and rejects bad rows
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path)
+    inv.add_item({'ID': 'D4001', 'Type': 'Round', 'Carat': 0.5, 'Price': 2000, 'Stock': 6})
+    batch = pd.DataFrame([
+        {'ID': 'D4001', 'Type': 'Round', 'Carat': 0.5, 'Price': 2100, 'Stock': 9},
+        {'ID': 'D4002', 'Type': 'Oval', 'Carat': 1.0, 'Price': 5000, 'Stock': 2},
+        {'ID': None, 'Type': 'Pear', 'Carat': 0.8, 'Price': 3000, 'Stock': 1},
+        {'ID': 'D4002', 'Type': 'Oval', 'Carat': 1.0, 'Price': 5200, 'Stock': 3},
+    ])
+    result = inv.bulk_upsert(batch)
+    assert result == {'inserted': 1, 'updated': 1, 'rejected': 2}
+    saved = pd.read_csv(path).set_index('ID')
+    assert saved.loc['D4001', 'Price'] == 2100
+    assert saved.loc['D4002', 'Stock'] == 3
+
+def test_bulk_update_stock(tmp_path):
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path)
+    inv.bulk_upsert(pd.DataFrame({'ID': ['D5001', 'D5002'], 'Type': ['Round', 'Oval'], 'Stock': [1, 2]}))
+    result = inv.bulk_update_stock({'D5001': 10, 'D5002': 20, 'D5999': 5})
+    assert result == {'updated': 2, 'rejected': 1}
+    assert list(pd.read_csv(path)['Stock']) == [10, 20]
+
+def test_point_operations_keep_id_index(tmp_path):
+    # Adds, removals and reads update the ID index in place instead of rebuilding it
+    path = str(tmp_path / 'diamonds.csv')
+    inv = Inventory(file_path=path)
+    inv.bulk_upsert(pd.DataFrame({'ID': [f'D6{n:03d}' for n in range(8)], 'Type': ['Round'] * 8, 'Stock': range(8)}))
+    id_index = inv.id_index
+    inv.remove_item('D6001')
+    inv.add_item({'ID': 'D6100', 'Type': 'Oval', 'Stock': 1})
+    inv.update_stock('D6100', 4)
+    assert inv.id_index is id_index
+    assert list(inv.get_inventory()['ID']) == [f'D6{n:03d}' for n in range(8) if n != 1] + ['D6100']
+    assert inv.id_index is id_index
+    assert list(pd.read_csv(path)['Stock']) == [0, 2, 3, 4, 5, 6, 7, 4]
+
+    # Once removed rows make up a quarter of the table it is compacted
+    inv.remove_item('D6002')
+    inv.remove_item('D6003')
+    assert inv.id_index is not id_index
+    assert inv.id_index.get('D6100') == 5
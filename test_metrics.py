@@ -0,0 +1,91 @@
+import json
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+import metrics
+from metrics import Histogram, Registry
+from query_engine import QueryEngine, Eq, Range
+
+
+@pytest.fixture
+def enabled_metrics():
+    """The process-wide registry switched on and emptied, restored afterwards."""
+    previous = metrics.enabled()
+    metrics.enable()
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+    metrics.enable(previous)
+
+
+def test_histogram_quantiles():
+    """Test that bucketed quantiles land within the bucket resolution of the exact ones."""
+    values = np.random.default_rng(0).lognormal(np.log(0.002), 1.0, 10_000)
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    for q in (0.5, 0.95, 0.99):
+        exact = np.quantile(values, q)
+        assert abs(histogram.quantile(q) - exact) / exact < 0.1
+    assert histogram.summary()['count'] == 10_000
+
+
+def test_disabled_registry_records_nothing():
+    """Test that a disabled registry hands out the shared no-op timer and keeps no metrics."""
+    registry = Registry()
+    timed = registry.timed('work')(lambda value: value + 1)
+    with registry.timer('block'):
+        registry.increment('rows', 5)
+    assert timed(1) == 2
+    assert registry.timer('block') is registry.timer('other')
+    assert registry.histograms == {} and registry.counters == {}
+
+
+def test_query_paths_are_reported(enabled_metrics):
+    """Test rows scanned and returned, query latency and cache hit rate for engine queries."""
+    df = pd.DataFrame({
+        'cut': pd.Categorical(['Round', 'Oval', 'Round', 'Round']),
+        'carat_weight': np.array([0.3, 0.5, 1.0, 1.2], dtype=np.float32),
+        'fluorescence': ['None', 'Faint', 'Strong', 'None'],
+    })
+    engine = QueryEngine(df)
+    predicates = [Eq('cut', 'Round'), Range('carat_weight', 0.5, None), Eq('fluorescence', 'None')]
+    engine.select(predicates)
+    engine.select(predicates)
+
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot['timers']['query'][0]['count'] == 2
+    counters = {name: entries[0]['value'] for name, entries in snapshot['counters'].items()}
+    # The index leaves two candidates for the residual predicate; the cached repeat scans nothing
+    assert counters == {'rows_returned': 2, 'rows_scanned': 2}
+    gauges = {name: entries[0]['value'] for name, entries in snapshot['gauges'].items()}
+    assert gauges['query_cache_hits'] >= 1
+    assert 0 < gauges['query_cache_hit_rate'] <= 1
+
+
+def test_exports(tmp_path):
+    """Test the Prometheus text, JSON dump and HTTP endpoint of a registry."""
+    registry = Registry(enabled=True)
+    registry.observe('save_data', 0.25)
+    registry.increment('bytes_written', 1024, target='inventory')
+
+    text = registry.to_prometheus()
+    assert '# TYPE diamonds_save_data_seconds summary' in text
+    assert 'diamonds_save_data_seconds{quantile="0.5"} 0.25' in text
+    assert 'diamonds_bytes_written_total{target="inventory"} 1024' in text
+
+    registry.dump(str(tmp_path / 'metrics.json'))
+    with open(tmp_path / 'metrics.json') as dump:
+        assert json.load(dump)['counters']['bytes_written'][0]['labels'] == {'target': 'inventory'}
+    registry.dump(str(tmp_path / 'metrics.prom'))
+    assert (tmp_path / 'metrics.prom').read_text() == text
+
+    server = registry.serve(port=0)
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+            assert response.read().decode('utf-8') == text
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+from order_index import OrderIndex
+from order_ledger import OrderLedger, migrate_csv
+from order_service import OrderService
+
+DAY = 86400
+START = pd.Timestamp('2024-03-01', tz='UTC').timestamp()
+
+
+def _items(*stones):
+    return pd.DataFrame([{'stock_id': stock_id, 'cut': 'Round', 'carat': carat, 'clarity': 'VS1',
+                          'cut_quality': 'Ideal', 'lab': 'GIA', 'total_sales_price': price}
+                         for stock_id, carat, price in stones])
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """A ledger with three orders by two customers, one of them already compacted."""
+    ledger = OrderLedger(str(tmp_path / 'ledger'))
+    ledger.append(1, 'Ada Lovelace', _items((11, 0.5, 1000), (12, 0.7, 1500)), when=START)
+    ledger.append(2, 'Grace Hopper', _items((13, 1.0, 4000)), when=START + DAY)
+    ledger.compact()
+    ledger.append(3, 'ada lovelace ', _items((14, 0.3, 500)), when=START + 2 * DAY)
+    return ledger
+
+
+def test_customer_lookups(ledger):
+    """Test a customer's history and totals regardless of how the name was typed."""
+    index = OrderIndex(ledger)
+    history = index.customer_history('ADA LOVELACE')
+    assert list(history['order_id']) == [1, 3]
+    assert list(history['total']) == [2500, 500]
+    totals = index.customer_totals('Ada Lovelace')
+    assert (totals['orders'], totals['stones'], totals['revenue']) == (2, 3, 3000)
+    assert totals['last_order'] == pd.Timestamp(START + 2 * DAY, unit='s', tz='UTC')
+    assert index.customer_totals('Nobody') is None
+    assert list(index.top_customers(1)['Customer Name']) == ['Grace Hopper']
+
+
+def test_stone_order_and_date_range(ledger):
+    """Test lookups by stock id, by order id and by date window."""
+    index = OrderIndex(ledger)
+    assert index.stone_order(13)['customer'] == 'Grace Hopper'
+    assert index.stone_order(99) is None
+    assert list(index.order_items(1)['stock_id']) == [11, 12]
+    assert list(index.orders_between(START + DAY, START + 3 * DAY)['order_id']) == [2, 3]
+
+
+def test_updates_without_rebuild(ledger):
+    """Test that added orders are indexed at once and refresh picks up other counters' orders."""
+    index = OrderIndex(ledger)
+    index.add(4, 'Grace Hopper', _items((15, 2.0, 9000)), START + 3 * DAY)
+    # Another counter writes to the same ledger
+    OrderLedger(ledger.directory).append(5, 'Alan Turing', _items((16, 0.4, 800)), when=START + 4 * DAY)
+    ledger.append(4, 'Grace Hopper', _items((15, 2.0, 9000)), when=START + 3 * DAY)
+    index.refresh()
+
+    assert len(index) == 5
+    assert index.customer_totals('grace hopper')['orders'] == 2
+    assert index.stone_order(16)['order_id'] == 5
+    assert list(index.orders_between(START + 3 * DAY)['order_id']) == [4, 5]
+
+
+def test_migrated_ledger_then_new_orders(tmp_path):
+    """Test that orders placed after a migration are indexed once, next to the migrated ones."""
+    csv_path = tmp_path / 'order_details.csv'
+    pd.concat([_items((21, 0.5, 1000)).assign(**{'Customer Name': 'Ada Lovelace'}),
+               _items((22, 1.0, 2000)).assign(**{'Customer Name': 'Grace Hopper'})]).to_csv(csv_path, index=False)
+    ledger = OrderLedger(str(tmp_path / 'ledger'))
+    migrate_csv(str(csv_path), ledger, str(tmp_path / 'orders.db'))
+    index = OrderIndex(ledger)
+
+    # New orders go to the ledger and the index, and to order_details.csv as the order window does
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    for stock_id, customer in [(23, 'Alan Turing'), (24, 'Ada Lovelace')]:
+        token, _ = service.reserve([stock_id], 1)
+        order_id, _ = service.commit(token, customer)
+        items = _items((stock_id, 0.4, 800))
+        ledger.append(order_id, customer, items, when=service.order_time(order_id))
+        index.add(order_id, customer, items, service.order_time(order_id))
+        items.assign(**{'Customer Name': customer}).to_csv(csv_path, mode='a', header=False, index=False)
+    service.close()
+    ledger.compact()
+    index.refresh()
+    migrate_csv(str(csv_path), ledger, str(tmp_path / 'orders.db'))
+    index.refresh()
+
+    assert len(index) == 4
+    totals = index.customer_totals('Ada Lovelace')
+    assert (totals['orders'], totals['stones'], totals['revenue']) == (2, 2, 1800)
+    assert index.stone_order(22)['customer'] == 'Grace Hopper'
+    assert index.stone_order(23)['customer'] == 'Alan Turing'
+    assert len(OrderIndex(ledger)) == 4
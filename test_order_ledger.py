@@ -0,0 +1,74 @@
+import os
+
+import pandas as pd
+import pytest
+from order_ledger import OrderLedger, migrate_csv
+from order_service import OrderService
+
+JAN = pd.Timestamp('2024-01-15', tz='UTC').timestamp()
+FEB = pd.Timestamp('2024-02-10', tz='UTC').timestamp()
+
+
+def _items(*stones):
+    return pd.DataFrame([{'stock_id': stock_id, 'cut': cut, 'carat': 0.5, 'clarity': 'VS1', 'cut_quality': 'Ideal',
+                          'lab': 'GIA', 'total_sales_price': 1000} for stock_id, cut in stones])
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """A ledger with orders in January and February, January's compacted into a segment."""
+    ledger = OrderLedger(str(tmp_path / 'ledger'))
+    ledger.append(1, 'Ada', _items((11, 'Round'), (12, 'Round')), when=JAN)
+    ledger.append(2, 'Grace', _items((13, 'Oval')), when=JAN + 3600)
+    ledger.compact()
+    ledger.append(3, 'Ada', _items((14, 'Pear')), when=FEB)
+    return ledger
+
+
+def test_scan_by_window_customer_and_cut(ledger):
+    """Test range scans across a compacted partition and an uncompacted tail."""
+    assert list(ledger.scan()['stock_id']) == [11, 12, 13, 14]
+    assert list(ledger.scan(start='2024-02-01')['order_id']) == [3]
+    assert list(ledger.scan(customer='Ada')['stock_id']) == [11, 12, 14]
+    assert list(ledger.scan(cut='Oval', end='2024-02-01')['Customer Name']) == ['Grace']
+    assert list(ledger.orders(end='2024-02-01')['order_id']) == [1, 2]
+    assert len(ledger) == 3
+
+
+def test_scans_skip_other_partitions(ledger):
+    """Test that a date window never opens segments of partitions outside it."""
+    os.remove(os.path.join(ledger.directory, '2024-01', 'seg-000001.npz'))
+    assert list(ledger.scan(start='2024-02-01', end='2024-03-01')['stock_id']) == [14]
+    assert ledger.next_order_id() == 4, "Orders still in a tail count too."
+
+
+def test_migrate_csv(tmp_path):
+    """Test migrating order_details.csv with ids and times from the order database."""
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    token, _ = service.reserve([101, 102], 2)
+    order_id, _ = service.commit(token, 'Ada')
+    service.close()
+    csv_path = tmp_path / 'order_details.csv'
+    pd.concat([_items((101, 'Round'), (102, 'Round')).assign(**{'Customer Name': 'Ada'}),
+               _items((201, 'Oval'), (202, 'Oval')).assign(**{'Customer Name': 'Grace'}),
+               _items((203, 'Pear')).assign(**{'Customer Name': 'Ada'})]).to_csv(csv_path, index=False)
+
+    # The order window already recorded the database's order in the ledger
+    ledger = OrderLedger(str(tmp_path / 'ledger'))
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    ledger.append(order_id, 'Ada', _items((101, 'Round'), (102, 'Round')), when=service.order_time(order_id))
+    service.close()
+    assert migrate_csv(str(csv_path), ledger, str(tmp_path / 'orders.db')) == 2
+    assert migrate_csv(str(csv_path), ledger, str(tmp_path / 'orders.db')) == 0
+    orders = ledger.scan()
+    assert list(orders.loc[orders['stock_id'].isin([101, 102]), 'order_id']) == [order_id, order_id]
+    assert orders.groupby('order_id')['Customer Name'].first().tolist().count('Ada') == 2
+    assert len(ledger) == 3
+
+    # Orders the database did not know are numbered apart from the ids it hands out later
+    assert sorted(orders.loc[orders['stock_id'] > 200, 'order_id'].unique()) == [-2, -1]
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    token, _ = service.reserve([301], 1)
+    new_order_id, _ = service.commit(token, 'Grace')
+    service.close()
+    assert new_order_id not in set(orders['order_id'])
@@ -0,0 +1,55 @@
+import pytest
+from order_service import OrderService, load_test
+
+
+@pytest.fixture
+def service(tmp_path):
+    """Order service on a fresh database."""
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    yield service
+    service.close()
+
+
+def test_reserve_then_commit(service):
+    """Test that committed stones are recorded as sold."""
+    token, reserved = service.reserve([101, 102, 103], 2)
+    order_id, sold = service.commit(token, 'Peter M.')
+    assert order_id is not None
+    assert sold == [101, 102]
+    assert service.is_sold(101) and not service.is_sold(103)
+
+
+def test_reserved_stones_are_skipped(service, tmp_path):
+    """Test that a second counter cannot take stones reserved by the first."""
+    other = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    token, reserved = service.reserve([101, 102, 103], 2)
+    other_token, other_reserved = other.reserve([101, 102, 103], 1)
+    assert other_reserved == [103]
+    token, available = other.reserve([101, 102, 103], 1)
+    assert token is None and available == []
+    other.close()
+
+
+def test_expired_reservation_is_released(service):
+    """Test that an expired reservation frees its stones and cannot be committed."""
+    token, _ = service.reserve([101], 1, ttl=-1)
+    second_token, reserved = service.reserve([101], 1)
+    assert reserved == [101]
+    assert service.commit(token, 'Late Customer') == (None, [])
+
+
+def test_sold_since_follows_other_processes(service):
+    """Test that sales are picked up incrementally through the cursor."""
+    cursor, sold = service.sold_since(0)
+    assert sold == []
+    service.commit(service.reserve([7, 8], 2)[0], 'Peter M.')
+    cursor, sold = service.sold_since(cursor)
+    assert sold == [7, 8]
+    assert service.sold_since(cursor) == (cursor, [])
+
+
+def test_load_test_never_sells_a_stone_twice(tmp_path):
+    """Test concurrent order placement from several processes."""
+    result = load_test(str(tmp_path / 'load.db'), processes=3, orders_per_process=40, catalog_size=500)
+    assert result['duplicates'] == 0
+    assert result['orders'] == 120
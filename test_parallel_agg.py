@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+import parallel_agg
+from parallel_agg import parallel_groupby
+
+
+@pytest.fixture
+def diamonds():
+    """A few thousand stones with categorical and plain key columns."""
+    rng = np.random.default_rng(3)
+    rows = 20000
+    return pd.DataFrame({
+        'cut': pd.Categorical(rng.choice(['Round', 'Oval', 'Pear'], rows)),
+        'carat_weight': rng.choice([0.3, 0.5, 1.0, 1.5], rows).astype(np.float32),
+        'clarity': rng.choice(['VS1', 'VS2', 'SI1'], rows),
+        'total_sales_price': rng.gamma(2.0, 2000.0, rows),
+    })
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_matches_pandas_groupby(diamonds, processes, monkeypatch):
+    """Test counts, sums and extremes against pandas, in-process and across a pool."""
+    monkeypatch.setattr(parallel_agg, 'PARALLEL_MIN_ROWS', 0)
+    result = parallel_groupby(diamonds, ['cut', 'clarity'], value='total_sales_price', processes=processes)
+    expected = diamonds.groupby(['cut', 'clarity'], observed=True)['total_sales_price'].agg(
+        ['size', 'sum', 'min', 'max']).reset_index()
+    assert list(result['cut'].astype(str)) == list(expected['cut'].astype(str))
+    assert list(result['count']) == list(expected['size'])
+    assert np.allclose(result['sum'], expected['sum'])
+    assert np.allclose(result['min'], expected['min'])
+    assert np.allclose(result['max'], expected['max'])
+
+
+def test_counts_match_analytics_table(diamonds):
+    """Test the shape/carat counts used by analytics.py."""
+    result = parallel_groupby(diamonds, ['cut', 'carat_weight'])
+    expected = diamonds.groupby(['cut', 'carat_weight'], observed=True).size().reset_index(name='count')
+    assert result.equals(expected)
+
+
+def test_quantiles_are_close(diamonds):
+    """Test that histogram quantiles stay within one bin of the exact value."""
+    result = parallel_groupby(diamonds, ['cut'], value='total_sales_price', quantiles=(0.5,))
+    exact = diamonds.groupby('cut', observed=True)['total_sales_price'].median().to_numpy()
+    spread = diamonds['total_sales_price'].max() - diamonds['total_sales_price'].min()
+    assert np.all(np.abs(result['q50'].to_numpy() - exact) <= spread / parallel_agg.QUANTILE_BINS * 2)
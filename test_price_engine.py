@@ -0,0 +1,116 @@
+import pandas as pd
+import price_engine
+import pytest
+from catalog import load_catalog
+from price_engine import PriceEngine
+from streaming import iter_chunks
+
+
+@pytest.fixture
+def diamonds_csv(tmp_path):
+    """Write a small diamonds file to a temporary directory."""
+    path = tmp_path / 'diamonds.csv'
+    pd.DataFrame({
+        'stock_id': [101, 102, 103, 104],
+        'cut': ['Round', 'Oval', 'Round', 'Round'],
+        'carat_weight': [0.5, 1.0, 1.5, 2.5],
+        'clarity': ['VS1', 'SI1', 'VS1', 'SI1'],
+        'lab': ['GIA', 'IGI', 'GIA', 'GIA'],
+        'total_sales_price': [1000.0, 2000.0, 3000.0, 4000.0],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_adjust_segment(diamonds_csv):
+    """Test that an adjustment only changes the stones matching its rule."""
+    engine = PriceEngine(diamonds_csv)
+    version = engine.adjust(10, 'Round promotion', cut='Round', carat_min=1.0)
+    assert version == 1
+    assert engine.price(103) == pytest.approx(3300.0)
+    assert engine.price(104) == pytest.approx(4400.0)
+    assert engine.price(101) == 1000.0, "Stones outside the carat range should keep their price."
+    assert engine.price(102) == 2000.0, "Other cuts should keep their price."
+    assert engine.adjust(5, cut='Heart') is None, "A rule matching no stones should not add a version."
+
+    # The CSV is left alone; the catalog picks up the current prices
+    assert list(pd.read_csv(diamonds_csv)['total_sales_price']) == [1000.0, 2000.0, 3000.0, 4000.0]
+    assert list(load_catalog(diamonds_csv)['total_sales_price']) == pytest.approx([1000.0, 2000.0, 3300.0, 4400.0])
+
+
+def test_point_in_time_and_rollback(diamonds_csv):
+    """Test that old prices can be looked up and restored."""
+    engine = PriceEngine(diamonds_csv)
+    engine.adjust(10, cut='Round')
+    engine.adjust(-50, clarity='SI1')
+    assert engine.price(104, version=0) == 4000.0
+    assert engine.price(104, version=1) == pytest.approx(4400.0)
+    assert engine.price(104) == pytest.approx(2200.0)
+    assert list(engine.prices_at(1)) == pytest.approx([1100.0, 2000.0, 3300.0, 4400.0])
+
+    version = engine.rollback(1, 'Clearance ended')
+    assert version == 3
+    assert list(engine.prices) == pytest.approx([1100.0, 2000.0, 3300.0, 4400.0])
+    assert engine.history()[-1]['kind'] == 'rollback'
+    assert engine.rollback(3) is None, "Rolling back to the current version changes nothing."
+
+    # The rollback is a version of its own, so it can be undone too
+    engine.rollback(2)
+    assert list(engine.prices) == pytest.approx([1100.0, 1000.0, 3300.0, 2200.0])
+
+
+def test_history_survives_restart(diamonds_csv):
+    """Test that versions are reloaded and a half-applied version is finished on open."""
+    engine = PriceEngine(diamonds_csv)
+    engine.adjust(10, lab='GIA')
+    engine.adjust(20, lab='IGI')
+    engine._write_state(1)  # As if the process died before the second version reached current prices
+    engine.prices[1] = 2000.0
+    engine.prices.flush()
+    del engine
+
+    reopened = PriceEngine(diamonds_csv)
+    assert reopened.version == 2
+    assert list(reopened.prices) == pytest.approx([1100.0, 2400.0, 3300.0, 4400.0])
+    assert reopened.price(102, version=1) == 2000.0
+
+
+def test_prices_follow_stones(diamonds_csv):
+    """Test that versioned prices stay with their stock IDs after rows are removed and added."""
+    engine = PriceEngine(diamonds_csv)
+    engine.adjust(10, cut='Round')
+    catalog = pd.read_csv(diamonds_csv)
+    added = pd.DataFrame({'stock_id': [105], 'cut': ['Round'], 'carat_weight': [3.0], 'clarity': ['VS1'],
+                          'lab': ['GIA'], 'total_sales_price': [5000.0]})
+    pd.concat([catalog.iloc[1:], added]).to_csv(diamonds_csv, index=False)
+
+    expected = [2000.0, 3300.0, 4400.0, 5000.0]
+    assert list(load_catalog(diamonds_csv)['total_sales_price']) == pytest.approx(expected)
+    streamed = pd.concat(iter_chunks(diamonds_csv, 1024, usecols=['cut', 'total_sales_price']))
+    assert list(streamed.columns) == ['cut', 'total_sales_price']
+    assert list(streamed['total_sales_price']) == pytest.approx(expected)
+
+    reopened = PriceEngine(diamonds_csv)
+    assert reopened.adjust(10, carat_min=3.0) == 2
+    assert reopened.price(105) == pytest.approx(5500.0)
+    assert reopened.price(101, version=0) == 1000.0, "Removed stones keep their history."
+
+
+def test_memory_limit_streams_catalog(diamonds_csv, monkeypatch):
+    """Test that with a memory limit the engine selects stones without loading the catalog."""
+    monkeypatch.setattr(price_engine, 'load_catalog', None)
+    engine = PriceEngine(diamonds_csv, memory_limit=1024)
+    assert list(engine.select(cut='round', carat_max=1.5)) == [101, 103]
+    engine.adjust(-10, clarity='SI1')
+    assert list(engine.prices) == pytest.approx([1000.0, 1800.0, 3000.0, 3600.0])
+
+
+def test_repeated_stock_ids(diamonds_csv):
+    """Test that a catalog repeating a stock ID is rejected, and repeated rows keep their CSV prices."""
+    engine = PriceEngine(diamonds_csv)
+    engine.adjust(10, cut='Oval')
+    catalog = pd.read_csv(diamonds_csv)
+    catalog.loc[3, 'stock_id'] = 102
+    catalog.to_csv(diamonds_csv, index=False)
+    assert list(load_catalog(diamonds_csv)['total_sales_price']) == pytest.approx([1000.0, 2000.0, 3000.0, 4000.0])
+    with pytest.raises(ValueError, match='102'):
+        PriceEngine(diamonds_csv)
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+from query_cache import invalidate_rows
+from query_engine import QueryEngine, Eq, In, Range
+
+
+@pytest.fixture
+def engine():
+    """Query engine over a small catalog with mixed-case values."""
+    df = pd.DataFrame({
+        'stock_id': [1, 2, 3, 4, 5, 6],
+        'cut': pd.Categorical(['Round', 'Oval', 'round', 'Round', 'Pear', 'Oval']),
+        'clarity': pd.Categorical(['VS1', 'SI1', 'VS1', 'VS2', 'VS1', 'vs1']),
+        'carat_weight': np.array([0.3, 0.5, 1.0, 0.3, 1.5, 1.0], dtype=np.float32),
+        'fluorescence': ['None', 'Faint', 'none', 'Strong', 'None', 'Faint'],
+        'total_sales_price': [300, 900, 2500, 350, 6000, 2400],
+    })
+    return QueryEngine(df)
+
+
+def test_equality_and_range(engine):
+    """Test combining indexed equality and range predicates."""
+    result = engine.select([Eq('cut', 'ROUND'), Range('carat_weight', 0.3, 1.0)])
+    assert list(result.column('stock_id')) == [1, 3, 4]
+
+
+def test_in_list(engine):
+    """Test IN-list predicates on an indexed column."""
+    result = engine.select([In('cut', ['Oval', 'Pear']), Eq('clarity', 'vs1')])
+    assert list(result.column('stock_id')) == [5, 6]
+
+
+def test_numeric_equality_on_float32(engine):
+    """Test that 0.3 matches carats stored as float32."""
+    result = engine.select([Eq('carat_weight', 0.3)])
+    assert list(result.column('stock_id')) == [1, 4]
+
+
+def test_optional_fields_are_skipped(engine):
+    """Test that empty selections do not filter."""
+    result = engine.select([Eq('cut', None), Eq('clarity', ''), In('cut', [])])
+    assert len(result) == 6
+
+
+def test_unindexed_column(engine):
+    """Test predicates on columns without an index."""
+    result = engine.select([Eq('fluorescence', 'none'), Range('stock_id', 2, None)])
+    assert list(result.column('stock_id')) == [3, 5]
+
+
+def test_projection(engine):
+    """Test that only the requested columns are materialized."""
+    frame = engine.select([Eq('cut', 'Pear')]).to_frame(['stock_id', 'total_sales_price'])
+    assert list(frame.columns) == ['stock_id', 'total_sales_price']
+    assert frame.iloc[0]['total_sales_price'] == 6000
+
+
+def test_sort_and_page(engine):
+    """Test sorting through the index and reading one page of the result."""
+    result = engine.select([Range('carat_weight', 0.3, 1.0)])
+    by_price = result.sort_by('total_sales_price', descending=True)
+    assert list(by_price.column('stock_id')) == [3, 6, 2, 4, 1]
+    assert list(by_price.page(1, 3, ['stock_id'])['stock_id']) == [6, 2]
+    # Columns without a sorted index fall back to sorting the result's own values
+    by_id = engine.select([Eq('cut', 'Oval')]).sort_by('stock_id', descending=True)
+    assert list(by_id.column('stock_id')) == [6, 2]
+
+
+def test_repeated_query_hits_cache(engine):
+    """Test that a repeated filter is served from the result cache."""
+    engine.select([Eq('cut', 'Round'), Eq('clarity', 'VS1')])
+    engine.select([Eq('clarity', 'vs1'), Eq('cut', 'round')])
+    assert engine.cache.stats()['hits'] == 1
+    assert engine.cache.stats()['misses'] == 1
+
+
+def test_invalidation_only_drops_affected_results(engine):
+    """Test that touching a Round stone leaves cached Oval results alone."""
+    engine.select([Eq('cut', 'Round')])
+    engine.select([Eq('cut', 'Oval')])
+    engine.cache.invalidate_rows([{'cut': 'Round', 'clarity': 'SI2'}])
+    assert engine.cache.stats()['entries'] == 1
+    assert engine.cache.make_key([Eq('cut', 'Oval')]) in engine.cache.entries
+
+
+def test_price_change_keeps_results_without_price_filter(engine):
+    """Test that a price adjustment only drops results that filter on price."""
+    engine.select([Eq('cut', 'Round')])
+    engine.select([Range('total_sales_price', None, 1000)])
+    engine.cache.invalidate_rows(engine.df, changed_columns=['total_sales_price'])
+    assert engine.cache.stats()['entries'] == 1
+    assert engine.cache.make_key([Eq('cut', 'Round')]) in engine.cache.entries
+
+
+def test_inventory_rows_only_drop_results_they_match(engine):
+    """Test that inventory rows are checked through their aliased columns, not treated as matches."""
+    engine.select([Eq('cut', 'Round')])
+    engine.select([Eq('cut', 'Oval')])
+    engine.select([Eq('clarity', 'SI1')])
+    engine.cache.invalidate_rows([{'ID': 'D1001', 'Type': 'Oval', 'Carat': 1.5, 'Price': 15000, 'Stock': 20}])
+    assert set(engine.cache.entries) == {engine.cache.make_key([Eq('cut', 'Round')]),
+                                         engine.cache.make_key([Eq('clarity', 'SI1')])}
+    # A stock change never touches results, since no query filters on stock
+    engine.cache.invalidate_rows([{'ID': 'D1001', 'Type': 'Round', 'Stock': 3}], changed_columns=['Stock'])
+    assert engine.cache.stats()['entries'] == 2
+
+
+def test_notified_price_change_reaches_recomputed_results(engine):
+    """Test that results recomputed after a price change see the new prices through the index."""
+    under_1000 = [Range('total_sales_price', None, 1000)]
+    assert list(engine.select(under_1000).column('stock_id')) == [1, 2, 4]
+    invalidate_rows(pd.DataFrame({'stock_id': [2, 5], 'total_sales_price': [1200.0, 800.0]}),
+                    changed_columns=['total_sales_price'])
+    assert list(engine.select(under_1000).column('stock_id')) == [1, 4, 5]
+
+
+def test_notified_removal_leaves_results(engine):
+    """Test that rows announced as removed are excluded from later results."""
+    assert list(engine.select([Eq('cut', 'Oval')]).column('stock_id')) == [2, 6]
+    invalidate_rows([{'stock_id': 6, 'cut': 'Oval'}], removed=True)
+    assert list(engine.select([Eq('cut', 'Oval')]).column('stock_id')) == [2]
+
+
+def test_excluded_rows_leave_results_and_facets(engine):
+    """Test that excluded rows are subtracted from cached results, ranges and facet counts."""
+    assert list(engine.select([Eq('cut', 'Round')]).column('stock_id')) == [1, 3, 4]
+    engine.exclude([0, 4])
+    assert list(engine.select([Eq('cut', 'Round')]).column('stock_id')) == [3, 4]
+    assert list(engine.select([Range('carat_weight', 1.0, 2.0)]).column('stock_id')) == [3, 6]
+    assert len(engine.select([])) == 4
+    assert dict(engine.facets([], columns=['cut'])['cut']) == {'Oval': 2, 'Round': 2}
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+from sales_tracker import SalesTracker, TopK
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Order history in a temporary directory."""
+    orders = tmp_path / 'order_details.csv'
+    pd.DataFrame({
+        'stock_id': [1, 2, 3, 4, 5],
+        'cut': ['Round', 'Round', 'Oval', 'Round', 'Pear'],
+        'clarity': ['VS1', 'VS1', 'SI1', 'SI1', 'VS1'],
+        'lab': ['GIA', 'GIA', 'IGI', 'GIA', 'GIA'],
+        'total_sales_price': [1000, 1500, 9000, 500, 700],
+        'Customer Name': ['Peter M.'] * 5,
+    }).to_csv(orders, index=False)
+    return str(orders), str(tmp_path / 'sales_state.json')
+
+
+def test_top_sellers(files):
+    """Test counts and revenue for the full combination and a single attribute."""
+    tracker = SalesTracker(*files)
+    tracker.update()
+    top = tracker.top(2)
+    assert list(top.columns) == ['cut', 'clarity', 'lab', 'sold', 'revenue']
+    assert top.iloc[0][['cut', 'clarity', 'lab', 'sold', 'revenue']].tolist() == ['Round', 'VS1', 'GIA', 2, 2500]
+    assert tracker.top(1, by='cut').iloc[0][['cut', 'sold']].tolist() == ['Round', 3]
+    assert tracker.top(1, by=['cut'], metric='revenue').iloc[0]['cut'] == 'Oval'
+    with pytest.raises(ValueError):
+        tracker.top(by=['color'])
+
+
+def test_only_new_orders_are_read(files):
+    """Test that a later run resumes from the saved watermark."""
+    orders, state = files
+    SalesTracker(orders, state).update()
+    with open(orders, 'a') as file:
+        file.write('6,Pear,VS1,GIA,800,James S.\n7,Pear,VS1,GIA,900,James S.\n')
+
+    tracker = SalesTracker(orders, state)
+    tracker.update()
+    assert tracker.top(1).iloc[0][['cut', 'sold']].tolist() == ['Pear', 3]
+    assert tracker.top(1, by='lab').iloc[0]['sold'] == 6
+
+
+def test_decay_favours_recent_sales(files):
+    """Test that with a half-life older sales count for less."""
+    orders, _ = files
+    tracker = SalesTracker(orders, None, half_life_days=1)
+    now = tracker.epoch
+    old = pd.DataFrame({'cut': ['Round'] * 4, 'clarity': ['VS1'] * 4, 'lab': ['GIA'] * 4, 'total_sales_price': [100] * 4})
+    new = pd.DataFrame({'cut': ['Oval'] * 3, 'clarity': ['SI1'] * 3, 'lab': ['IGI'] * 3, 'total_sales_price': [100] * 3})
+    tracker.record(old, when=now)
+    tracker.record(new, when=now + 2 * 86400)
+    top = tracker.top(2, by='cut', now=now + 2 * 86400)
+    assert top['cut'].tolist() == ['Oval', 'Round']
+    assert top['sold'].tolist() == pytest.approx([3.0, 1.0])
+
+
+def test_top_k_matches_full_sort():
+    """Test the heap-kept ranking against sorting all scores."""
+    ranking = TopK(k=3)
+    scores = {}
+    for step, key in enumerate('abcdeabcaeedddb'):
+        scores[key] = scores.get(key, 0) + step
+        ranking.offer(key, scores[key])
+    assert ranking.ranking() == sorted(scores, key=lambda key: -scores[key])[:3]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+import similarity
+from diamond_recommendation import DiamondRecommendationSystem
+from similarity import SimilarityIndex
+
+
+@pytest.fixture
+def diamonds():
+    """A few thousand stones with every attribute the similarity index encodes."""
+    rng = np.random.default_rng(11)
+    rows = 5000
+    return pd.DataFrame({
+        'stock_id': np.arange(rows),
+        'cut': pd.Categorical(rng.choice(['Round', 'Oval', 'Pear'], rows)),
+        'color': pd.Categorical(rng.choice(list('DEFGH'), rows)),
+        'clarity': pd.Categorical(rng.choice(['VVS2', 'VS1', 'VS2', 'SI1'], rows)),
+        'carat_weight': rng.choice(np.arange(0.3, 3.0, 0.01), rows).round(2).astype(np.float32),
+        'cut_quality': pd.Categorical(rng.choice(['Excellent', 'Good'], rows)),
+        'lab': pd.Categorical(rng.choice(['GIA', 'IGI'], rows)),
+        'polish': pd.Categorical(rng.choice(['Excellent', 'Good'], rows)),
+        'total_sales_price': rng.gamma(2.0, 2000.0, rows).round(0),
+    })
+
+
+def test_exact_stone_comes_first(diamonds):
+    """Test that a stone is its own nearest neighbour and results are ordered by distance."""
+    index = SimilarityIndex(diamonds)
+    stone = diamonds.iloc[123]
+    positions, distances = index.nearest(
+        5, cut=stone['cut'], carat=float(stone['carat_weight']), clarity=stone['clarity'],
+        color=stone['color'], lab=stone['lab'], total_sales_price=stone['total_sales_price'])
+    assert positions[0] == 123
+    assert distances[0] == pytest.approx(0.0, abs=1e-6)
+    assert list(distances) == sorted(distances)
+
+
+def test_matches_brute_force_across_batches(diamonds, monkeypatch):
+    """Test batched top-k against a full sort, with sold stones excluded."""
+    monkeypatch.setattr(similarity, 'BATCH_ROWS', 700)
+    index = SimilarityIndex(diamonds)
+    weights = {'carat': 1.0, 'clarity': 2.0, 'cut': 0.0}
+    exclude = np.zeros(len(diamonds), dtype=bool)
+    exclude[::3] = True
+    positions, distances = index.nearest(8, weights, exclude, cut='Oval', carat_weight=1.1, clarity='vs2')
+
+    vector, used = index.encode(carat=1.1, clarity='VS2')
+    feature_weights = np.array([weights.get(name, similarity.DEFAULT_WEIGHTS[name]) for name in index.features])
+    expected = (((index.matrix - vector) ** 2) * (feature_weights * used)).sum(axis=1)
+    expected[exclude] = np.inf
+    assert not exclude[positions].any(), "Excluded stones should never be returned."
+    assert np.allclose(distances, np.sqrt(np.sort(expected)[:8]), atol=1e-4)
+
+
+def test_recommendation_alternatives(tmp_path, diamonds):
+    """Test that the recommender offers alternatives when nothing matches exactly."""
+    path = tmp_path / 'diamonds.csv'
+    diamonds.to_csv(path, index=False)
+    system = DiamondRecommendationSystem(str(path))
+    assert system.filter_diamonds(cut='Heart', carat_weight=1.0, clarity='VS1').empty
+    alternatives = system.alternatives(cut='Heart', carat_weight=1.0, clarity='VS1', k=3)
+    assert len(alternatives) == 3
+    assert (alternatives['clarity'] == 'VS1').all()
+    assert np.allclose(alternatives['carat_weight'], 1.0)
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+import smart_restocking
+from inventory import Inventory
+from smart_restocking import RestockingEngine
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Catalog and order history in a temporary directory."""
+    diamonds = tmp_path / 'diamonds.csv'
+    orders = tmp_path / 'order_details.csv'
+    pd.DataFrame({
+        'stock_id': [1, 2, 3, 4, 5, 6],
+        'ID': ['D1', 'D2', 'D3', 'D4', 'D5', 'D6'],
+        'cut': ['Round', 'Round', 'Round', 'Oval', 'Oval', 'Oval'],
+        'clarity': ['VS1', 'VS1', 'VS1', 'SI1', 'SI1', 'SI1'],
+    }).to_csv(diamonds, index=False)
+    pd.DataFrame({'stock_id': [1], 'cut': ['Round'], 'clarity': ['VS1'], 'Customer Name': ['Peter M.']}).to_csv(orders, index=False)
+    return str(diamonds), str(orders), str(tmp_path / 'state.json')
+
+
+def test_report_counts(files):
+    """Test the stock, sold and low-stock columns of the report."""
+    engine = RestockingEngine(*files, low_stock_threshold=3)
+    engine.update()
+    report = engine.report().set_index(['cut', 'clarity'])
+    assert report.loc[('Round', 'VS1'), 'sold_quantity'] == 1
+    assert report.loc[('Round', 'VS1'), 'remaining_stock'] == 2
+    assert report.loc[('Round', 'VS1'), 'low_stock']
+    assert not report.loc[('Oval', 'SI1'), 'low_stock']
+
+
+def test_only_new_orders_are_processed(files):
+    """Test that a later run resumes from the saved watermark."""
+    diamonds, orders, state = files
+    RestockingEngine(diamonds, orders, state).update()
+    with open(orders, 'a') as file:
+        file.write('4,Oval,SI1,James S.\n5,Oval,SI1,James S.\n')
+
+    engine = RestockingEngine(diamonds, orders, state)
+    engine.update()
+    report = engine.report().set_index(['cut', 'clarity'])
+    assert report.loc[('Round', 'VS1'), 'sold_quantity'] == 1
+    assert report.loc[('Oval', 'SI1'), 'sold_quantity'] == 2
+
+
+def test_inventory_changes_skip_recount(files, monkeypatch):
+    """Test that stock follows logged inventory writes and recounts only after an unlogged one."""
+    diamonds, orders, state = files
+    RestockingEngine(*files).update()
+    inventory = Inventory(diamonds)
+    inventory.add_item({'stock_id': 7, 'ID': 'D7', 'cut': 'Pear', 'clarity': 'VS2'})
+    inventory.remove_item('D4')
+
+    def recount(*args):
+        raise AssertionError('catalog recounted')
+    monkeypatch.setattr(smart_restocking, 'load_catalog', recount)
+    engine = RestockingEngine(*files)
+    engine.update()
+    assert engine.stock == {('Round', 'VS1'): 3, ('Oval', 'SI1'): 2, ('Pear', 'VS2'): 1}
+
+    monkeypatch.undo()
+    pd.read_csv(diamonds).iloc[:2].to_csv(diamonds, index=False)
+    engine.update()
+    assert engine.stock == {('Round', 'VS1'): 2}
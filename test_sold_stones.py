@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+from order_service import OrderService
+from sold_stones import SoldStoneSet
+
+
+@pytest.fixture
+def service(tmp_path):
+    """An order database with two stones sold."""
+    service = OrderService(str(tmp_path / 'orders.db'), sold_stones_file=None)
+    token, _ = service.reserve([101, 102], 2)
+    service.commit(token, 'Ada')
+    yield service
+    service.close()
+
+
+def test_catches_up_from_order_database(tmp_path, service):
+    """Test membership of stones sold before and after the set was opened."""
+    sold = SoldStoneSet(str(tmp_path / 'sold'), service)
+    assert 101 in sold and 103 not in sold
+    token, _ = service.reserve([103], 1)
+    service.commit(token, 'Grace')
+    assert sold.update().tolist() == [103]
+    assert sold.contains_many([100, 101, 102, 103]).tolist() == [False, True, True, True]
+    assert sold.add([103, 104]).tolist() == [104]
+    assert len(sold) == 4
+
+
+def test_compacted_base_is_memory_mapped(tmp_path, service):
+    """Test that a reopened set maps the saved base and reads only later sales."""
+    sold = SoldStoneSet(str(tmp_path / 'sold'), service, compact_at=2)
+    assert len(sold.buffer) == 0 and sold.base_file is not None
+    token, _ = service.reserve([103], 1)
+    service.commit(token, 'Grace')
+
+    reopened = SoldStoneSet(str(tmp_path / 'sold'), service)
+    assert reopened.base.tolist() == [101, 102]
+    assert isinstance(reopened.base, np.memmap)
+    assert reopened.buffer.tolist() == [103]
+    reopened.compact()
+    # The replaced base file is removed
+    assert sorted(os.listdir(str(tmp_path / 'sold'))) == sorted(['state.json', reopened.base_file])
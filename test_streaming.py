@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from catalog import load_catalog
+from streaming import group_counts, parse_size
+
+# Small enough that the test catalog is split into many chunks
+MEMORY_LIMIT = 64 * 1024
+
+
+@pytest.fixture
+def diamonds_csv(tmp_path):
+    """A catalog of a few thousand stones."""
+    rng = np.random.default_rng(7)
+    rows = 5000
+    path = tmp_path / 'diamonds.csv'
+    pd.DataFrame({
+        'stock_id': np.arange(rows) + 6900000000,
+        'cut': rng.choice(['Round', 'Oval', 'Pear'], rows),
+        'carat_weight': rng.choice([0.3, 0.5, 0.7, 1.0, 1.5], rows),
+        'clarity': rng.choice(['VS1', 'VS2', 'SI1'], rows),
+        'total_sales_price': rng.integers(300, 9000, rows),
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_group_counts_match_in_memory(diamonds_csv):
+    """Test that chunked counts equal the in-memory groupby."""
+    expected = load_catalog(diamonds_csv).groupby(['cut', 'carat_weight'], observed=True).size()
+    counts = group_counts(diamonds_csv, ['cut', 'carat_weight'], MEMORY_LIMIT)
+    assert counts.to_dict() == {(str(cut), carat): count for (cut, carat), count in expected.items()}
+
+
+def test_parse_size():
+    """Test memory ceiling parsing."""
+    assert parse_size('512M') == 512 * 1024 ** 2
+    assert parse_size('1048576') == 1048576
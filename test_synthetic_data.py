@@ -0,0 +1,33 @@
+import pandas as pd
+import synthetic_data
+from synthetic_data import CATALOG_COLUMNS, ORDER_COLUMNS, generate_catalog, generate_orders, write_catalog, write_orders
+
+
+def test_catalog_is_seeded_and_blockwise(tmp_path, monkeypatch):
+    """Test that a seed always gives the same catalog, in memory or written block by block."""
+    monkeypatch.setattr(synthetic_data, 'BLOCK_ROWS', 700)
+    catalog = generate_catalog(2000, seed=4)
+    assert list(catalog.columns) == CATALOG_COLUMNS
+    assert catalog['stock_id'].is_unique
+    assert catalog.equals(generate_catalog(2000, seed=4))
+    assert not catalog['total_sales_price'].equals(generate_catalog(2000, seed=5)['total_sales_price'])
+
+    path = tmp_path / 'diamonds.csv'
+    write_catalog(path, 2000, seed=4)
+    written = pd.read_csv(path)
+    assert written['stock_id'].tolist() == catalog['stock_id'].tolist()
+    assert written['carat_weight'].tolist() == catalog['carat_weight'].tolist()
+
+
+def test_orders_sell_each_stone_once(tmp_path, monkeypatch):
+    """Test the order history layout and that it matches the catalog it was drawn from."""
+    monkeypatch.setattr(synthetic_data, 'BLOCK_ROWS', 700)
+    catalog = generate_catalog(2000, seed=4)
+    orders = generate_orders(catalog, 300, seed=4)
+    assert list(orders.columns) == ORDER_COLUMNS
+    assert len(orders) == 300 and orders['stock_id'].is_unique
+    assert orders['stock_id'].isin(catalog['stock_id']).all()
+
+    path = tmp_path / 'order_details.csv'
+    write_orders(path, 2000, 300, seed=4)
+    assert pd.read_csv(path)['stock_id'].tolist() == orders['stock_id'].tolist()